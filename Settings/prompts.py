@@ -1,4 +1,40 @@
+from functools import lru_cache
+
 from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import RunnablePassthrough
+
+# =========================
+# Prefijo estático + cola dinámica
+# =========================
+# Los prompts de agentes se mandan como: texto ESTÁTICO (instrucciones +
+# {avatar_style}, igual en cada llamada del mismo agente/avatar/modo) →
+# historial → contexto DINÁMICO (hora, perfil, práctica). Entre turnos solo
+# el prefijo estático es idéntico siempre: la ventana de historial
+# (helpers/history_window.py) descarta turnos viejos y antepone un resumen
+# que cambia, y evict_tool_outputs reescribe ToolMessages ya enviados. El
+# contexto va al final para que, mientras la ventana no se mueva (p. ej.
+# entre llamadas del mismo turno con tools), el historial también se reúse.
+_STATIC_PROMPTS = {}
+
+
+@lru_cache(maxsize=256)
+def render_static_prefix(agent: str, avatar_style: str) -> str:
+    """Parte estática ya renderizada por (agente, estilo de avatar/modo)."""
+    return _STATIC_PROMPTS[agent].format(avatar_style=avatar_style)
+
+
+def agent_prompt(agent: str, static_text: str, context_text: str):
+    """Runnable (State → mensajes) con el prefijo estático cacheado."""
+    _STATIC_PROMPTS[agent] = static_text
+    template = ChatPromptTemplate.from_messages([
+        ("system", "{static_prefix}"),
+        ("placeholder", "{messages}"),
+        ("system", context_text),
+    ])
+    return RunnablePassthrough.assign(
+        static_prefix=lambda state: render_static_prefix(agent, state.get("avatar_style") or "")
+    ) | template
+
 
 # =========================
 # Nodo de identificación de usuario
@@ -61,8 +97,7 @@ identification_prompt = ChatPromptTemplate.from_messages([
 # =========================
 # Router avanzado
 # =========================
-agent_route_prompt = ChatPromptTemplate.from_messages([
-    ("system",
+ROUTER_STATIC = (
      "Eres el ROUTER inteligente del sistema Fredie.\n\n"
      
      "=== INSTRUCCIÓN CRÍTICA ===\n"
@@ -73,11 +108,6 @@ agent_route_prompt = ChatPromptTemplate.from_messages([
      "• ToAgentIndustrial\n\n"
      "⛔ PROHIBIDO: Texto en lenguaje natural, múltiples llamadas o explicaciones\n\n"
 
-     "=== CONTEXTO DISPONIBLE ===\n"
-     "• Historial completo: `messages` (ÚSALO para contexto)\n"
-     "• Perfil: {profile_summary}\n"
-     "• Timestamp: {now_human} (Local: {now_local}, TZ: {tz})\n\n"
-
      "=== MATRIZ DE DECISIÓN ===\n\n"
      
      "📚 ToAgentEducation:\n"
@@ -129,27 +159,28 @@ agent_route_prompt = ChatPromptTemplate.from_messages([
      "2. ¿Qué contexto aporta el historial?\n"
      "3. ¿Qué tipo de expertise se necesita?\n"
      "4. ¿Hay palabras clave que indiquen un dominio específico?"
-    ),
-    ("placeholder", "{messages}")
-])
+)
+
+ROUTER_CONTEXT = (
+     "=== CONTEXTO DISPONIBLE ===\n"
+     "• Historial completo: `messages` (ÚSALO para contexto)\n"
+     "• Perfil: {profile_summary}\n"
+     "• Timestamp: {now_human} (Local: {now_local}, TZ: {tz})"
+)
+
+agent_route_prompt = agent_prompt("router", ROUTER_STATIC, ROUTER_CONTEXT)
 
 
 # =========================
 # Agente GENERAL
 # =========================
-general_prompt = ChatPromptTemplate.from_messages([
-    ("system",
+GENERAL_STATIC = (
      "Eres Fredie en modo GENERAL, coordinador del ecosistema.\n\n"
      
      "=== PERSONALIDAD ===\n"
      "{avatar_style}\n"
      "☝️ Este estilo define tu tono, pero NUNCA compromete precisión\n\n"
 
-     "=== CONTEXTO ===\n"
-     "• Timestamp: {now_human}\n"
-     "• Local: {now_local}\n"
-     "• Zona horaria: {tz}\n"
-     "• Perfil usuario: {profile_summary}\n\n"
 
      "=== TU ROL ===\n"
      "Eres la memoria central y punto de coordinación:\n"
@@ -160,6 +191,7 @@ general_prompt = ChatPromptTemplate.from_messages([
 
      "=== MEMORIA DE SESIÓN ===\n"
      "• Accedes a TODO el historial en `messages`\n"
+     "• Un resultado de tool como TOOL_REF::... ya se usó; si necesitas su detalle, recall_tool_output(ref)\n"
      "• NUNCA digas \"no recuerdo\" para información de ESTA sesión\n"
      "• Referencia conversaciones previas naturalmente\n"
      "• Solo menciona límites de memoria si el usuario pregunta por sesiones pasadas\n\n"
@@ -188,25 +220,28 @@ general_prompt = ChatPromptTemplate.from_messages([
      "✗ No repitas información ya dicha\n"
      "✗ No hables de tus capacidades técnicas\n"
      "✗ No menciones \"RAG\", \"tools\" o jerga interna"
-    ),
-    ("placeholder", "{messages}")
-])
+)
+
+GENERAL_CONTEXT = (
+     "=== CONTEXTO ===\n"
+     "• Timestamp: {now_human}\n"
+     "• Local: {now_local}\n"
+     "• Zona horaria: {tz}\n"
+     "• Perfil usuario: {profile_summary}"
+)
+
+general_prompt = agent_prompt("general", GENERAL_STATIC, GENERAL_CONTEXT)
 
 
 # =========================
 # Agente EDUCATION
 # =========================
-education_prompt = ChatPromptTemplate.from_messages([
-    ("system",
+EDUCATION_STATIC = (
      "Eres Fredie en modo EDUCATIVO, especializado en pedagogía.\n\n"
      
      "=== PERSONALIDAD ===\n"
      "{avatar_style}\n\n"
 
-     "=== CONTEXTO ===\n"
-     "• Timestamp: {now_human} | Local: {now_local} | TZ: {tz}\n"
-     "• Perfil estudiante: {profile_summary}\n"
-     "• Tipo de chat: {chat_type}\n\n"
 
      "═══════════════════════════════════════════════════════════════════\n"
      "              🎯 MODO: PRÁCTICA GUIADA\n"
@@ -221,6 +256,8 @@ education_prompt = ChatPromptTemplate.from_messages([
      "• Conecta teoría con aplicación práctica\n\n"
 
      "HERRAMIENTAS DISPONIBLES:\n"
+     "(PROGRESO DE PRÁCTICA ya trae la práctica y el paso actuales con sus ids;\n"
+     " usa estas herramientas solo si necesitas algo que no aparece ahí)\n"
      "┌─ get_project_tasks()\n"
      "│  └─ Úsala para ubicar qué prácticas existen en el proyecto\n"
      "│\n"
@@ -238,7 +275,7 @@ education_prompt = ChatPromptTemplate.from_messages([
      "FLUJO DIDÁCTICO POR PASO:\n\n"
      
      "┌─ PASO 1: CONTEXTUALIZACIÓN\n"
-     "│  • Si no tienes claridad del paso actual → get_task_steps()\n"
+     "│  • Ubica el paso actual en PROGRESO DE PRÁCTICA; si no basta → get_task_steps()\n"
      "│  • Identifica el objetivo del paso en el contexto global\n"
      "│  • Anuncia claramente: \"Ahora trabajaremos el PASO X: [título del paso]\"\n"
      "│\n"
@@ -313,7 +350,8 @@ education_prompt = ChatPromptTemplate.from_messages([
 
      "HERRAMIENTAS OPCIONALES:\n"
      "• web_research → Solo para info actualizada o específica\n"
-     "• retrieve_context → Para búsqueda en base de conocimiento\n"
+     "• web_research_multi → Si necesitas varias búsquedas del mismo tema, en UNA llamada\n"
+     "• retrieve_context → Para búsqueda en base de conocimiento y en la memoria de sesiones anteriores del estudiante\n"
      "• get_student_profile → Si necesitas adaptar más al estudiante\n\n"
 
      "═══════════════════════════════════════════════════════════════════\n"
@@ -324,6 +362,7 @@ education_prompt = ChatPromptTemplate.from_messages([
      "• Usa TODO el historial en `messages`\n"
      "• Referencia aprendizajes previos de la sesión\n"
      "• NUNCA digas \"no recuerdo\" para info de esta sesión\n"
+     "• Un resultado de tool como TOOL_REF::... ya se usó; si necesitas su detalle, recall_tool_output(ref)\n"
      "• Construye sobre lo ya explicado\n\n"
 
      "ESTILO DE COMUNICACIÓN:\n"
@@ -345,25 +384,31 @@ education_prompt = ChatPromptTemplate.from_messages([
      "├─ Está frustrado → Valida su esfuerzo, replantea el enfoque\n"
      "├─ Responde monosílabos → Haz preguntas más específicas\n"
      "└─ Avanza muy rápido → Profundiza con preguntas de nivel superior"
-    ),
-    ("placeholder", "{messages}")
-])
+)
+
+EDUCATION_CONTEXT = (
+     "=== CONTEXTO ===\n"
+     "• Timestamp: {now_human} | Local: {now_local} | TZ: {tz}\n"
+     "• Perfil estudiante: {profile_summary}\n"
+     "• Tipo de chat: {chat_type}\n\n"
+
+     "=== PROGRESO DE PRÁCTICA ===\n"
+     "{practice_context}"
+)
+
+education_prompt = agent_prompt("education", EDUCATION_STATIC, EDUCATION_CONTEXT)
 
 
 # =========================
 # Agente LAB
 # =========================
-lab_prompt = ChatPromptTemplate.from_messages([
-    ("system",
+LAB_STATIC = (
      "Eres Fredie en modo LABORATORIO, especialista en hardware educativo.\n\n"
      
      "=== PERSONALIDAD ===\n"
      "{avatar_style}\n"
      "Hablas como técnico de laboratorio: directo, práctico, orientado a soluciones.\n\n"
 
-     "=== CONTEXTO ===\n"
-     "• Timestamp: {now_human} | Local: {now_local} | TZ: {tz}\n"
-     "• Perfil usuario: {profile_summary}\n\n"
 
      "=== TU ESPECIALIDAD ===\n"
      "Experto en:\n"
@@ -466,25 +511,27 @@ lab_prompt = ChatPromptTemplate.from_messages([
      "• Protocolos de laboratorio\n\n"
 
      "Tu objetivo: Que el equipo funcione, no solo explicar por qué falló."
-    ),
-    ("placeholder", "{messages}")
-])
+)
+
+LAB_CONTEXT = (
+     "=== CONTEXTO ===\n"
+     "• Timestamp: {now_human} | Local: {now_local} | TZ: {tz}\n"
+     "• Perfil usuario: {profile_summary}"
+)
+
+lab_prompt = agent_prompt("lab", LAB_STATIC, LAB_CONTEXT)
 
 
 # =========================
 # Agente INDUSTRIAL
 # =========================
-industrial_prompt = ChatPromptTemplate.from_messages([
-    ("system",
+INDUSTRIAL_STATIC = (
      "Eres Fredie en modo INDUSTRIAL, especialista en automatización y manufactura.\n\n"
      
      "=== PERSONALIDAD ===\n"
      "{avatar_style}\n"
      "Hablas como ingeniero de planta: seguridad primero, eficiencia después.\n\n"
 
-     "=== CONTEXTO ===\n"
-     "• Timestamp: {now_human} | Local: {now_local} | TZ: {tz}\n"
-     "• Perfil usuario: {profile_summary}\n\n"
 
      "=== TU DOMINIO DE EXPERTISE ===\n"
      "Especialista en:\n"
@@ -646,6 +693,7 @@ industrial_prompt = ChatPromptTemplate.from_messages([
      "=== GESTIÓN DE HERRAMIENTAS ===\n"
      "• retrieve_robot_support → Para troubleshooting de equipos\n"
      "• web_research → Para normativas, datasheets, updates de firmware\n"
+     "• web_research_multi → Varias sub-consultas (p. ej. norma + datasheet) en una sola llamada\n"
      "• route_to('education') → Si necesita fundamentos teóricos\n"
      "• route_to('lab') → Si es equipo educativo, no industrial\n\n"
 
@@ -672,6 +720,12 @@ industrial_prompt = ChatPromptTemplate.from_messages([
      "• Wonderware System Platform\n\n"
 
      "Tu objetivo: Soluciones industriales SEGURAS, eficientes y estándar."
-    ),
-    ("placeholder", "{messages}")
-])
+)
+
+INDUSTRIAL_CONTEXT = (
+     "=== CONTEXTO ===\n"
+     "• Timestamp: {now_human} | Local: {now_local} | TZ: {tz}\n"
+     "• Perfil usuario: {profile_summary}"
+)
+
+industrial_prompt = agent_prompt("industrial", INDUSTRIAL_STATIC, INDUSTRIAL_CONTEXT)
@@ -38,7 +38,12 @@ class State(TypedDict, total=False):
     current_task_id: Optional[str]    # project_tasks.id
     current_step_number: Optional[int]
     practice_completed: Optional[bool]
+    practice_context: Optional[str]   # resumen del avance (helpers/practice.py)
     # ================================================
+    # Ventana de historial (helpers/history_window.py)
+    history_summary: Optional[str]
+    history_summary_upto: Optional[str]
+    history_stats: Optional[List[dict]]
 
 class SupervisorOutput(BaseModel):
     next_node: IntentType
@@ -2,24 +2,41 @@
 # Tools unificados
 
 import os
-from typing import Dict,List, Optional, Literal, Union
+import re
+import csv
+import json
+import asyncio
+import hashlib
+from typing import Dict,List, Optional, Literal, Tuple, Union
 from uuid import UUID, uuid4, uuid5, NAMESPACE_DNS, NAMESPACE_URL
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
 from datetime import date, datetime, timezone
 from zoneinfo import ZoneInfo
 
 from dotenv import load_dotenv
-from langchain_core.tools import tool
+from langchain_core.runnables import RunnableConfig
+from langchain_core.tools import StructuredTool, tool
 from langchain_core.documents import Document
-from pydantic.v1 import BaseModel, Field, conint
-from supabase import create_client, Client
+from pydantic.v1 import BaseModel, Field, conint, conlist
 from tavily import TavilyClient
 from langchain_openai import ChatOpenAI
 
 from rag.rag_logic import (
     create_or_update_vectorstore,
-    general_chat_db_use,
+    document_id,
     general_student_db_use,
+    index_chat_summary,
+    search_student_memory,
 )
+from rag.documents import robot_support_document
+from rag.db_access import db
+from rag.search import semantic_search
+from helpers.jobs import register_job, runner as job_runner
+from helpers.name_index import name_contains, normalize_name
+from helpers.summarizer import count_tokens
+from helpers.practice import progress_cache, project_trees, step_fields, task_fields
+from helpers.tool_store import tool_outputs
+from helpers.web_cache import web_cache
 from Settings.state import State  # solo para tipado opcional
 
 
@@ -32,8 +49,6 @@ timestamp_iso = now_mty.isoformat()
 # ------------------- CONFIGURACIÓN -------------------
 load_dotenv()
 
-SB: Client = create_client(os.environ["SUPABASE_URL"], os.environ["SUPABASE_KEY"])
-
 _TAVILY_KEY = os.getenv("TAVILY_API_KEY")
 _tavily: Optional[TavilyClient] = TavilyClient(api_key=_TAVILY_KEY) if _TAVILY_KEY else None
 _QT_LLM = ChatOpenAI(
@@ -41,6 +56,15 @@ _QT_LLM = ChatOpenAI(
     temperature=0
 )
 
+# web_research_multi: búsquedas a la vez y presupuesto del contexto empacado
+WEB_MULTI_CONCURRENCY = int(os.getenv("WEB_MULTI_CONCURRENCY", "3"))
+WEB_MULTI_TOKEN_BUDGET = int(os.getenv("WEB_MULTI_TOKEN_BUDGET", "1200"))
+
+# identify_user_from_message: candidatos que se buscan en una sola consulta
+_EMAIL_RE = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+")
+_NAME_STRIP = ".,;:!?¿¡()[]{}\"'"
+MAX_NAME_CANDIDATES = 8
+
 class WebResearchInput(BaseModel):
     query: str = Field(..., description="Pregunta o tema a investigar")
     depth: Literal["basic", "advanced"] = Field(
@@ -52,30 +76,68 @@ class WebResearchInput(BaseModel):
     )
 
 
+class WebResearchMultiInput(BaseModel):
+    queries: conlist(str, min_items=1, max_items=6) = Field(
+        ...,
+        description="Sub-consultas (reformulaciones o aspectos distintos) del mismo tema",
+    )
+    depth: Literal["basic", "advanced"] = Field(
+        "basic", description="Profundidad de búsqueda"
+    )
+    max_results: conint(ge=1, le=10) = 4
+    time_filter: Optional[Literal["d", "w", "m", "y"]] = Field(
+        None, description="Ventana temporal: d=día, w=semana, m=mes, y=año"
+    )
+
+
 # ====================================================
 # HELPERS
 # ====================================================
-def _fetch_student(name_or_email: str):
-    """Busca un estudiante por email o nombre parcial en Supabase. Regresa dict o None."""
-    q = name_or_email.strip()
-    if "@" in q:
-        res = (
-            SB.table("students")
-            .select("*")
-            .eq("email", q)
-            .limit(1)
-            .execute()
-        )
-    else:
-        res = (
-            SB.table("students")
-            .select("*")
-            .ilike("full_name", f"%{q}%")
-            .limit(1)
-            .execute()
-        )
-    rows = res.data or []
-    return rows[0] if rows else None
+# Alias histórico: agent/graph.py lo importa de aquí
+_fetch_student = db.fetch_student
+
+def _identity_candidates(message: str) -> Tuple[List[str], List[str]]:
+    """
+    Emails y posibles nombres (pares de palabras con mayúscula inicial) de un
+    mensaje, en orden de aparición y sin repetir.
+    """
+    emails = list(dict.fromkeys(_EMAIL_RE.findall(message or "")))
+    raw = (message or "").split()
+    names = []
+    for left, right in zip(raw, raw[1:]):
+        # Un nombre no cruza puntuación ni correos
+        if "@" in left or "@" in right or left[-1] in _NAME_STRIP:
+            continue
+        first, second = left.strip(_NAME_STRIP), right.strip(_NAME_STRIP)
+        if (
+            first[:1].isupper()
+            and second[:1].isupper()
+            and first.replace("-", "").isalpha()
+            and second.replace("-", "").isalpha()
+        ):
+            names.append(f"{first} {second}")
+    return emails, list(dict.fromkeys(names))[:MAX_NAME_CANDIDATES]
+
+
+def _pick_identity(
+    rows: List[dict], emails: List[str], names: List[str]
+) -> Optional[dict]:
+    """
+    Misma prioridad que antes: primer email con match, luego primer nombre.
+    El índice de trigramas solo ordena los candidatos; un nombre cuenta como
+    identidad únicamente si está contenido en full_name (name_contains), así
+    "Hola Ana" no resuelve a "Ana Holguín".
+    """
+    by_email = {(r.get("email") or "").lower(): r for r in rows}
+    for email in emails:
+        if email.lower() in by_email:
+            return by_email[email.lower()]
+    for name in names:
+        for r in rows:
+            if name_contains(r.get("full_name") or "", name):
+                return r
+    return None
+
 
 def _transform_query_for_rag(raw_query: str, student_row: Optional[Dict] = None) -> str:
     """
@@ -121,17 +183,10 @@ Devuelve UNA sola consulta mejorada en una línea, sin explicaciones extra.
 def _semantic_search(vs, query: str, k: int = 3):
     """
     Búsqueda semántica explícita con MMR (diversidad).
-    Internamente Chroma embebe el query y compara contra el índice.
+    Ver rag.search.semantic_search (también la usa el benchmark de RAG).
     """
-    retriever = vs.as_retriever(
-        search_type="mmr",           # en lugar de similarity simple
-        search_kwargs={
-            "k": k,                  # docs finales
-            "fetch_k": max(8, 2 * k) # docs candidatos
-        },
-    )
-    return retriever.invoke(query)
-    
+    return semantic_search(vs, query, k=k)
+
 def _normalize_session_id(session_id: Union[int, str, UUID]) -> str:
     """
     Normaliza cualquier session_id recibido a un UUID string válido.
@@ -193,26 +248,19 @@ def _submit_chat_history(
             session_payload["user_id"] = user_id
 
         try:
-            SB.table("chat_session").upsert(
-                session_payload,
-                on_conflict="id",
-            ).execute()
+            db.upsert_session(session_payload)
         except Exception as e:
             print("[_submit_chat_history] ERROR upsert chat_session:", e)
 
         # --- 2) Insertar el mensaje ---
         try:
-            return (
-                SB.table("chat_message")
-                .insert(
-                    {
-                        "session_id": session_id,
-                        "role": role,
-                        "content": content,
-                        "created_at": created_at,
-                    }
-                )
-                .execute()
+            return db.insert_message(
+                {
+                    "session_id": session_id,
+                    "role": role,
+                    "content": content,
+                    "created_at": created_at,
+                }
             )
         except Exception as e:
             print("[_submit_chat_history] ERROR insert chat_message:", e)
@@ -243,7 +291,7 @@ def _submit_student(
         last_seen = datetime.now(ZoneInfo("America/Monterrey")).isoformat()
 
     try:
-        SB.table("students").upsert(
+        db.upsert_student(
             {
                 "full_name": full_name,
                 "email": email,
@@ -254,118 +302,56 @@ def _submit_student(
                 "interests": interests,
                 "last_seen": last_seen,
                 "learning_style": learning_style,
-            },
-            on_conflict="email",
-        ).execute()
+            }
+        )
     except Exception as e:
         print("Error saving student profile:", e)
         raise
 
 
-def _summarize_all_chats() -> dict:
+def _fetch_session_emails(session_ids: List[str]) -> Dict[str, str]:
+    """Mapa session_id → user_email de chat_session (una consulta por lote)."""
+    try:
+        return db.fetch_session_emails(session_ids)
+    except Exception as e:
+        print("[_fetch_session_emails] error:", e)
+        return {}
+
+
+def _summarize_all_chats(
+    dry_run: bool = False, resume: bool = True, should_stop=None
+) -> dict:
     """
     Proceso batch: resume todas las sesiones y guarda en chat_summary.
+    Ver helpers/summary_job.py (lectura en streaming, workers LLM concurrentes,
+    checkpoint para retomar y borrado por lotes).
     """
-    stats = {
-        "total_sessions": 0,
-        "successful": 0,
-        "failed": 0,
-        "session_ids": [],
-    }
-
-    try:
-        response = (
-            SB.table("chat_message")
-            .select("*")
-            .order("session_id")
-            .order("created_at")
-            .execute()
-        )
+    from helpers.summary_job import run_summary_job
 
-        all_messages = response.data or []
-        if not all_messages:
-            print("No messages to process")
-            return stats
-
-        sessions_messages = {}
-        for msg in all_messages:
-            session_id = msg.get("session_id")
-            if session_id:
-                sessions_messages.setdefault(session_id, []).append(msg)
-
-        stats["total_sessions"] = len(sessions_messages)
-        print(f"Processing {stats['total_sessions']} sessions...")
-
-        llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
-
-        for session_id, messages in sessions_messages.items():
-            try:
-                conversation_text = []
-                for msg in messages:
-                    role = msg.get("role", "unknown")
-                    content = msg.get("content", "")
-                    conversation_text.append(f"{role.upper()}: {content}")
-
-                full_conversation = "\n\n".join(conversation_text)
-
-                summary_prompt = f"""Genera un resumen conciso de la siguiente conversación entre un estudiante y un agente educativo.
-El resumen debe capturar:
-- Los temas principales discutidos
-- Las preguntas clave del estudiante
-- Las soluciones o respuestas proporcionadas
-- Cualquier acción o tarea acordada
-
-Conversación:
-{full_conversation}
-
-Resumen en JSON:"""
-
-                summary_response = llm.invoke(summary_prompt)
-                summary_json = summary_response.content
-
-                SB.table("chat_summary").upsert(
-                    {
-                        "session_id": session_id,
-                        "summary_json": summary_json,
-                        "updated_at": now_mty,
-                    },
-                    on_conflict="session_id",
-                ).execute()
-
-                stats["successful"] += 1
-                stats["session_ids"].append(session_id)
-                print(f"Summary created for session {session_id}")
-
-            except Exception as e:
-                stats["failed"] += 1
-                print(f"Error summarizing session {session_id}:", e)
-
-        print(
-            f"Completed: {stats['successful']}/{stats['total_sessions']}."
-        )
+    return run_summary_job(dry_run=dry_run, resume=resume, should_stop=should_stop)
 
-        if stats["successful"] > 0:
-            try:
-                print(
-                    f"Deleting messages for {stats['successful']} sessions..."
-                )
-                for session_id in stats["session_ids"]:
-                    (
-                        SB.table("chat_message")
-                        .delete()
-                        .eq("session_id", session_id)
-                        .execute()
-                    )
-                    print(f"Deleted messages for session {session_id}")
-                print("All messages deleted for summarized sessions.")
-            except Exception as e:
-                print("Error deleting messages:", e)
-
-        return stats
 
-    except Exception as e:
-        print("Fatal error in _summarize_all_chats:", e)
-        return stats
+def _backfill_student_memory(page_size: int = 500, should_stop=None) -> int:
+    """
+    Indexa en la memoria de estudiantes los resúmenes que ya existían en
+    chat_summary antes de que se embebieran al escribirse. Idempotente.
+    """
+    indexed = 0
+    for rows in db.iter_summary_pages(page_size):
+        if should_stop and should_stop():
+            break
+        emails = _fetch_session_emails([r["session_id"] for r in rows])
+        for r in rows:
+            summary = r.get("summary_json")
+            if not summary:
+                continue
+            # Estructurado o texto libre (resúmenes previos al esquema)
+            index_chat_summary(
+                r["session_id"], emails.get(r["session_id"]), summary, r.get("updated_at")
+            )
+            indexed += 1
+    print(f"[_backfill_student_memory] {indexed} resúmenes encolados")
+    return indexed
 
 
 def _summarize(snippets: List[dict], limit: int = 5) -> str:
@@ -381,42 +367,122 @@ def _summarize(snippets: List[dict], limit: int = 5) -> str:
     return "\n\n".join(parts)
 
 
+def _canonical_url(url: str) -> str:
+    """Sin fragmento, utm_*, 'www.' ni '/' final: la misma página cuenta una vez."""
+    parts = urlsplit((url or "").strip())
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    query = urlencode(
+        [(k, v) for k, v in parse_qsl(parts.query) if not k.lower().startswith("utm_")]
+    )
+    return urlunsplit(("", host, parts.path.rstrip("/"), query, ""))
+
+
+def _content_hash(content: str) -> str:
+    """Hash del texto normalizado (mismo artículo replicado en varios sitios)."""
+    return hashlib.sha1(normalize_name(content or "")[:500].encode("utf-8")).hexdigest()
+
+
+def _dedupe_results(results: List[dict]) -> List[dict]:
+    """Une resultados de varias búsquedas: sin URLs ni contenidos repetidos, mejor score primero."""
+    ranked = sorted(results, key=lambda r: -(r.get("score") or 0.0))
+    seen_urls, seen_hashes, unique = set(), set(), []
+    for r in ranked:
+        url = _canonical_url(r.get("url") or "")
+        digest = _content_hash(r.get("content") or "")
+        if (url and url in seen_urls) or digest in seen_hashes:
+            continue
+        seen_urls.add(url)
+        seen_hashes.add(digest)
+        unique.append(r)
+    return unique
+
+
+def _pack_results(results: List[dict], token_budget: int) -> Tuple[str, int]:
+    """El mayor prefijo de resultados cuyo _summarize cabe en token_budget."""
+    packed, used = "", 0
+    for n in range(1, len(results) + 1):
+        candidate = _summarize(results, limit=n)
+        if count_tokens(candidate) > token_budget:
+            break
+        packed, used = candidate, n
+    return packed, used
+
+
 def _build_robot_support_docs() -> List[Document]:
     """
     Construye Document(s) a partir de la tabla RoboSupportDB para vectorizarla
     (RAG de problemas de robots) con un estilo narrativo/humano.
     """
-    res = (
-        SB.table("RoboSupportDB")
-        .select(
-            "created_at, robot_type, problem_title, problem_description, solution_steps, author"
-        )
-        .execute()
+    return [robot_support_document(r) for r in db.list_robot_support()]
+
+
+# ====================================================
+# Trabajos en segundo plano (helpers/jobs.py)
+# ====================================================
+INGEST_BATCH = int(os.getenv("INGEST_BATCH", "200"))
+INGEST_DIRS = ("uploads",)
+INGEST_DEFAULT_CSV = "robot_problems.csv"
+
+
+def _ingest_documents(collection_name: str, docs: List[Document], ctx) -> dict:
+    """Indexa documentos por lotes, revisando la cancelación entre lotes."""
+    done = 0
+    for i in range(0, len(docs), INGEST_BATCH):
+        if ctx.cancelled():
+            break
+        batch = docs[i:i + INGEST_BATCH]
+        create_or_update_vectorstore(collection_name, batch, len(batch))
+        done += len(batch)
+    return {"collection": collection_name, "docs": done, "total": len(docs)}
+
+
+def _resolve_ingest_path(path: Optional[str]) -> str:
+    """Solo se ingieren archivos subidos (uploads/) o el CSV del repo."""
+    if not path:
+        return INGEST_DEFAULT_CSV
+    real = os.path.realpath(path)
+    allowed = [os.path.realpath(d) for d in INGEST_DIRS]
+    if real == os.path.realpath(INGEST_DEFAULT_CSV) or any(
+        real.startswith(d + os.sep) for d in allowed
+    ):
+        return real
+    raise ValueError(f"Ruta no permitida para ingesta: {path}")
+
+
+@register_job("chat_summary", singleton=True)
+def _chat_summary_job(params: dict, ctx) -> dict:
+    return _summarize_all_chats(
+        dry_run=bool(params.get("dry_run")),
+        resume=params.get("resume", True),
+        should_stop=ctx.cancelled,
     )
-    rows = res.data or []
-    docs: List[Document] = []
-
-    for r in rows:
-        robot = r.get("robot_type") or "el robot"
-        title = r.get("problem_title") or "problema sin título"
-        desc = r.get("problem_description") or "Sin descripción detallada."
-        steps = r.get("solution_steps") or "Sin pasos registrados."
-        author = r.get("author") or "otro integrante del laboratorio"
-
-        content = (
-            f"Problema registrado para el robot {robot}: {title}.\n"
-            f"Descripción del problema: {desc}\n\n"
-            f"Según {author}, los pasos recomendados para resolverlo fueron:\n"
-            f"{steps}"
-        )
-        metadata = {
-            "created_at": r.get("created_at"),
-            "robot_type": robot,
-            "problem_title": title,
-            "author": author,
-        }
-        docs.append(Document(page_content=content, metadata=metadata))
-    return docs
+
+
+@register_job("memory_backfill", singleton=True)
+def _memory_backfill_job(params: dict, ctx) -> dict:
+    indexed = _backfill_student_memory(
+        page_size=int(params.get("page_size", 500)), should_stop=ctx.cancelled
+    )
+    return {"indexed": indexed}
+
+
+@register_job("robot_support_reindex", singleton=True)
+def _robot_support_reindex_job(params: dict, ctx) -> dict:
+    """Re-sincroniza la colección robot_support con RoboSupportDB."""
+    return _ingest_documents("robot_support", _build_robot_support_docs(), ctx)
+
+
+@register_job("robot_support_ingest")
+def _robot_support_ingest_job(params: dict, ctx) -> dict:
+    """Ingesta masiva de un CSV con el esquema de robot_problems.csv."""
+    path = _resolve_ingest_path(params.get("path"))
+    with open(path, newline="", encoding="utf-8") as f:
+        docs = [robot_support_document(r) for r in csv.DictReader(f)]
+    result = _ingest_documents("robot_support", docs, ctx)
+    result["path"] = path
+    return result
 
 
 # ====================================================
@@ -424,22 +490,17 @@ def _build_robot_support_docs() -> List[Document]:
 # ====================================================
 
 # ---- Tool: Investigación Web (Tavily) como RAG web ----
-@tool("web_research", args_schema=WebResearchInput)
-def web_research(
+def _tavily_context(
     query: str,
-    depth: str = "advanced",
-    max_results: int = 5,
-    time_filter: Optional[str] = None,
+    depth: str,
+    max_results: int,
+    time_filter: Optional[str],
 ) -> str:
-    """
-    Consulta la web usando Tavily y devuelve CONTEXTO para el agente, no una respuesta directa.
-    El agente debe usar este contexto para responder de forma humana.
-    """
+    """Una búsqueda en Tavily compactada al formato WEB_CONTEXT."""
     if _tavily is None:
         return "WEB_CONTEXT::ERROR::Falta TAVILY_API_KEY en el entorno."
 
     try:
-        max_results = max(1, min(10, int(max_results)))
         kwargs = dict(
             query=query,
             search_depth=depth,
@@ -474,6 +535,121 @@ def web_research(
         return f"WEB_CONTEXT::ERROR::{type(e).__name__}::{e}"
 
 
+def _tavily_results(
+    query: str,
+    depth: str,
+    max_results: int,
+    time_filter: Optional[str],
+) -> str:
+    """Resultados crudos de una búsqueda (JSON) para web_research_multi."""
+    kwargs = dict(query=query, search_depth=depth, max_results=max_results)
+    if time_filter:
+        kwargs["time_range"] = time_filter
+    res = _tavily.search(**kwargs)
+    return json.dumps(
+        {"answer": res.get("answer") or "", "results": res.get("results") or []},
+        ensure_ascii=False,
+    )
+
+
+@tool("web_research", args_schema=WebResearchInput)
+def web_research(
+    query: str,
+    depth: str = "advanced",
+    max_results: int = 5,
+    time_filter: Optional[str] = None,
+) -> str:
+    """
+    Consulta la web usando Tavily y devuelve CONTEXTO para el agente, no una respuesta directa.
+    El agente debe usar este contexto para responder de forma humana.
+    """
+    if _tavily is None:
+        return "WEB_CONTEXT::ERROR::Falta TAVILY_API_KEY en el entorno."
+
+    max_results = max(1, min(10, int(max_results)))
+    # Preguntas repetidas (o casi) entre estudiantes salen del caché
+    return web_cache.get_or_fetch(
+        query,
+        depth,
+        max_results,
+        time_filter,
+        lambda: _tavily_context(query, depth, max_results, time_filter),
+    )
+
+
+async def _aweb_research_multi(
+    queries: List[str],
+    depth: str = "basic",
+    max_results: int = 4,
+    time_filter: Optional[str] = None,
+) -> str:
+    """Sub-consultas concurrentes → un WEB_CONTEXT deduplicado dentro del presupuesto."""
+    if _tavily is None:
+        return "WEB_CONTEXT::ERROR::Falta TAVILY_API_KEY en el entorno."
+
+    max_results = max(1, min(10, int(max_results)))
+    unique_queries = list(dict.fromkeys(q.strip() for q in queries if q and q.strip()))
+    # TavilyClient es síncrono: cada búsqueda va a un hilo, con tope de concurrencia
+    semaphore = asyncio.Semaphore(max(1, WEB_MULTI_CONCURRENCY))
+
+    async def _one(q: str) -> dict:
+        async with semaphore:
+            payload = await asyncio.to_thread(
+                web_cache.get_or_fetch,
+                q,
+                depth,
+                max_results,
+                time_filter,
+                lambda: _tavily_results(q, depth, max_results, time_filter),
+                "results",
+            )
+        return json.loads(payload)
+
+    outcomes = await asyncio.gather(*(_one(q) for q in unique_queries), return_exceptions=True)
+
+    answers, results, failed = [], [], []
+    for q, out in zip(unique_queries, outcomes):
+        if isinstance(out, Exception):
+            failed.append(f"{q} ({type(out).__name__})")
+            continue
+        if out.get("answer"):
+            answers.append(out["answer"].replace("\n", " ").strip()[:300])
+        results.extend(out.get("results") or [])
+
+    if not results and failed:
+        return "WEB_CONTEXT::ERROR::" + "; ".join(failed)
+
+    unique = _dedupe_results(results)
+    header = (
+        "WEB_CONTEXT::\n"
+        f"CONSULTAS: {' | '.join(unique_queries)}\n"
+        f"RESPUESTA_SINTESIS: {' / '.join(answers[:2]) or 'Sin síntesis directa.'}\n"
+    )
+    if failed:
+        header += f"FALLARON: {'; '.join(failed)}\n"
+    body, used = _pack_results(unique, WEB_MULTI_TOKEN_BUDGET - count_tokens(header))
+    return (
+        header
+        + f"DETALLES ({used} de {len(unique)} fuentes únicas):\n"
+        + (body or "SIN_RESULTADOS_DETALLADOS")
+    )
+
+
+# Async en el grafo (ainvoke); la versión síncrona es para cached_tools_node,
+# que ejecuta las tools desde un hilo sin loop.
+web_research_multi = StructuredTool.from_function(
+    func=lambda **kwargs: asyncio.run(_aweb_research_multi(**kwargs)),
+    coroutine=_aweb_research_multi,
+    name="web_research_multi",
+    args_schema=WebResearchMultiInput,
+    description=(
+        "Investiga varias sub-consultas del mismo tema a la vez y devuelve UN "
+        "contexto web sin fuentes repetidas. Úsala en lugar de llamar "
+        "web_research varias veces con preguntas reformuladas."
+    ),
+)
+
+
 # ---- Tools de perfil/chat ----
 @tool
 def get_student_profile(name_or_email: str) -> str:
@@ -548,27 +724,17 @@ def identify_user_from_message(message: str) -> str:
     - 'FOUND:email:name' si lo encuentra
     - 'NOT_FOUND' si no hay match
     """
-    words = message.split()
-
-    for word in words:
-        if "@" in word:
-            clean_email = word.strip(".,;:!?")
-            row = _fetch_student(clean_email)
-            if row:
-                return f"FOUND:{row.get('email')}:{row.get('full_name')}"
-
-    for i in range(len(words) - 1):
-        if (
-            words[i]
-            and words[i][0].isupper()
-            and words[i + 1]
-            and words[i + 1][0].isupper()
-        ):
-            potential_name = f"{words[i]} {words[i+1]}"
-            row = _fetch_student(potential_name)
-            if row:
-                return f"FOUND:{row.get('email')}:{row.get('full_name')}"
-
+    emails, names = _identity_candidates(message)
+    if not emails and not names:
+        return "NOT_FOUND"
+    try:
+        rows = db.find_students(emails, names)
+    except Exception as e:
+        print("[identify_user_from_message] error:", e)
+        return "NOT_FOUND"
+    row = _pick_identity(rows, emails, names)
+    if row:
+        return f"FOUND:{row.get('email')}:{row.get('full_name')}"
     return "NOT_FOUND"
 
 
@@ -576,77 +742,75 @@ def identify_user_from_message(message: str) -> str:
 @tool
 def summarize_all_chats() -> str:
     """
-    Genera resúmenes para TODAS las sesiones de chat y devuelve estadísticas breves.
+    Encola la generación de resúmenes de TODAS las sesiones de chat como
+    trabajo en segundo plano y devuelve el id del trabajo.
     """
-    stats = _summarize_all_chats()
+    # Tipo singleton: si ya hay uno en cola o corriendo, regresa ese mismo
+    job_id = job_runner.enqueue("chat_summary")
     return (
-        f"Processed {stats['successful']}/{stats['total_sessions']} sessions. "
-        f"Failed: {stats['failed']}"
+        f"JOB_QUEUED::{job_id} El resumen de sesiones corre en segundo plano. "
+        f"Estado: GET /jobs/{job_id}"
     )
 
 
 @tool
 def update_student_goals(name_or_email: str, new_goal: str) -> str:
     """Agrega una meta al perfil (JSONB)."""
-    row = _fetch_student(name_or_email)
+    if not new_goal:
+        row = _fetch_student(name_or_email)
+        if not row:
+            return "PERFIL_NO_ENCONTRADO"
+        return f"OK: objetivos ahora = {row.get('goals') or []}"
+    # Append atómico en el servidor (sin leer el perfil antes)
+    row = db.append_student_goal(name_or_email, new_goal)
     if not row:
         return "PERFIL_NO_ENCONTRADO"
-    goals = row.get("goals") or []
-    if new_goal and new_goal not in goals:
-        goals.append(new_goal)
-        (
-            SB.table("students")
-            .update({"goals": goals})
-            .eq("id", row["id"])
-            .execute()
-        )
-    return f"OK: objetivos ahora = {goals}"
+    return f"OK: objetivos ahora = {row.get('goals') or []}"
 
 
 @tool
 def update_learning_style(name_or_email: str, style: str) -> str:
     """Actualiza preferencias de aprendizaje a partir de texto libre."""
-    row = _fetch_student(name_or_email)
-    if not row:
-        return "PERFIL_NO_ENCONTRADO"
     style_l = (style or "").lower()
-    ls = row.get("learning_style") or {}
+    patch = {}
     if "ejemplo" in style_l:
-        ls["prefers_examples"] = True
+        patch["prefers_examples"] = True
     if "visual" in style_l:
-        ls["prefers_visual"] = True
+        patch["prefers_visual"] = True
     if "paso" in style_l:
-        ls["prefers_step_by_step"] = True
+        patch["prefers_step_by_step"] = True
     if "teor" in style_l:
-        ls["prefers_theory"] = True
+        patch["prefers_theory"] = True
     if "práct" in style_l or "practic" in style_l:
-        ls["prefers_practice"] = True
-    ls["notes"] = style
-    (
-        SB.table("students")
-        .update({"learning_style": ls})
-        .eq("id", row["id"])
-        .execute()
-    )
-    return f"Estilo actualizado para {row['full_name']}: {ls}"
+        patch["prefers_practice"] = True
+    patch["notes"] = style
+    # Merge atómico en el servidor (sin leer el perfil antes)
+    row = db.merge_learning_style(name_or_email, patch)
+    if not row:
+        return "PERFIL_NO_ENCONTRADO"
+    return f"Estilo actualizado para {row['full_name']}: {row.get('learning_style') or {}}"
 
 
 # ---- Tool RAG (contexto por estudiante + chat) ----
-@tool
-def retrieve_context(name_or_email: str, chat_id: int, query: str) -> str:
+@tool(response_format="content_and_artifact")
+def retrieve_context(
+    name_or_email: str, query: str, days: Optional[int] = None
+) -> Tuple[str, dict]:
     """
-    Busca contexto relevante en la base vectorial asociada al ESTUDIANTE y al HISTORIAL DE CHAT,
-    y devuelve pasajes útiles para responder una consulta técnica.
-    Ahora:
+    Busca contexto relevante en la base vectorial asociada al ESTUDIANTE y en su
+    MEMORIA de sesiones pasadas (resúmenes de chats anteriores), y devuelve
+    pasajes útiles para responder una consulta técnica.
     - transforma la query según el perfil
-    - usa búsqueda semántica avanzada (MMR)
+    - usa búsqueda semántica avanzada (MMR) sobre el perfil
+    - busca en los resúmenes del estudiante (opcional: solo los últimos `days` días)
+    El artifact lleva los ids de documentos usados (para el caché entre turnos).
     """
-    print(f"RETRIEVE_CONTEXT: name={name_or_email}, chat_id={chat_id}, query={query}")
+    print(f"RETRIEVE_CONTEXT: name={name_or_email}, days={days}, query={query}")
 
     student_row = _fetch_student(name_or_email)
     if not student_row:
         print(f"Estudiante '{name_or_email}' no encontrado en DB")
-        return "RAG_EMPTY"
+        return "RAG_EMPTY", {"doc_ids": []}
 
     print(
         f"Estudiante encontrado: {student_row.get('full_name')} | "
@@ -657,12 +821,13 @@ def retrieve_context(name_or_email: str, chat_id: int, query: str) -> str:
     transformed_query = _transform_query_for_rag(query, student_row)
     print(f"RAG transformed_query = {transformed_query}")
 
-    # 2) Vectorstores (perfil + historial) y búsqueda semántica avanzada
+    # 2) Vectorstore de perfil y memoria del estudiante
     student_vectorstore = general_student_db_use(name_or_email)
     student_docs = _semantic_search(student_vectorstore, transformed_query, k=2)
 
-    chat_vectorstore = general_chat_db_use(chat_id)
-    chat_docs = _semantic_search(chat_vectorstore, transformed_query, k=2)
+    chat_docs = search_student_memory(
+        student_row.get("email") or "", transformed_query, k=2, since_days=days
+    )
 
     out: List[str] = []
     search_name = name_or_email.lower()
@@ -703,32 +868,33 @@ def retrieve_context(name_or_email: str, chat_id: int, query: str) -> str:
         else:
             print(f"Documento pertenece a {doc_name}, buscando {search_name}")
 
-    # Contexto desde vectorstore de chat
+    # Memoria: resúmenes de sesiones anteriores del estudiante
     for d in chat_docs:
         m = d.metadata or {}
         out.append(
-            f"{m.get('created_at')} | {m.get('robot_type')} | "
-            f"{m.get('problem_title')} | {m.get('author')}\n"
             f"[CHAT] {m.get('session_id')} | {m.get('updated_at')}\n"
             f"{d.page_content}\n"
         )
 
     result = "\n".join(out) if out else "RAG_EMPTY"
     print(f"{len(out)} documentos encontrados para {name_or_email}")
-    return result
+    doc_ids = [document_id("student_info", d) for d in student_docs] + [
+        document_id("chat_summary", d) for d in chat_docs
+    ]
+    return result, {"doc_ids": doc_ids}
 
 
 
 # ---- Tool RAG específico de RoboSupport ----
-@tool
-def retrieve_robot_support(query: str) -> str:
+@tool(response_format="content_and_artifact")
+def retrieve_robot_support(query: str) -> Tuple[str, dict]:
     """
     Busca problemas y soluciones en la base de datos de RoboSupportDB usando RAG.
     Devuelve contexto técnico en lenguaje natural para que el agente genere una respuesta humana.
     """
     docs = _build_robot_support_docs()
     if not docs:
-        return "RAG_EMPTY::No hay registros en RoboSupportDB."
+        return "RAG_EMPTY::No hay registros en RoboSupportDB.", {"doc_ids": []}
 
     vs = create_or_update_vectorstore("robot_support", docs, len(docs))
     hits = _semantic_search(vs, query, k=3)
@@ -736,7 +902,8 @@ def retrieve_robot_support(query: str) -> str:
 
     if not hits:
         return (
-            f"RAG_EMPTY::No encontré casos en RoboSupportDB relacionados con: {query}"
+            f"RAG_EMPTY::No encontré casos en RoboSupportDB relacionados con: {query}",
+            {"doc_ids": []},
         )
 
     out_parts: List[str] = []
@@ -750,7 +917,8 @@ def retrieve_robot_support(query: str) -> str:
             f"{d.page_content}\n"
         )
 
-    return "\n\n".join(out_parts)
+    doc_ids = [document_id("robot_support", d) for d in hits]
+    return "\n\n".join(out_parts), {"doc_ids": doc_ids}
 
 
 # ---- Tool de ruteo interno entre agentes ----
@@ -760,6 +928,29 @@ def route_to(target: str) -> str:
     return f"ROUTE::{(target or '').upper()}"
 
 
+# ---- Tool: recuperar un resultado desalojado del historial ----
+@tool
+def recall_tool_output(ref: str, config: RunnableConfig, max_chars: int = 6000) -> str:
+    """
+    Recupera el resultado completo de una tool anterior que en el historial
+    aparece como TOOL_REF::...ref=<ref>. Úsala solo si el resumen de la
+    referencia no basta para responder.
+    """
+    # thread_id == session_id (app.py); solo se ven resultados de esta sesión
+    session_id = (config.get("configurable") or {}).get("thread_id")
+    try:
+        row = tool_outputs.get(ref.strip(), session_id)
+    except Exception as e:
+        print("[recall_tool_output] error:", e)
+        return f"ERROR:{e}"
+    if not row:
+        return "NOT_FOUND"
+    content = row["content"]
+    if len(content) > max_chars:
+        content = content[:max_chars] + "\n...(recortado)"
+    return f"{row['tool_name']} (ref={ref}):\n{content}"
+
+
 # ---- Current date/time tool ----
 @tool
 def current_datetime(state: Optional[State] = None, tz: Optional[str] = None) -> str:
@@ -870,12 +1061,7 @@ def update_student_info(
             update_data["interests"] = interests
 
         if update_data:
-            (
-                SB.table("students")
-                .update(update_data)
-                .eq("email", email)
-                .execute()
-            )
+            db.update_student(update_data, email=email)
 
         return "OK"
     except Exception as e:
@@ -894,26 +1080,12 @@ def get_project_tasks(project_id: str) -> List[dict]:
     Úsalo para que el agente vea el mapa general de prácticas del proyecto.
     """
     try:
-        # Intentar ordenar por created_at; si no existe, Supabase marcará error en logs
-        res = (
-            SB.table("project_tasks")
-            .select("id, project_id, title, description, created_at")
-            .eq("project_id", project_id)
-            .order("created_at", desc=False)
-            .execute()
-        )
-        return res.data or []
+        # Del árbol del proyecto en caché (una consulta anidada por proyecto)
+        return [task_fields(t) for t in project_trees.get(project_id)]
     except Exception as e:
         print("[get_project_tasks] error:", e)
-        # Fallback simple: sin orden explícito
         try:
-            res = (
-                SB.table("project_tasks")
-                .select("id, project_id, title, description")
-                .eq("project_id", project_id)
-                .execute()
-            )
-            return res.data or []
+            return db.list_project_tasks(project_id)
         except Exception as e2:
             print("[get_project_tasks fallback] error:", e2)
             return []
@@ -933,15 +1105,11 @@ def get_task_steps(task_id: str) -> List[dict]:
     - description
     - is_completed (bool, opcional)
     """
+    task = project_trees.find_task(task_id)
+    if task is not None:
+        return [step_fields(s) for s in task["steps"]]
     try:
-        res = (
-            SB.table("task_steps")
-            .select("id, task_id, step_number, title, description, is_completed")
-            .eq("task_id", task_id)
-            .order("step_number", desc=False)
-            .execute()
-        )
-        return res.data or []
+        return db.list_task_steps(task_id)
     except Exception as e:
         print("[get_task_steps] error:", e)
         return []
@@ -954,17 +1122,13 @@ def complete_task_step(step_id: str) -> str:
     Útil cuando el estudiante termina un paso y el agente quiere registrar el avance.
     """
     try:
-        (
-            SB.table("task_steps")
-            .update(
-                {
-                    "is_completed": True,
-                    "completed_at": datetime.now(ZoneInfo("America/Monterrey")).isoformat(),
-                }
-            )
-            .eq("id", step_id)
-            .execute()
-        )
+        db.complete_step(step_id, datetime.now(ZoneInfo("America/Monterrey")).isoformat())
+        # El árbol del proyecto se recarga en segundo plano para el siguiente turno
+        projects = project_trees.invalidate(step_id=step_id)
+        for project_id in projects:
+            project_trees.prefetch(project_id)
+        # Proyecto desconocido: descartar todo el avance en caché
+        progress_cache.invalidate(projects or None)
         return "OK"
     except Exception as e:
         print("[complete_task_step] error:", e)
@@ -993,27 +1157,16 @@ def get_task_step_images(
     - tags
     - image_url  (o storage_path)  -> URL o ruta pública
     """
+    limit = max(1, min(20, int(limit)))
+    task = project_trees.find_task(task_id)
+    if task is not None:
+        if step_number is None:
+            return task["images"][:limit]
+        return [img for img in task["images"] if img.get("step_number") == step_number][:limit]
     try:
-        q = (
-            SB.table("manual_images")
-            .select("*")
-            .eq("project_task_id", task_id)
-        )
-    except Exception:
-        # Fallback si el FK se llama task_id en vez de project_task_id
-        q = SB.table("manual_images").select("*").eq("task_id", task_id)
-
-    if step_number is not None:
-        try:
-            q = q.eq("step_number", step_number)
-        except Exception as e:
-            print("[get_task_step_images] step_number filter error:", e)
-
-    try:
-        res = q.limit(max(1, min(20, int(limit)))).execute()
-        return res.data or []
+        return db.list_step_images(task_id, step_number, limit)
     except Exception as e:
-        print("[get_task_step_images] error final:", e)
+        print("[get_task_step_images] error:", e)
         return []
 
 
@@ -1036,35 +1189,9 @@ def search_manual_images(
       algo como: IMAGE::image_url::título o descripción corta.
     """
     try:
-        # Hacemos un select amplio para no depender de columnas exactas
-        q = SB.table("manual_images").select("*")
-
-        # Filtros por proyecto / tipo de robot si se proporcionan
-        if project_id:
-            try:
-                q = q.eq("project_id", project_id)
-            except Exception as e:
-                print("[search_manual_images] project_id filter error:", e)
-
-        if robot_type:
-            try:
-                q = q.ilike("robot_type", f"%{robot_type}%")
-            except Exception as e:
-                print("[search_manual_images] robot_type filter error:", e)
-
-        # Búsqueda textual básica sobre columnas típicas
-        # (ajusta si tus nombres reales cambian)
-        try:
-            q = q.or_(
-                "title.ilike.%{q}%,description.ilike.%{q}%,tags.ilike.%{q}%".format(
-                    q=query
-                )
-            )
-        except Exception as e:
-            print("[search_manual_images] OR ilike error:", e)
-
-        res = q.limit(max(1, min(20, int(limit)))).execute()
-        return res.data or []
+        return db.search_manual_images(
+            query, robot_type, project_id, max(1, min(20, int(limit)))
+        )
     except Exception as e:
         print("[search_manual_images] error:", e)
         return []
@@ -1076,6 +1203,8 @@ LAB_TOOLS = [
     retrieve_context,
     retrieve_robot_support,
     web_research,
+    web_research_multi,
+    recall_tool_output,
     search_manual_images,      
     route_to,
 ]
@@ -1085,6 +1214,8 @@ GENERAL_TOOLS = [
     update_student_goals,
     update_learning_style,
     web_research,
+    web_research_multi,
+    recall_tool_output,
     retrieve_context,
     search_manual_images,      
     route_to,
@@ -1095,6 +1226,8 @@ EDU_TOOLS = [
     get_student_profile,
     update_learning_style,
     web_research,
+    web_research_multi,
+    recall_tool_output,
     retrieve_context,
     get_project_tasks,         
     get_task_steps,          
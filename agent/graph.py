@@ -7,6 +7,17 @@ from langgraph.graph.message import AnyMessage, add_messages
 from pydantic.v1 import BaseModel, Field
 from langchain_core.messages import ToolMessage
 from langchain_core.runnables.config import RunnableConfig
+from rag import retrieval_cache
+from helpers.history_window import budget_for, build_window, history_folder
+from helpers.prompt_usage import prompt_usage
+from helpers.tool_store import evict_tool_outputs, output_row, tool_outputs
+from helpers.practice import (
+    advance_after_completion,
+    practice_context_for,
+    project_trees,
+    render_practice_context,
+)
+from rag.rag_logic import get_embeddings, index_version
 from dotenv import load_dotenv; load_dotenv()
 import os
 import re
@@ -24,6 +35,8 @@ from Settings.prompts import (
 )
 from Settings.tools import (
     web_research,
+    web_research_multi,
+    recall_tool_output,
     retrieve_context,
     update_student_goals,
     update_learning_style,
@@ -125,8 +138,17 @@ class State(TypedDict, total=False):
     current_task_id: Optional[str]    # project_tasks.id
     current_step_number: Optional[int]
     practice_completed: Optional[bool]
+    practice_context: Optional[str]   # resumen del avance (helpers/practice.py)
     # ================================================
 
+    # Caché de recuperación entre turnos (ver rag/retrieval_cache.py)
+    retrieval_cache: Optional[List[dict]]
+
+    # Ventana de historial (ver helpers/history_window.py)
+    history_summary: Optional[str]        # resumen de los turnos viejos
+    history_summary_upto: Optional[str]   # id del último mensaje resumido
+    history_stats: Optional[List[dict]]   # tokens por llamada en este turno
+
 
 class CompleteOrEscalate(BaseModel):
     reason: str = Field(description="Motivo para finalizar o escalar.")
@@ -252,6 +274,8 @@ llm = ChatOpenAI(
 GENERAL_TOOLS = [
     CompleteOrEscalate,
     web_research,
+    web_research_multi,
+    recall_tool_output,
     get_student_profile,
     update_student_goals,
     update_learning_style,
@@ -266,6 +290,8 @@ GENERAL_TOOLS = [
 EDU_TOOLS = [
     CompleteOrEscalate,
     web_research,
+    web_research_multi,
+    recall_tool_output,
     get_student_profile,
     update_learning_style,
     retrieve_context,
@@ -284,6 +310,8 @@ EDU_TOOLS = [
 LAB_TOOLS = [
     CompleteOrEscalate,
     web_research,
+    web_research_multi,
+    recall_tool_output,
     retrieve_context,
     retrieve_robot_support,
     route_to,
@@ -295,6 +323,8 @@ LAB_TOOLS = [
 IND_TOOLS = [
     CompleteOrEscalate,
     web_research,
+    web_research_multi,
+    recall_tool_output,
     retrieve_context,
     retrieve_robot_support,
     current_datetime,
@@ -321,31 +351,57 @@ identification_runnable = identification_prompt | identification_llm
 # =========================
 # Nodos de agentes (no borran historial)
 # =========================
-def _invoke_runnable_as_messages(runnable, state: State) -> dict:
-    """Envuelve la salida del runnable como lista de mensajes nuevos."""
-    result = runnable.invoke(state)
+def _invoke_with_history_window(runnable, state: State, agent: str) -> dict:
+    """
+    Invoca el runnable con la ventana de historial del agente (resumen +
+    turnos recientes dentro de su presupuesto) en lugar de `messages`
+    completo, y registra los tokens del prompt de esta llamada.
+    """
+    # Resumen plegado en segundo plano al cerrar el turno anterior (si ya está)
+    folded = history_folder.take(state.get("session_id"), state.get("history_summary_upto"))
+    summary = folded.get("history_summary", state.get("history_summary"))
+    summary_upto = folded.get("history_summary_upto", state.get("history_summary_upto"))
+    window, stats = build_window(
+        state.get("messages") or [],
+        summary,
+        summary_upto,
+        budget_for(agent),
+    )
+    result = runnable.invoke({**state, "messages": window})
     if isinstance(result, list):
         msgs = result
     else:
         msgs = [result]
+
+    usage = getattr(msgs[-1], "usage_metadata", None) or {}
+    stats = {"agent": agent, **stats, **prompt_usage.record(agent, usage)}
+    print(
+        f"[history_window] {agent}: {stats['messages_sent']}/{stats['messages_total']} mensajes, "
+        f"~{stats['history_tokens']} tokens de historial, prompt={stats['prompt_tokens']} "
+        f"(cacheados {stats['cached_tokens']})"
+    )
     # add_messages se encarga de anexar estos mensajes al historial
-    return {"messages": msgs}
+    return {
+        **folded,
+        "messages": msgs,
+        "history_stats": (state.get("history_stats") or []) + [stats],
+    }
 
 
 def general_agent_node(state: State):
-    return _invoke_runnable_as_messages(general_runnable, state)
+    return _invoke_with_history_window(general_runnable, state, "general_agent_node")
 
 
 def education_agent_node(state: State):
-    return _invoke_runnable_as_messages(education_runnable, state)
+    return _invoke_with_history_window(education_runnable, state, "education_agent_node")
 
 
 def lab_agent_node(state: State):
-    return _invoke_runnable_as_messages(lab_runnable, state)
+    return _invoke_with_history_window(lab_runnable, state, "lab_agent_node")
 
 
 def industrial_agent_node(state: State):
-    return _invoke_runnable_as_messages(industrial_runnable, state)
+    return _invoke_with_history_window(industrial_runnable, state, "industrial_agent_node")
 
 
 # =========================
@@ -511,6 +567,10 @@ def process_identification_tools(state: State):
                 )
                 return {
                     "messages": [tool_message, confirmation_msg],
+                    # El perfil pudo cambiar: fuera lo cacheado con su texto
+                    "retrieval_cache": retrieval_cache.drop_profile_entries(
+                        state.get("retrieval_cache")
+                    ),
                     "user_identified": True,
                     "user_email": email,
                     "user_name": student.get("full_name", ""),
@@ -543,10 +603,21 @@ def initial_node(state: State, config: RunnableConfig) -> State:
     state = dict(state)
     _inject_time_fields(state)
 
+    # Tokens por llamada: se reportan por turno
+    state["history_stats"] = []
+
     # Valor por defecto para que los prompts del router/agentes no fallen
     if "profile_summary" not in state or state["profile_summary"] is None:
         state["profile_summary"] = "Perfil aún no registrado."
 
+    # Avance de la práctica (árbol del proyecto en caché; NO_PRACTICE si no aplica)
+    state["practice_context"] = practice_context_for(
+        state.get("chat_type"),
+        state.get("project_id"),
+        state.get("current_task_id"),
+        state.get("current_step_number"),
+    )
+
     # Conectar session_id con thread_id si viene desde config
     if not state.get("session_id"):
         configurable = config.get("configurable", {})
@@ -706,6 +777,28 @@ def save_agent_output(state: State):
     except Exception as e:
         print(f"[save_agent_output] Error al guardar chat: {e}")
 
+    # === Plegar turnos viejos en el resumen (en segundo plano) ===
+    # La llamada al LLM no retrasa la respuesta; el siguiente turno aplica el
+    # resultado (ver _invoke_with_history_window)
+    updates = {}
+    try:
+        history_folder.submit(
+            session_id, msgs, state.get("history_summary"), state.get("history_summary_upto"), llm
+        )
+    except Exception as e:
+        print(f"[save_agent_output] Error encargando el resumen del historial: {e}")
+
+    # === Desalojar resultados voluminosos de tools (ya se usaron) ===
+    try:
+        evicted = evict_tool_outputs(msgs, session_id, tool_outputs)
+    except Exception as e:
+        print(f"[save_agent_output] Error desalojando resultados de tools: {e}")
+        evicted = []
+    if evicted:
+        # Mismo id → add_messages reemplaza el ToolMessage original
+        updates["messages"] = evicted
+        print(f"[save_agent_output] {len(evicted)} resultados de tools desalojados al almacén")
+
     # === Generar título de sesión a partir del historial completo ===
     try:
         title = generate_session_title_from_history(msgs)
@@ -715,9 +808,9 @@ def save_agent_output(state: State):
 
     if title:
         # Esto se propagará hasta app.py como result["session_title"]
-        return {"session_title": title}
+        updates["session_title"] = title
 
-    return {}
+    return updates
 
 
 def initial_routing(state: State) -> Literal["router"]:
@@ -858,20 +951,16 @@ router_runnable = agent_route_prompt | llm.bind_tools(
 
 
 class Assistant:
-    def __init__(self, runnable):
+    def __init__(self, runnable, name: str):
         self.runnable = runnable
+        self.name = name
 
     def __call__(self, state: State, config):
         # No tocamos messages previos, solo añadimos la nueva respuesta
-        result = self.runnable.invoke(state)
-        if isinstance(result, list):
-            msgs = result
-        else:
-            msgs = [result]
-        return {"messages": msgs}
+        return _invoke_with_history_window(self.runnable, state, self.name)
 
 
-graph.add_node("router", Assistant(router_runnable))
+graph.add_node("router", Assistant(router_runnable, "router"))
 graph.add_conditional_edges("router", intitial_route_function)
 
 graph.add_node("general_agent_node", general_agent_node)
@@ -935,6 +1024,8 @@ from langgraph.prebuilt import ToolNode, tools_condition
 tools_node = ToolNode(
     tools=[
         web_research,
+        web_research_multi,
+        recall_tool_output,
         retrieve_context,
         retrieve_robot_support,
         get_student_profile,
@@ -952,7 +1043,167 @@ tools_node = ToolNode(
     ]
 )
 
-graph.add_node("tools", tools_node)
+
+
+def cached_tools_node(state: State, config: RunnableConfig) -> dict:
+    """
+    Ejecuta las tool calls del último mensaje, pero reutiliza resultados de
+    recuperación (retrieve_*) de turnos anteriores cuando la consulta es
+    casi la misma y el índice no cambió de versión. El texto de cada
+    resultado vive en el almacén de tool outputs de la sesión; el State solo
+    guarda su ref.
+    """
+    last = state["messages"][-1]
+    tool_calls = getattr(last, "tool_calls", None) or []
+    session_id = state.get("session_id")
+
+    version = index_version()
+    cache = retrieval_cache.prune(state.get("retrieval_cache"), version)
+    # Si esta ronda modifica el perfil, lo cacheado con texto del perfil ya no
+    # vale, y lo que se recupere en la misma ronda tampoco se guarda
+    profile_changed = any(c["name"] in retrieval_cache.PROFILE_TOOLS for c in tool_calls)
+    if profile_changed:
+        cache = retrieval_cache.drop_profile_entries(cache)
+
+    def cacheable(name: str) -> bool:
+        return bool(session_id) and name in retrieval_cache.CACHEABLE_TOOLS and not (
+            profile_changed and name in retrieval_cache.PROFILE_DEPENDENT_TOOLS
+        )
+
+    embed = get_embeddings().embed_query
+
+    hits = {}          # tool_call_id → ToolMessage desde caché
+    embeddings = {}    # tool_call_id → embedding calculado (para guardar)
+    misses = []
+    for call in tool_calls:
+        if not cacheable(call["name"]):
+            misses.append(call)
+            continue
+        try:
+            entry, embedding = retrieval_cache.lookup(
+                cache, call["name"], call.get("args") or {}, embed
+            )
+            stored = tool_outputs.get(entry["ref"], session_id) if entry is not None else None
+        except Exception as e:
+            print(f"[cached_tools_node] Error consultando caché: {e}")
+            entry, embedding, stored = None, None, None
+        if entry is not None and stored is None:
+            # El almacén ya no tiene el resultado (TTL): se vuelve a ejecutar
+            cache = [e for e in cache if e is not entry]
+        elif entry is not None:
+            print(f"[cached_tools_node] Cache hit {call['name']}: {entry['query']!r}")
+            cache = retrieval_cache.touch(cache, entry)
+            hits[call["id"]] = ToolMessage(
+                content=stored["content"],
+                name=call["name"],
+                tool_call_id=call["id"],
+                artifact={"doc_ids": entry["doc_ids"], "cache_hit": True},
+            )
+            continue
+        if embedding is not None:
+            embeddings[call["id"]] = embedding
+        misses.append(call)
+
+    executed = {}
+    if misses:
+        sub = last.model_copy(update={"tool_calls": misses})
+        out = tools_node.invoke({"messages": [sub]}, config)
+        for msg in out.get("messages", []):
+            executed[msg.tool_call_id] = msg
+
+    for call in misses:
+        msg = executed.get(call["id"])
+        if (
+            msg is None
+            or not cacheable(call["name"])
+            or getattr(msg, "status", "success") == "error"
+        ):
+            continue
+        args = call.get("args") or {}
+        try:
+            embedding = embeddings.get(call["id"]) or embed(
+                args.get(retrieval_cache.CACHEABLE_TOOLS[call["name"]]) or ""
+            )
+            tool_outputs.put_many(
+                [output_row(msg, _flatten_message_content(msg.content), session_id)]
+            )
+            cache = retrieval_cache.remember(
+                cache,
+                call["name"],
+                args,
+                embedding,
+                msg.tool_call_id,
+                (msg.artifact or {}).get("doc_ids", []),
+                version,
+            )
+        except Exception as e:
+            print(f"[cached_tools_node] Error guardando en caché: {e}")
+
+    messages = [
+        hits.get(call["id"]) or executed.get(call["id"])
+        for call in tool_calls
+        if hits.get(call["id"]) or executed.get(call["id"])
+    ]
+    return {"messages": messages, "retrieval_cache": cache}
+
+
+graph.add_node("tools", cached_tools_node)
+
+
+def _last_tool_results(messages: list) -> List[tuple]:
+    """(tool_call, ToolMessage) de la última ronda de tools."""
+    results = {}
+    for msg in reversed(messages or []):
+        if isinstance(msg, ToolMessage):
+            results[msg.tool_call_id] = msg
+            continue
+        calls = getattr(msg, "tool_calls", None) or []
+        return [(call, results[call["id"]]) for call in calls if call["id"] in results]
+    return []
+
+
+def practice_tracker_node(state: State) -> dict:
+    """
+    Mantiene current_task_id / current_step_number / practice_completed sin
+    pasar por el LLM: cuando complete_task_step regresa OK avanza al
+    siguiente paso pendiente y refresca practice_context. Usa el último
+    árbol en caché (la recarga corre en segundo plano, ver complete_task_step).
+    """
+    if (state.get("chat_type") or "").lower() != "practice" or not state.get("project_id"):
+        return {}
+    completed = [
+        (call.get("args") or {}).get("step_id")
+        for call, msg in _last_tool_results(state.get("messages"))
+        if call["name"] == "complete_task_step"
+        and _flatten_message_content(msg.content).strip() == "OK"
+    ]
+    completed = [sid for sid in completed if sid]
+    if not completed:
+        return {}
+
+    project_id = state["project_id"]
+    tree = project_trees.peek(project_id)
+    advanced = advance_after_completion(tree, completed) if tree is not None else None
+    if advanced is None:
+        # Sin árbol o sin esos pasos (p. ej. una task nueva): recargar
+        try:
+            advanced = advance_after_completion(project_trees.get(project_id), completed)
+        except Exception as e:
+            print(f"[practice_tracker] Error cargando el proyecto {project_id}: {e}")
+            return {}
+    if advanced is None:
+        print(f"[practice_tracker] Pasos {completed} no están en el proyecto {project_id}")
+        return {}
+    tree, updates = advanced
+    print(f"[practice_tracker] Pasos completados {completed} → {updates}")
+    updates["practice_context"] = render_practice_context(
+        tree, updates["current_task_id"], updates["current_step_number"]
+    )
+    return updates
+
+
+graph.add_node("practice_tracker", practice_tracker_node)
+graph.add_edge("tools", "practice_tracker")
 
 # Después de cada agente: si hay tool_calls → ejecutar tools; si no, guardar output y terminar
 for agent in [
@@ -976,7 +1227,7 @@ def return_to_current_agent(state: State) -> str:
     return stack[-1] if stack else "general_agent_node"
 
 
-graph.add_conditional_edges("tools", return_to_current_agent)
+graph.add_conditional_edges("practice_tracker", return_to_current_agent)
 
 # =========================
 # Pop del agente (si usas una tool de cierre)
@@ -1,25 +1,94 @@
 from fastapi import FastAPI, UploadFile, File, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 from typing import Tuple, Dict, Any,Optional
 import uuid
+import asyncio
+import time
+from contextlib import asynccontextmanager
 from datetime import datetime
 from langgraph.checkpoint.memory import MemorySaver
 from langchain_core.messages import HumanMessage
 import uvicorn
 from pathlib import Path
-from Settings.tools import SB 
+from rag.db_access import db, track_queries
+from helpers.jobs import JOB_HANDLERS, runner as job_runner
+from helpers.practice import project_progress
+from helpers.prompt_usage import prompt_usage
+from helpers.web_cache import web_cache
 
 from agent.graph import graph, State
+from rag.rag_logic import indexer, warm_up_vectorstores
 
 # ================== LANGGRAPH & MEMORIA ==================
 
 checkpointer = MemorySaver()
 compiled_graph = graph.compile(checkpointer=checkpointer)
 
+# ================== WARM-UP / READINESS ==================
+
+# Estado de arranque que reporta /health/ready
+READINESS: Dict[str, Any] = {
+    "ready": False,
+    "started_at": None,
+    "finished_at": None,
+    "graph": None,
+    "collections": {},
+    "error": None,
+}
+
+
+def _warm_up() -> None:
+    """
+    Fase de arranque: precarga el grafo compilado, el cliente de embeddings
+    y las colecciones de Chroma configuradas. Corre en un hilo aparte para
+    que /health/live responda mientras tanto.
+    """
+    READINESS["started_at"] = datetime.now().isoformat()
+    try:
+        t0 = time.perf_counter()
+        drawable = compiled_graph.get_graph()
+        READINESS["graph"] = {
+            "nodes": len(drawable.nodes),
+            "load_ms": round((time.perf_counter() - t0) * 1000, 1),
+        }
+
+        # Candidato a escritor único del índice (ver rag/indexer.py)
+        indexer.ensure_started()
+        READINESS["collections"] = warm_up_vectorstores()
+        failed = [
+            name
+            for name, info in READINESS["collections"].items()
+            if info.get("error")
+        ]
+        if failed:
+            READINESS["error"] = f"Colecciones con error: {', '.join(failed)}"
+        else:
+            READINESS["ready"] = True
+    except Exception as e:
+        print(f"[app._warm_up] Error en warm-up: {e}")
+        READINESS["error"] = str(e)
+    finally:
+        READINESS["finished_at"] = datetime.now().isoformat()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    warmup_task = asyncio.create_task(asyncio.to_thread(_warm_up))
+    # Retoma trabajos que quedaron en cola antes de reiniciar
+    job_runner.ensure_started()
+    yield
+    if not warmup_task.done():
+        warmup_task.cancel()
+    await asyncio.to_thread(job_runner.stop)
+    indexer.stop()
+    await asyncio.to_thread(db.close)
+
+
 # ================== FASTAPI APP ==================
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -52,30 +121,22 @@ class ChatResponse(BaseModel):
     user_identified: bool
     timestamp: str
     
-def _load_session_metadata(session_id: str) -> Dict[str, Any]:
+async def _load_session_metadata(session_id: str) -> Dict[str, Any]:
     """
     Lee metadata de chat_session para esta sesión.
     Devuelve siempre un dict, aunque esté vacío.
     """
     try:
-        res = (
-            SB.table("chat_session")
-            .select("metadata")
-            .eq("id", session_id)
-            .limit(1)
-            .execute()
-        )
-        rows = res.data or []
-        if not rows:
-            return {}
-        meta = rows[0].get("metadata") or {}
-        if not isinstance(meta, dict):
-            return {}
-        return meta
+        return await db.aget_session_metadata(session_id)
     except Exception as e:
         print(f"[app._load_session_metadata] Error leyendo metadata para {session_id}: {e}")
         return {}
 
+class JobRequest(BaseModel):
+    kind: str                                # ver GET /jobs/kinds
+    params: Dict[str, Any] = {}
+
+
 class UploadResponse(BaseModel):
     filename: str
     file_path: str
@@ -97,7 +158,9 @@ async def root():
             "message": "/message?mensaje=tu_mensaje (GET - Simple)",
             "chat": "/chat (POST - Completo)",
             "upload": "/upload (POST)",
-            "health": "/health",
+            "jobs": "/jobs (POST), /jobs/{job_id} (GET), /jobs/{job_id}/cancel (POST)",
+            "health": "/health/live",
+            "ready": "/health/ready",
         },
         "examples": {
             "simple_message": "http://localhost:8000/message?mensaje=Hola como estas"
@@ -106,14 +169,115 @@ async def root():
 
 
 @app.get("/health")
+@app.get("/health/live")
 async def health_check():
-    """Health check endpoint to verify server status"""
+    """Liveness: the process is up and serving requests"""
     return {
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
     }
 
 
+@app.get("/health/ready")
+async def readiness_check():
+    """Readiness: graph and vector collections are warm (503 until then)"""
+    payload = {
+        "status": "ready" if READINESS["ready"] else "warming_up",
+        "timestamp": datetime.now().isoformat(),
+        **READINESS,
+        "index": {
+            "version": indexer.version(),
+            "writer": indexer.is_leader,
+        },
+        "web_cache": web_cache.stats(),
+        "prompt_cache": prompt_usage.summary(),
+    }
+    if not READINESS["ready"]:
+        if READINESS["finished_at"]:
+            payload["status"] = "failed"
+        return JSONResponse(status_code=503, content=payload)
+    return payload
+
+
+# ================== JOBS EN SEGUNDO PLANO ==================
+
+
+@app.get("/jobs/kinds")
+async def list_job_kinds():
+    """Tipos de trabajo registrados"""
+    return {"kinds": sorted(JOB_HANDLERS)}
+
+
+@app.post("/jobs", status_code=202)
+async def enqueue_job(payload: JobRequest):
+    """Encola un trabajo pesado y regresa su id de inmediato"""
+    try:
+        job_id = await asyncio.to_thread(job_runner.enqueue, payload.kind, payload.params)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return await asyncio.to_thread(job_runner.get, job_id)
+
+
+@app.get("/jobs")
+async def list_jobs(limit: int = 20, status: Optional[str] = None):
+    """Trabajos más recientes (opcionalmente filtrados por estado)"""
+    jobs = await asyncio.to_thread(job_runner.list, min(max(limit, 1), 200), status)
+    return {"jobs": jobs}
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Estado y resultado de un trabajo"""
+    job = await asyncio.to_thread(job_runner.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    return job
+
+
+@app.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    """Cancela un trabajo en cola o pide detenerse a uno en ejecución"""
+    job = await asyncio.to_thread(job_runner.cancel, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    return job
+
+
+# ================== AVANCE DE PRÁCTICAS ==================
+
+
+@app.get("/projects/{project_id}/progress")
+async def get_project_progress(project_id: str):
+    """Avance agregado del proyecto (caché corto, se invalida al completar pasos)"""
+    try:
+        return await asyncio.to_thread(project_progress, project_id)
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Error leyendo el avance: {e}")
+
+
+@app.get("/sessions/{session_id}/progress")
+async def get_session_progress(session_id: str):
+    """Avance del proyecto de la sesión + posición actual del tracker"""
+    meta = await _load_session_metadata(session_id)
+    project_id = meta.get("project_id")
+    if not project_id:
+        raise HTTPException(status_code=404, detail="La sesión no tiene proyecto asociado")
+    try:
+        progress = await asyncio.to_thread(project_progress, project_id)
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Error leyendo el avance: {e}")
+
+    snapshot = await compiled_graph.aget_state({"configurable": {"thread_id": session_id}})
+    values = snapshot.values or {}
+    return {
+        **progress,
+        "session_id": session_id,
+        "current_task_id": values.get("current_task_id"),
+        "current_step_number": values.get("current_step_number"),
+        "practice_completed": values.get("practice_completed"),
+    }
+
+
 # ================== ENDPOINT SIMPLE /message ==================
 
 
@@ -144,7 +308,7 @@ async def simple_message(
         real_session_id = session_id or str(uuid.uuid4())
 
         # 1.b) Cargar metadata de la sesión (chat_type, project_id, etc.)
-        meta = _load_session_metadata(real_session_id)
+        meta = await _load_session_metadata(real_session_id)
         chat_type = (meta.get("chat_type") or "default").lower()
         project_id = meta.get("project_id")
 
@@ -251,7 +415,7 @@ async def simple_message(
                     }
                 )
 
-        debug_payload = {"tool_events": tool_events}
+        debug_payload = {"tool_events": tool_events, "history": result.get("history_stats") or []}
 
         return {
             "response": agent_response,
@@ -283,62 +447,63 @@ async def chat_endpoint(payload: ChatRequest):
         # 1) Resolver session_id
         real_session_id = payload.session_id or str(uuid.uuid4())
 
-        # 1.b) Cargar metadata de la sesión
-        meta = _load_session_metadata(real_session_id)
-        chat_type = (meta.get("chat_type") or "default").lower()
-        project_id = meta.get("project_id")
-        
+        # Consultas a Supabase de este turno (se reportan en debug)
+        with track_queries() as db_stats:
+            # 1.b) Cargar metadata de la sesión
+            meta = await _load_session_metadata(real_session_id)
+            chat_type = (meta.get("chat_type") or "default").lower()
+            project_id = meta.get("project_id")
+
+            # 2) Config para el grafo
+            config = {
+                "configurable": {
+                    "thread_id": real_session_id,
+                    "session_id": real_session_id,
+                    "chat_type": chat_type,
+                }
+            }
 
-        # 2) Config para el grafo
-        config = {
-            "configurable": {
-                "thread_id": real_session_id,
+            if project_id:
+                config["configurable"]["project_id"] = project_id
+            if payload.user_email:
+                config["configurable"]["user_email"] = payload.user_email
+
+            # 👇 pasar configuración del widget/avatar
+            if payload.avatar_id:
+                config["configurable"]["avatar_id"] = payload.avatar_id
+            if payload.widget_mode:
+                config["configurable"]["widget_mode"] = payload.widget_mode
+            if payload.widget_personality:
+                config["configurable"]["widget_personality"] = payload.widget_personality
+            if payload.widget_notes:
+                config["configurable"]["widget_notes"] = payload.widget_notes
+
+            # 3) Estado inicial
+            initial_state: State = {
+                "messages": [HumanMessage(content=payload.message)],
+                "tz": timezone,
                 "session_id": real_session_id,
                 "chat_type": chat_type,
             }
-        }
 
-        if project_id:
-            config["configurable"]["project_id"] = project_id
-        if payload.user_email:
-            config["configurable"]["user_email"] = payload.user_email
-
-        # 👇 pasar configuración del widget/avatar
-        if payload.avatar_id:
-            config["configurable"]["avatar_id"] = payload.avatar_id
-        if payload.widget_mode:
-            config["configurable"]["widget_mode"] = payload.widget_mode
-        if payload.widget_personality:
-            config["configurable"]["widget_personality"] = payload.widget_personality
-        if payload.widget_notes:
-            config["configurable"]["widget_notes"] = payload.widget_notes
-
-        # 3) Estado inicial
-        initial_state: State = {
-            "messages": [HumanMessage(content=payload.message)],
-            "tz": timezone,
-            "session_id": real_session_id,
-            "chat_type": chat_type,
-        }
-        
-        if project_id:
-            initial_state["project_id"] = project_id
+            if project_id:
+                initial_state["project_id"] = project_id
 
-        if payload.user_email:
-            initial_state["user_email"] = payload.user_email
+            if payload.user_email:
+                initial_state["user_email"] = payload.user_email
 
-        # También guardamos los widget_* en el State
-        if payload.avatar_id:
-            initial_state["widget_avatar_id"] = payload.avatar_id
-        if payload.widget_mode:
-            initial_state["widget_mode"] = payload.widget_mode
-        if payload.widget_personality:
-            initial_state["widget_personality"] = payload.widget_personality
-        if payload.widget_notes:
-            initial_state["widget_notes"] = payload.widget_notes
+            # También guardamos los widget_* en el State
+            if payload.avatar_id:
+                initial_state["widget_avatar_id"] = payload.avatar_id
+            if payload.widget_mode:
+                initial_state["widget_mode"] = payload.widget_mode
+            if payload.widget_personality:
+                initial_state["widget_personality"] = payload.widget_personality
+            if payload.widget_notes:
+                initial_state["widget_notes"] = payload.widget_notes
 
-        # 4) Invocar grafo
-        result: State = await compiled_graph.ainvoke(initial_state, config)
+            # 4) Invocar grafo
+            result: State = await compiled_graph.ainvoke(initial_state, config)
 
         messages = result.get("messages", [])
         agent_response = ""
@@ -369,7 +534,11 @@ async def chat_endpoint(payload: ChatRequest):
                         "tool_calls": tool_calls,
                     }
                 )
-        debug_payload = {"tool_events": tool_events}
+        debug_payload = {
+            "tool_events": tool_events,
+            "supabase": db_stats.summary(),
+            "history": result.get("history_stats") or [],
+        }
 
         return {
             "response": agent_response,
@@ -1,14 +1,32 @@
+import argparse
+
 from Settings.tools import _summarize_all_chats
-from datetime import datetime
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Daily chat summary process")
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Report estimated LLM tokens and rows to delete without writing anything",
+    )
+    parser.add_argument(
+        "--fresh",
+        action="store_true",
+        help="Ignore the checkpoint of an interrupted run and start over",
+    )
+    args = parser.parse_args()
+
     print("Starting daily chat summary process")
 
-    stats = _summarize_all_chats()
+    stats = _summarize_all_chats(dry_run=args.dry_run, resume=not args.fresh)
+
+    if args.dry_run:
+        print("\nDry run completed")
+        exit(0)
 
     if stats.get('failed', 0) > 0:
         print("\nSome sessions failed.")
         exit(1)
     else:
         print("\nProcess completed")
-        exit(0)
\ No newline at end of file
+        exit(0)
@@ -0,0 +1,273 @@
+"""
+Ventana de historial con presupuesto de tokens para los prompts de agentes.
+
+Los prompts reciben `{messages}` completo; en sesiones largas (sobre todo
+después de volcados de RAG o listas de pasos) cada turno reenvía decenas de
+miles de tokens. Antes de cada llamada al LLM:
+
+- build_window() arma lo que se manda: el resumen acumulado (si hay) como
+  mensaje de sistema + los turnos posteriores al resumen, del más reciente
+  al más viejo mientras quepan en el presupuesto del agente. Solo se corta
+  en fronteras de HumanMessage, así nunca queda un ToolMessage sin su
+  tool_call.
+- fold_history() pliega en el resumen los turnos que ya quedaron fuera de
+  los últimos HISTORY_KEEP_TURNS y avanza el cursor (id del último mensaje
+  resumido). Es una llamada al LLM, así que no corre dentro del turno:
+  save_agent_output la encarga a history_folder (hilo en segundo plano) y el
+  siguiente turno aplica el resultado al State con take().
+
+El historial completo sigue en el checkpointer; solo cambia lo que se envía.
+"""
+
+import json
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional, Set, Tuple
+
+from langchain_core.messages import AnyMessage, HumanMessage, SystemMessage
+
+from helpers.summarizer import count_tokens
+
+# Turnos recientes que siempre se conservan textuales
+HISTORY_KEEP_TURNS = int(os.getenv("HISTORY_KEEP_TURNS", "4"))
+# Turnos viejos que se juntan antes de plegarlos (una llamada al LLM por lote)
+HISTORY_SUMMARY_BATCH = int(os.getenv("HISTORY_SUMMARY_BATCH", "2"))
+# Presupuesto por defecto y por agente (HISTORY_BUDGET_<AGENTE>, p. ej.
+# HISTORY_BUDGET_EDUCATION=9000)
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "6000"))
+_DEFAULT_BUDGETS = {
+    "router": 2500,
+    "general_agent_node": HISTORY_TOKEN_BUDGET,
+    "education_agent_node": 8000,
+    "lab_agent_node": HISTORY_TOKEN_BUDGET,
+    "industrial_agent_node": HISTORY_TOKEN_BUDGET,
+}
+# Recorte por mensaje al armar el texto que se resume
+FOLD_MESSAGE_CHARS = 600
+# Resúmenes listos que se conservan para sesiones que aún no vuelven
+MAX_READY_FOLDS = 1000
+
+SUMMARY_PREFIX = "Resumen de la conversación anterior (los mensajes viejos ya no se incluyen):\n"
+
+FOLD_PROMPT = """Este es el resumen acumulado de una conversación entre un estudiante y un agente:
+{previous_summary}
+
+Mensajes posteriores a ese resumen:
+{conversation}
+
+Actualiza el resumen en español, en máximo 200 palabras. Conserva datos del estudiante,
+temas, dudas abiertas, decisiones, pasos de práctica completados y robots o equipos
+mencionados. Omite saludos y el contenido literal de resultados de herramientas.
+Devuelve solo el resumen actualizado."""
+
+
+def budget_for(agent: str) -> int:
+    suffix = agent.replace("_agent_node", "").upper()
+    env = os.getenv(f"HISTORY_BUDGET_{suffix}")
+    if env:
+        return int(env)
+    return _DEFAULT_BUDGETS.get(agent, HISTORY_TOKEN_BUDGET)
+
+
+def _text_of(content) -> str:
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return " ".join(
+            str(item.get("text", "")) if isinstance(item, dict) else str(item) for item in content
+        )
+    return str(content)
+
+
+def message_tokens(msg: AnyMessage) -> int:
+    """Tokens aproximados de un mensaje (contenido + argumentos de tool_calls)."""
+    tokens = count_tokens(_text_of(msg.content)) + 4
+    for call in getattr(msg, "tool_calls", None) or []:
+        tokens += count_tokens(call.get("name", "")) + count_tokens(
+            json.dumps(call.get("args") or {}, ensure_ascii=False)
+        )
+    return tokens
+
+
+def split_turns(messages: List[AnyMessage]) -> List[List[AnyMessage]]:
+    """Agrupa en turnos que empiezan con un HumanMessage (lo previo queda en el primero)."""
+    turns: List[List[AnyMessage]] = []
+    for msg in messages:
+        if isinstance(msg, HumanMessage) or not turns:
+            turns.append([msg])
+        else:
+            turns[-1].append(msg)
+    return turns
+
+
+def _pending(messages: List[AnyMessage], summary_upto: Optional[str]) -> List[AnyMessage]:
+    """Mensajes posteriores al cursor del resumen (todos si no se encuentra)."""
+    if summary_upto:
+        for i, msg in enumerate(messages):
+            if getattr(msg, "id", None) == summary_upto:
+                return messages[i + 1:]
+    return list(messages)
+
+
+def build_window(
+    messages: List[AnyMessage],
+    summary: Optional[str],
+    summary_upto: Optional[str],
+    budget: int,
+) -> Tuple[List[AnyMessage], Dict[str, int]]:
+    """(mensajes para el prompt, estadísticas). El turno actual siempre va completo."""
+    turns = split_turns(_pending(messages, summary_upto))
+    summary_msg = SystemMessage(content=SUMMARY_PREFIX + summary) if summary else None
+    tokens = message_tokens(summary_msg) if summary_msg else 0
+
+    kept: List[List[AnyMessage]] = []
+    for turn in reversed(turns):
+        turn_tokens = sum(message_tokens(m) for m in turn)
+        if kept and tokens + turn_tokens > budget:
+            break
+        kept.insert(0, turn)
+        tokens += turn_tokens
+
+    window = ([summary_msg] if summary_msg else []) + [m for turn in kept for m in turn]
+    stats = {
+        "messages_total": len(messages),
+        "messages_sent": len(window),
+        "turns_sent": len(kept),
+        "turns_dropped": len(turns) - len(kept),
+        "history_tokens": tokens,
+        "budget": budget,
+    }
+    return window, stats
+
+
+def _fold_text(messages: List[AnyMessage]) -> str:
+    lines = []
+    for msg in messages:
+        text = _text_of(msg.content).replace("\n", " ").strip()
+        if not text:
+            continue
+        if len(text) > FOLD_MESSAGE_CHARS:
+            text = text[:FOLD_MESSAGE_CHARS - 3] + "..."
+        role = {"human": "Estudiante", "ai": "Agente", "tool": "Herramienta"}.get(msg.type, msg.type)
+        lines.append(f"{role}: {text}")
+    return "\n".join(lines)
+
+
+def _foldable_turns(
+    messages: List[AnyMessage], summary_upto: Optional[str], keep_turns: int, batch: int
+) -> List[List[AnyMessage]]:
+    """Turnos que toca plegar ([] si todavía no se juntan `batch`)."""
+    turns = split_turns(_pending(messages, summary_upto))
+    old = turns[:-keep_turns] if keep_turns else turns
+    return old if len(old) >= max(1, batch) else []
+
+
+def fold_history(
+    messages: List[AnyMessage],
+    summary: Optional[str],
+    summary_upto: Optional[str],
+    llm,
+    keep_turns: int = HISTORY_KEEP_TURNS,
+    batch: int = HISTORY_SUMMARY_BATCH,
+) -> dict:
+    """
+    Pliega en el resumen los turnos anteriores a los últimos keep_turns
+    cuando ya se juntaron `batch`. Regresa la actualización del State ({} si
+    no toca).
+    """
+    old = _foldable_turns(messages, summary_upto, keep_turns, batch)
+    if not old:
+        return {}
+    old_messages = [m for turn in old for m in turn]
+    last_id = getattr(old_messages[-1], "id", None)
+    if not last_id:
+        return {}
+
+    prompt = FOLD_PROMPT.format(
+        previous_summary=summary or "(sin resumen previo)",
+        conversation=_fold_text(old_messages),
+    )
+    result = llm.invoke(prompt)
+    new_summary = _text_of(getattr(result, "content", result)).strip()
+    if not new_summary:
+        return {}
+    print(f"[history_window] {len(old)} turnos plegados en el resumen ({count_tokens(new_summary)} tokens)")
+    return {"history_summary": new_summary, "history_summary_upto": last_id}
+
+
+# ====================================================
+# Plegado en segundo plano
+# ====================================================
+class HistoryFolder:
+    """
+    Corre fold_history() después de responder (un pliegue a la vez por
+    sesión) y guarda el resultado hasta el siguiente turno. take() solo lo
+    entrega si el State sigue en el mismo cursor con el que se calculó.
+    """
+
+    def __init__(self, max_workers: int = 1):
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self._running: Set[str] = set()
+        self._ready: Dict[str, dict] = {}
+        self._pool: Optional[ThreadPoolExecutor] = None
+
+    def submit(
+        self,
+        session_id: Optional[str],
+        messages: List[AnyMessage],
+        summary: Optional[str],
+        summary_upto: Optional[str],
+        llm,
+        keep_turns: int = HISTORY_KEEP_TURNS,
+        batch: int = HISTORY_SUMMARY_BATCH,
+    ) -> Optional[Future]:
+        """Encarga el pliegue si toca; regresa None si no hay nada que hacer."""
+        if not session_id or not _foldable_turns(messages, summary_upto, keep_turns, batch):
+            return None
+        with self._lock:
+            if session_id in self._running:
+                return None
+            self._running.add(session_id)
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="history-fold"
+                )
+        messages = list(messages)
+
+        def _run():
+            try:
+                update = fold_history(messages, summary, summary_upto, llm, keep_turns, batch)
+                if update:
+                    with self._lock:
+                        self._ready.pop(session_id, None)
+                        self._ready[session_id] = {**update, "base_upto": summary_upto}
+                        while len(self._ready) > MAX_READY_FOLDS:
+                            self._ready.pop(next(iter(self._ready)))
+            except Exception as e:
+                print(f"[history_window] Error resumiendo historial de {session_id}: {e}")
+            finally:
+                with self._lock:
+                    self._running.discard(session_id)
+
+        return self._pool.submit(_run)
+
+    def take(self, session_id: Optional[str], summary_upto: Optional[str]) -> dict:
+        """Actualización del State con el pliegue listo ({} si no hay o ya no aplica)."""
+        if not session_id:
+            return {}
+        with self._lock:
+            ready = self._ready.get(session_id)
+            if ready is None:
+                return {}
+            del self._ready[session_id]
+        if ready["base_upto"] != summary_upto:
+            return {}
+        return {
+            "history_summary": ready["history_summary"],
+            "history_summary_upto": ready["history_summary_upto"],
+        }
+
+
+history_folder = HistoryFolder()
@@ -0,0 +1,362 @@
+"""
+Ejecutor local de trabajos pesados (resúmenes, reconstrucción de índices,
+ingestas masivas) fuera del camino de las peticiones de chat.
+
+- enqueue() guarda el trabajo en una tabla SQLite (jobs.sqlite3) y regresa
+  su id de inmediato; puede llamarse desde cualquier hilo o proceso.
+- Cada proceso arranca (una vez) un hilo con su propio loop de asyncio que
+  reclama trabajos en cola de forma atómica y los ejecuta en hilos, con un
+  máximo de JOBS_MAX_CONCURRENCY a la vez. Así un trabajo largo nunca ocupa
+  el loop ni el threadpool de FastAPI.
+- La cancelación es cooperativa: un trabajo en cola se cancela al momento;
+  uno en ejecución ve ctx.cancelled() == True y debe detenerse solo.
+
+Los tipos de trabajo se registran con @register_job("tipo"). Con
+singleton=True solo puede haber uno en cola o corriendo a la vez (entre todos
+los procesos): enqueue() regresa el existente en lugar de crear otro.
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Set
+
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", "jobs.sqlite3")
+# Trabajos ejecutándose a la vez por proceso
+MAX_CONCURRENCY = int(os.getenv("JOBS_MAX_CONCURRENCY", "1"))
+# Cada cuánto se revisa la cola (además del aviso de enqueue)
+POLL_INTERVAL_S = float(os.getenv("JOBS_POLL_INTERVAL_S", "2"))
+# Un trabajo "running" sin latido por este tiempo se da por muerto
+STALE_AFTER_S = float(os.getenv("JOBS_STALE_AFTER_S", "120"))
+HEARTBEAT_S = 10.0
+
+# tipo → función(params, ctx) -> resultado serializable a JSON
+JOB_HANDLERS: Dict[str, Callable[[dict, "JobContext"], Any]] = {}
+# Tipos que no pueden correr dos veces a la vez (comparten estado/checkpoint)
+SINGLETON_KINDS: Set[str] = set()
+
+
+def register_job(kind: str, singleton: bool = False):
+    """Decorador para registrar el manejador de un tipo de trabajo."""
+
+    def decorator(fn):
+        JOB_HANDLERS[kind] = fn
+        if singleton:
+            SINGLETON_KINDS.add(kind)
+        else:
+            SINGLETON_KINDS.discard(kind)
+        return fn
+
+    return decorator
+
+
+class JobContext:
+    """Lo que ve un manejador: su id y si le pidieron cancelar."""
+
+    def __init__(self, runner: "JobRunner", job_id: str):
+        self.runner = runner
+        self.job_id = job_id
+        self._checked_at = 0.0
+        self._cancelled = False
+
+    def cancelled(self) -> bool:
+        # Consulta la tabla como mucho una vez por segundo
+        now = time.monotonic()
+        if not self._cancelled and now - self._checked_at >= 1.0:
+            self._checked_at = now
+            self._cancelled = self.runner._cancel_requested(self.job_id)
+        return self._cancelled
+
+
+class JobRunner:
+    """Tabla de trabajos + hilo despachador con límite de concurrencia."""
+
+    def __init__(self, db_path: str = JOBS_DB_PATH, max_concurrency: int = MAX_CONCURRENCY):
+        self.db_path = db_path
+        self.max_concurrency = max(1, int(max_concurrency))
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._stop = threading.Event()
+        self._running: Dict[str, asyncio.Task] = {}
+        self._schema_ready = False
+
+    # ------------------- tabla -------------------
+    def _connect(self) -> sqlite3.Connection:
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        if not self._schema_ready:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id TEXT PRIMARY KEY,"
+                " kind TEXT NOT NULL,"
+                " params TEXT NOT NULL,"
+                " status TEXT NOT NULL,"
+                " result TEXT,"
+                " error TEXT,"
+                " cancel_requested INTEGER NOT NULL DEFAULT 0,"
+                " created_at REAL NOT NULL,"
+                " started_at REAL,"
+                " finished_at REAL,"
+                " heartbeat_at REAL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at)"
+            )
+            conn.commit()
+            self._schema_ready = True
+        return conn
+
+    @staticmethod
+    def _row_to_dict(row: sqlite3.Row) -> dict:
+        job = dict(row)
+        job["params"] = json.loads(job["params"] or "{}")
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        job["cancel_requested"] = bool(job["cancel_requested"])
+        return job
+
+    def enqueue(self, kind: str, params: Optional[dict] = None) -> str:
+        """
+        Encola un trabajo y regresa su id. ValueError si el tipo no existe.
+        Para tipos singleton regresa el trabajo en cola o corriendo (con latido
+        reciente) si ya hay uno.
+        """
+        if kind not in JOB_HANDLERS:
+            raise ValueError(f"Tipo de trabajo desconocido: {kind}")
+        job_id = uuid.uuid4().hex
+        conn = self._connect()
+        try:
+            # Candado de escritura desde la consulta: otro proceso no puede
+            # insertar entre la búsqueda y el INSERT
+            conn.execute("BEGIN IMMEDIATE")
+            existing = None
+            if kind in SINGLETON_KINDS:
+                existing = conn.execute(
+                    "SELECT id FROM jobs WHERE kind = ?"
+                    " AND (status = 'queued' OR (status = 'running' AND heartbeat_at >= ?))"
+                    " ORDER BY created_at LIMIT 1",
+                    (kind, time.time() - STALE_AFTER_S),
+                ).fetchone()
+            if existing:
+                job_id = existing["id"]
+            else:
+                conn.execute(
+                    "INSERT INTO jobs (id, kind, params, status, created_at) VALUES (?, ?, ?, 'queued', ?)",
+                    (job_id, kind, json.dumps(params or {}, ensure_ascii=False, default=str), time.time()),
+                )
+            conn.commit()
+        finally:
+            conn.close()
+        self.ensure_started()
+        self._notify()
+        return job_id
+
+    def get(self, job_id: str) -> Optional[dict]:
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        finally:
+            conn.close()
+        return self._row_to_dict(row) if row else None
+
+    def list(self, limit: int = 20, status: Optional[str] = None) -> List[dict]:
+        conn = self._connect()
+        try:
+            if status:
+                rows = conn.execute(
+                    "SELECT * FROM jobs WHERE status = ? ORDER BY created_at DESC LIMIT ?",
+                    (status, limit),
+                ).fetchall()
+            else:
+                rows = conn.execute(
+                    "SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)
+                ).fetchall()
+        finally:
+            conn.close()
+        return [self._row_to_dict(r) for r in rows]
+
+    def cancel(self, job_id: str) -> Optional[dict]:
+        """Cancela uno en cola al momento; a uno en ejecución le pide detenerse."""
+        conn = self._connect()
+        try:
+            conn.execute(
+                "UPDATE jobs SET status = 'cancelled', cancel_requested = 1, finished_at = ?"
+                " WHERE id = ? AND status = 'queued'",
+                (time.time(), job_id),
+            )
+            conn.execute(
+                "UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = 'running'",
+                (job_id,),
+            )
+            conn.commit()
+        finally:
+            conn.close()
+        return self.get(job_id)
+
+    def _cancel_requested(self, job_id: str) -> bool:
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        finally:
+            conn.close()
+        return bool(row and row[0])
+
+    def _claim_next(self) -> Optional[dict]:
+        """Toma el trabajo en cola más antiguo (atómico entre procesos)."""
+        conn = self._connect()
+        try:
+            while True:
+                row = conn.execute(
+                    "SELECT id FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+                ).fetchone()
+                if not row:
+                    return None
+                now = time.time()
+                claimed = conn.execute(
+                    "UPDATE jobs SET status = 'running', started_at = ?, heartbeat_at = ?"
+                    " WHERE id = ? AND status = 'queued'",
+                    (now, now, row["id"]),
+                ).rowcount
+                conn.commit()
+                if claimed:
+                    job = conn.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone()
+                    return self._row_to_dict(job)
+                # Otro proceso lo tomó primero; intentar con el siguiente
+        finally:
+            conn.close()
+
+    def _finish(self, job_id: str, status: str, result=None, error: Optional[str] = None) -> None:
+        conn = self._connect()
+        try:
+            conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ?",
+                (
+                    status,
+                    json.dumps(result, ensure_ascii=False, default=str) if result is not None else None,
+                    error,
+                    time.time(),
+                    job_id,
+                ),
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _heartbeat(self) -> None:
+        """Marca como vivos los trabajos de este proceso y cierra los huérfanos."""
+        now = time.time()
+        conn = self._connect()
+        try:
+            if self._running:
+                marks = ",".join("?" * len(self._running))
+                conn.execute(
+                    f"UPDATE jobs SET heartbeat_at = ? WHERE id IN ({marks})",
+                    (now, *self._running.keys()),
+                )
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', error = 'interrupted: worker process stopped',"
+                " finished_at = ? WHERE status = 'running' AND heartbeat_at < ?",
+                (now, now - STALE_AFTER_S),
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    # ------------------- despachador -------------------
+    def ensure_started(self) -> None:
+        """Arranca (una vez por proceso) el hilo despachador."""
+        if self._thread and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=lambda: asyncio.run(self._main()), name="job-runner", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self) -> None:
+        """Pide cancelar lo que corre en este proceso y detiene el hilo."""
+        self._stop.set()
+        for job_id in list(self._running):
+            self.cancel(job_id)
+        self._notify()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def _notify(self) -> None:
+        loop, wake = self._loop, self._wake
+        if loop and wake and not loop.is_closed():
+            try:
+                loop.call_soon_threadsafe(wake.set)
+            except RuntimeError:
+                pass
+
+    def _job_done(self, job_id: str) -> None:
+        # Se liberó un lugar: revisar la cola sin esperar al siguiente sondeo
+        self._running.pop(job_id, None)
+        self._wake.set()
+
+    async def _main(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        last_heartbeat = 0.0
+        while not self._stop.is_set():
+            try:
+                if time.monotonic() - last_heartbeat >= HEARTBEAT_S:
+                    last_heartbeat = time.monotonic()
+                    await asyncio.to_thread(self._heartbeat)
+                while len(self._running) < self.max_concurrency:
+                    job = await asyncio.to_thread(self._claim_next)
+                    if job is None:
+                        break
+                    task = asyncio.create_task(self._run(job))
+                    self._running[job["id"]] = task
+                    task.add_done_callback(
+                        lambda _t, job_id=job["id"]: self._job_done(job_id)
+                    )
+            except Exception as e:
+                print(f"[jobs] Error en el despachador: {e}")
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=POLL_INTERVAL_S)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+        # Dar a los trabajos en curso la oportunidad de ver la cancelación
+        if self._running:
+            await asyncio.wait(list(self._running.values()), timeout=3)
+
+    async def _run(self, job: dict) -> None:
+        job_id, kind = job["id"], job["kind"]
+        handler = JOB_HANDLERS.get(kind)
+        print(f"[jobs] {kind} {job_id} iniciado")
+        if handler is None:
+            self._finish(job_id, "failed", error=f"Tipo de trabajo desconocido: {kind}")
+            return
+        ctx = JobContext(self, job_id)
+        t0 = time.perf_counter()
+        try:
+            result = await asyncio.to_thread(handler, job["params"], ctx)
+            status = "cancelled" if ctx.cancelled() else "succeeded"
+            await asyncio.to_thread(self._finish, job_id, status, result)
+        except Exception as e:
+            print(f"[jobs] {kind} {job_id} falló: {e}")
+            await asyncio.to_thread(self._finish, job_id, "failed", None, str(e))
+            return
+        print(f"[jobs] {kind} {job_id} {status} en {time.perf_counter() - t0:.1f}s")
+
+
+# Ejecutor compartido por el proceso
+runner = JobRunner()
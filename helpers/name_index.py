@@ -0,0 +1,133 @@
+"""
+Índice de trigramas en memoria para resolver nombres de estudiantes.
+
+Reemplaza los `ilike '%nombre%'` (scan completo, sin orden) por una búsqueda
+local, tolerante a acentos y mayúsculas, que regresa candidatos ordenados
+por score. El índice se llena y refresca desde rag/db_access.py.
+"""
+
+import re
+import unicodedata
+from collections import defaultdict
+from typing import Dict, List, Optional, Set
+
+# Score mínimo para considerar un candidato
+MIN_SCORE = 0.45
+
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+
+
+def normalize_name(text: str) -> str:
+    """'  Ana  PÉREZ-López ' -> 'ana perez lopez'"""
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    plain = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return _NON_ALNUM.sub(" ", plain.lower()).strip()
+
+
+def name_contains(full_name: str, query: str) -> bool:
+    """
+    True si la consulta normalizada aparece en el nombre como palabras
+    completas: "ana perez" está en "Ana Pérez López", pero "Hola Ana" no está
+    en "Ana Holguín" ni "Ana" en "Juana".
+    """
+    wanted = normalize_name(query)
+    return bool(wanted) and f" {wanted} " in f" {normalize_name(full_name)} "
+
+
+def trigrams(text: str) -> Set[str]:
+    """Trigramas por palabra, con relleno como pg_trgm ('  ana ')."""
+    grams: Set[str] = set()
+    for word in normalize_name(text).split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class NameIndex:
+    """
+    Índice invertido trigrama → ids. score = 0.8·(trigramas de la consulta
+    presentes en el nombre) + 0.2·similitud de Jaccard, así una consulta
+    parcial ("ana perez") encuentra el nombre completo y, entre varios que la
+    contienen, gana el más parecido.
+    """
+
+    def __init__(self):
+        self.rows: Dict[str, dict] = {}
+        self._grams: Dict[str, Set[str]] = {}
+        self._postings: Dict[str, Set[str]] = defaultdict(set)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def add(self, row: dict) -> None:
+        """Agrega o reemplaza una fila (necesita id y full_name)."""
+        row_id = str(row.get("id") or "")
+        if not row_id:
+            return
+        self.remove(row_id)
+        grams = trigrams(row.get("full_name") or "")
+        if not grams:
+            return
+        self.rows[row_id] = {
+            "id": row.get("id"),
+            "full_name": row.get("full_name"),
+            "email": row.get("email"),
+        }
+        self._grams[row_id] = grams
+        for gram in grams:
+            self._postings[gram].add(row_id)
+
+    def remove(self, row_id: str) -> None:
+        for gram in self._grams.pop(row_id, ()):
+            ids = self._postings.get(gram)
+            if ids is not None:
+                ids.discard(row_id)
+                if not ids:
+                    del self._postings[gram]
+        self.rows.pop(row_id, None)
+
+    def search(self, query: str, limit: int = 5, min_score: float = MIN_SCORE) -> List[dict]:
+        """Candidatos [{id, full_name, email, score}] de mayor a menor score."""
+        q_grams = trigrams(query)
+        if not q_grams:
+            return []
+        hits: Dict[str, int] = defaultdict(int)
+        for gram in q_grams:
+            for row_id in self._postings.get(gram, ()):
+                hits[row_id] += 1
+        scored = []
+        for row_id, shared in hits.items():
+            name_grams = self._grams[row_id]
+            containment = shared / len(q_grams)
+            jaccard = shared / (len(q_grams) + len(name_grams) - shared)
+            score = 0.8 * containment + 0.2 * jaccard
+            if score >= min_score:
+                scored.append((score, row_id))
+        scored.sort(key=lambda item: (-item[0], self.rows[item[1]]["full_name"] or ""))
+        return [
+            {**self.rows[row_id], "score": round(score, 3)} for score, row_id in scored[:limit]
+        ]
+
+    def best(self, query: str, min_score: float = MIN_SCORE) -> Optional[dict]:
+        found = self.search(query, limit=1, min_score=min_score)
+        return found[0] if found else None
+
+    def resolve(self, query: str, unique: bool = False) -> Optional[dict]:
+        """
+        Identidad para `query`: solo filas cuyo nombre contiene la consulta
+        (name_contains); el score únicamente ordena. Una coincidencia exacta
+        gana. Con unique=True (antes de escribir) se exige exacta única o una
+        sola que la contenga; si hay ambigüedad regresa None.
+        """
+        # Contener la consulta implica compartir todos sus trigramas (score >= 0.8)
+        found = [
+            row for row in self.search(query, limit=len(self.rows), min_score=0.8)
+            if name_contains(row["full_name"] or "", query)
+        ]
+        wanted = normalize_name(query)
+        exact = [row for row in found if normalize_name(row["full_name"] or "") == wanted]
+        if not unique:
+            return (exact or found or [None])[0]
+        if exact:
+            return exact[0] if len(exact) == 1 else None
+        return found[0] if len(found) == 1 else None
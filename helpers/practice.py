@@ -0,0 +1,447 @@
+"""
+Árbol de prácticas de un proyecto (tasks → pasos → imágenes) para las
+sesiones con chat_type == "practice".
+
+- Se carga con UNA consulta anidada (db.fetch_project_tree) y se cachea por
+  proyecto con un contador de versión: complete_task_step invalida el
+  proyecto del paso y la siguiente lectura recarga. PROJECT_TREE_TTL_S cubre
+  los cambios hechos fuera del agente.
+- render_practice_context() lo resume en pocas líneas para State
+  ["practice_context"], así el agente sabe dónde va el estudiante sin
+  llamar get_project_tasks/get_task_steps en cada turno.
+- advance_after_completion() es la máquina de estados del avance
+  (current_task_id / current_step_number / practice_completed) que usa el
+  nodo practice_tracker del grafo.
+- project_progress() da el avance agregado para los endpoints de progreso,
+  con un caché corto que complete_task_step invalida.
+"""
+
+import os
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+
+from rag.db_access import db
+
+PROJECT_TREE_TTL_S = float(os.getenv("PROJECT_TREE_TTL_S", "300"))
+# Avance agregado para dashboards (sondeo frecuente)
+PROGRESS_TTL_S = float(os.getenv("PRACTICE_PROGRESS_TTL_S", "15"))
+# Largo máximo de la descripción del paso actual en el contexto
+STEP_DESCRIPTION_CHARS = 220
+
+NO_PRACTICE = "Sin práctica activa."
+
+
+# ====================================================
+# Árbol
+# ====================================================
+def normalize_tree(tasks: List[dict]) -> List[dict]:
+    """
+    Ordena tasks (created_at) y pasos (step_number) y reparte las imágenes:
+    step["images"] las de ese paso, task["images"] todas las de la task.
+    """
+    tree = []
+    for task in tasks or []:
+        task = dict(task)
+        images = list(task.pop("manual_images", None) or [])
+        by_step: Dict[object, List[dict]] = defaultdict(list)
+        for image in images:
+            by_step[image.get("step_number")].append(image)
+        steps = []
+        for step in sorted(
+            task.pop("task_steps", None) or [], key=lambda s: s.get("step_number") or 0
+        ):
+            step = dict(step)
+            step["images"] = by_step.get(step.get("step_number"), [])
+            steps.append(step)
+        task["steps"] = steps
+        task["images"] = images
+        tree.append(task)
+    # Sin created_at quedan al final, en el orden en que llegaron
+    tree.sort(key=lambda t: (t.get("created_at") is None, t.get("created_at") or ""))
+    return tree
+
+
+def task_fields(task: dict) -> dict:
+    """La task sin los hijos anidados (misma forma que get_project_tasks)."""
+    return {k: v for k, v in task.items() if k not in ("steps", "images")}
+
+
+def step_fields(step: dict) -> dict:
+    return {k: v for k, v in step.items() if k != "images"}
+
+
+class ProjectTreeCache:
+    """Árboles por proyecto con versión (invalidación) y TTL."""
+
+    def __init__(self, loader: Callable[[str], List[dict]], ttl_s: float = PROJECT_TREE_TTL_S):
+        self._loader = loader
+        self.ttl_s = ttl_s
+        self._entries: Dict[str, dict] = {}
+        self._versions: Dict[str, int] = defaultdict(int)
+        # step_id / task_id → project_id, para invalidar sin consultar
+        self._step_projects: Dict[str, str] = {}
+        self._task_projects: Dict[str, str] = {}
+        # Cargas en curso (una por proyecto; get() y prefetch() la comparten)
+        self._inflight: Dict[str, Future] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def version(self, project_id: str) -> int:
+        with self._lock:
+            return self._versions[project_id]
+
+    def _fresh(self, project_id: str) -> Optional[dict]:
+        entry = self._entries.get(project_id)
+        if (
+            entry
+            and entry["version"] == self._versions[project_id]
+            and time.monotonic() - entry["loaded_at"] < self.ttl_s
+        ):
+            return entry
+        return None
+
+    def get(self, project_id: str) -> List[dict]:
+        with self._lock:
+            entry = self._fresh(project_id)
+            if entry:
+                return entry["tree"]
+            future, owner = self._start_load(project_id)
+        if owner:
+            self._load(project_id, future)
+        return future.result()
+
+    def prefetch(self, project_id: str) -> None:
+        """Recarga en segundo plano si el árbol no está vigente."""
+        with self._lock:
+            if self._fresh(project_id) or project_id in self._inflight:
+                return
+            future, _ = self._start_load(project_id)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=2, thread_name_prefix="practice-prefetch"
+                )
+        self._executor.submit(self._load, project_id, future)
+
+    def peek(self, project_id: str) -> Optional[List[dict]]:
+        """Último árbol cargado aunque ya no esté vigente (sin consultar)."""
+        with self._lock:
+            entry = self._entries.get(project_id)
+            return entry["tree"] if entry else None
+
+    def _start_load(self, project_id: str) -> Tuple[Future, bool]:
+        # Llamar con el lock tomado
+        future = self._inflight.get(project_id)
+        if future is not None and future.version == self._versions[project_id]:
+            return future, False
+        future = Future()
+        future.version = self._versions[project_id]
+        self._inflight[project_id] = future
+        return future, True
+
+    def _load(self, project_id: str, future: Future) -> None:
+        try:
+            tree = normalize_tree(self._loader(project_id))
+        except BaseException as e:
+            with self._lock:
+                if self._inflight.get(project_id) is future:
+                    del self._inflight[project_id]
+            future.set_exception(e)
+            return
+        with self._lock:
+            if self._inflight.get(project_id) is future:
+                del self._inflight[project_id]
+            # Si alguien invalidó mientras cargábamos, no guardar lo viejo
+            if self._versions[project_id] == future.version:
+                self._entries[project_id] = {
+                    "tree": tree,
+                    "version": future.version,
+                    "loaded_at": time.monotonic(),
+                }
+                for task in tree:
+                    self._task_projects[str(task.get("id"))] = project_id
+                    for step in task["steps"]:
+                        self._step_projects[str(step.get("id"))] = project_id
+        future.set_result(tree)
+
+    def invalidate(
+        self, project_id: Optional[str] = None, step_id: Optional[str] = None
+    ) -> List[str]:
+        """Sube la versión del proyecto (o de todos si no se sabe cuál)."""
+        with self._lock:
+            if project_id is None and step_id is not None:
+                project_id = self._step_projects.get(str(step_id))
+            targets = [project_id] if project_id else list(self._versions.keys() | self._entries.keys())
+            for pid in targets:
+                self._versions[pid] += 1
+            return targets
+
+    def find_task(self, task_id: str) -> Optional[dict]:
+        """La task (con pasos e imágenes) si su proyecto está en caché y vigente."""
+        with self._lock:
+            project_id = self._task_projects.get(str(task_id))
+            entry = self._fresh(project_id) if project_id else None
+            if not entry:
+                return None
+            for task in entry["tree"]:
+                if str(task.get("id")) == str(task_id):
+                    return task
+        return None
+
+
+# Caché compartido por el proceso
+project_trees = ProjectTreeCache(db.fetch_project_tree)
+
+
+# ====================================================
+# Posición y contexto para el prompt
+# ====================================================
+def current_position(
+    tree: List[dict], task_id: Optional[str] = None, step_number: Optional[int] = None
+) -> Tuple[Optional[dict], Optional[dict]]:
+    """
+    (task, paso) actuales: los indicados si existen; si no, la primera task
+    con pasos pendientes y su primer paso pendiente.
+    """
+    task = None
+    if task_id is not None:
+        task = next((t for t in tree if str(t.get("id")) == str(task_id)), None)
+    if task is None:
+        task = next(
+            (t for t in tree if any(not s.get("is_completed") for s in t["steps"])),
+            None,
+        )
+    if task is None:
+        return None, None
+    step = None
+    if step_number is not None:
+        step = next((s for s in task["steps"] if s.get("step_number") == step_number), None)
+    if step is None:
+        step = next((s for s in task["steps"] if not s.get("is_completed")), None)
+    return task, step
+
+
+def next_step(task: dict, step: Optional[dict]) -> Optional[dict]:
+    """Primer paso pendiente después de `step` dentro de la task."""
+    number = (step or {}).get("step_number") or 0
+    return next(
+        (
+            s
+            for s in task["steps"]
+            if (s.get("step_number") or 0) > number and not s.get("is_completed")
+        ),
+        None,
+    )
+
+
+def advance_after_completion(
+    tree: List[dict], completed_step_ids: List[str]
+) -> Optional[Tuple[List[dict], dict]]:
+    """
+    Aplica los pasos recién completados a una copia del árbol y calcula la
+    nueva posición: siguiente paso pendiente de la misma task; si ya no hay,
+    la siguiente task con pendientes; si no queda nada, practice_completed.
+    Regresa (árbol actualizado, campos para State), o None si ninguno de los
+    pasos está en `tree` (árbol viejo: hay que recargarlo, no adivinar).
+    """
+    done = {str(sid) for sid in completed_step_ids}
+    patched, last_task, last_step = [], None, None
+    for task in tree:
+        steps = []
+        for step in task["steps"]:
+            if str(step.get("id")) in done:
+                step = {**step, "is_completed": True}
+                last_task, last_step = task, step
+            steps.append(step)
+        patched.append({**task, "steps": steps})
+
+    if last_task is None:
+        return None
+    task_id = last_task.get("id")
+    task = next(t for t in patched if str(t.get("id")) == str(task_id))
+    step = next_step(task, last_step) or next(
+        (s for s in task["steps"] if not s.get("is_completed")), None
+    )
+    if step is None:
+        task, step = current_position(patched)
+    if task is None or step is None:
+        return patched, {
+            "current_task_id": task_id,
+            "current_step_number": None,
+            "practice_completed": True,
+        }
+    return patched, {
+        "current_task_id": task.get("id"),
+        "current_step_number": step.get("step_number"),
+        "practice_completed": False,
+    }
+
+
+def _progress(task: dict) -> Tuple[int, int]:
+    steps = task["steps"]
+    return sum(1 for s in steps if s.get("is_completed")), len(steps)
+
+
+def render_practice_context(
+    tree: List[dict], task_id: Optional[str] = None, step_number: Optional[int] = None
+) -> str:
+    """Resumen compacto del avance (unas cuantas líneas)."""
+    if not tree:
+        return "Proyecto sin prácticas registradas."
+    done = sum(_progress(t)[0] for t in tree)
+    total = sum(_progress(t)[1] for t in tree)
+    tasks_done = sum(1 for t in tree if t["steps"] and _progress(t)[0] == _progress(t)[1])
+    lines = [f"Avance: {done}/{total} pasos ({tasks_done} de {len(tree)} prácticas completas)"]
+
+    task, step = current_position(tree, task_id, step_number)
+    if task is None:
+        lines.append("Todas las prácticas están completadas.")
+        return "\n".join(lines)
+
+    t_done, t_total = _progress(task)
+    if step is None:
+        lines.append(
+            f"Práctica actual: {task.get('title')} [task_id={task.get('id')}] "
+            f"— {t_done}/{t_total} pasos, todos completados"
+        )
+    else:
+        lines.append(
+            f"Práctica actual: {task.get('title')} [task_id={task.get('id')}] "
+            f"— paso {step.get('step_number')} de {t_total}: {step.get('title')} "
+            f"[step_id={step.get('id')}]"
+        )
+        description = " ".join(str(step.get("description") or "").split())
+        if description:
+            if len(description) > STEP_DESCRIPTION_CHARS:
+                description = description[: STEP_DESCRIPTION_CHARS - 3] + "..."
+            lines.append(f"Guía interna del paso (no copiar literal): {description}")
+        marks = " ".join(
+            f"{s.get('step_number')}"
+            + ("✓" if s.get("is_completed") else "▶" if s is step else "·")
+            for s in task["steps"]
+        )
+        lines.append(f"Pasos: {marks}")
+        following = next_step(task, step)
+        if following is not None:
+            lines.append(
+                f"Siguiente: paso {following.get('step_number')}: {following.get('title')} "
+                f"[step_id={following.get('id')}]"
+            )
+        if step["images"]:
+            lines.append(
+                f"Imágenes del paso: {len(step['images'])} (get_task_step_images si aclaran)"
+            )
+
+    others = [
+        f"{t.get('title')} ({_progress(t)[0]}/{_progress(t)[1]}) [task_id={t.get('id')}]"
+        for t in tree
+        if t is not task
+    ]
+    if others:
+        lines.append("Otras prácticas: " + "; ".join(others))
+    return "\n".join(lines)
+
+
+def practice_context_for(
+    chat_type: Optional[str],
+    project_id: Optional[str],
+    task_id: Optional[str] = None,
+    step_number: Optional[int] = None,
+) -> str:
+    """Texto para State["practice_context"] (NO_PRACTICE fuera de prácticas)."""
+    if (chat_type or "").lower() != "practice" or not project_id:
+        return NO_PRACTICE
+    try:
+        tree = project_trees.get(project_id)
+    except Exception as e:
+        print(f"[practice] Error cargando el proyecto {project_id}: {e}")
+        return "No se pudo cargar el avance de la práctica (usa get_project_tasks)."
+    return render_practice_context(tree, task_id, step_number)
+
+
+# ====================================================
+# Avance agregado (endpoints de progreso)
+# ====================================================
+def _percent(done: int, total: int) -> float:
+    return round(100.0 * done / total, 1) if total else 0.0
+
+
+def summarize_progress(project_id: str, rows: List[dict]) -> dict:
+    """Filas por task (total/completados) → resumen con porcentajes."""
+    tasks = []
+    for row in rows:
+        total = int(row.get("total_steps") or 0)
+        done = int(row.get("completed_steps") or 0)
+        tasks.append(
+            {
+                "task_id": row.get("task_id"),
+                "title": row.get("title"),
+                "total_steps": total,
+                "completed_steps": done,
+                "percent": _percent(done, total),
+                "completed": total > 0 and done >= total,
+            }
+        )
+    total = sum(t["total_steps"] for t in tasks)
+    done = sum(t["completed_steps"] for t in tasks)
+    return {
+        "project_id": project_id,
+        "total_tasks": len(tasks),
+        "completed_tasks": sum(1 for t in tasks if t["completed"]),
+        "total_steps": total,
+        "completed_steps": done,
+        "percent": _percent(done, total),
+        "tasks": tasks,
+        "computed_at": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+class ProgressCache:
+    """
+    Resúmenes por proyecto con TTL corto; invalidate() los descarta. Igual que
+    ProjectTreeCache, una carga que empezó antes de invalidar no se guarda.
+    """
+
+    def __init__(self, loader: Callable[[str], List[dict]], ttl_s: float = PROGRESS_TTL_S):
+        self._loader = loader
+        self.ttl_s = ttl_s
+        self._entries: Dict[str, Tuple[float, dict]] = {}
+        self._versions: Dict[str, int] = defaultdict(int)
+        # Sube con invalidate() sin proyectos (invalida también los no vistos)
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get(self, project_id: str) -> Tuple[dict, bool]:
+        """(resumen, venía_del_caché)"""
+        with self._lock:
+            cached = self._entries.get(project_id)
+            started = (self._generation, self._versions[project_id])
+        if cached and time.monotonic() - cached[0] < self.ttl_s:
+            return cached[1], True
+        summary = summarize_progress(project_id, self._loader(project_id))
+        with self._lock:
+            # Si alguien invalidó mientras cargábamos, no guardar lo viejo
+            if (self._generation, self._versions[project_id]) == started:
+                self._entries[project_id] = (time.monotonic(), summary)
+        return summary, False
+
+    def invalidate(self, project_ids: Optional[List[str]] = None) -> None:
+        with self._lock:
+            if project_ids is None:
+                self._entries.clear()
+                self._generation += 1
+            for pid in project_ids or []:
+                self._entries.pop(pid, None)
+                self._versions[pid] += 1
+
+
+progress_cache = ProgressCache(db.project_progress)
+
+
+def project_progress(project_id: str) -> dict:
+    """Avance agregado del proyecto (con "cached" para depurar el TTL)."""
+    summary, cached = progress_cache.get(project_id)
+    return {**summary, "cached": cached}
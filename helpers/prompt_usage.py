@@ -0,0 +1,60 @@
+"""
+Medición del caché de prompts del proveedor.
+
+OpenAI reporta en usage_metadata cuántos tokens de entrada salieron de su
+caché de prefijos (input_token_details.cache_read). prompt_usage acumula,
+por agente, tokens de entrada y cacheados para ver si el prefijo estático de
+Settings/prompts.py realmente se está reutilizando.
+"""
+
+import threading
+from typing import Dict, Optional
+
+
+def cached_tokens_of(usage: Optional[dict]) -> int:
+    details = (usage or {}).get("input_token_details") or {}
+    return int(details.get("cache_read") or 0)
+
+
+class PromptUsage:
+    """Totales por agente: llamadas, tokens de entrada y tokens cacheados."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals: Dict[str, Dict[str, int]] = {}
+
+    def record(self, agent: str, usage: Optional[dict]) -> dict:
+        """Registra una llamada y regresa sus cifras (para el reporte por turno)."""
+        input_tokens = int((usage or {}).get("input_tokens") or 0)
+        cached = cached_tokens_of(usage)
+        with self._lock:
+            totals = self._totals.setdefault(agent, {"calls": 0, "input_tokens": 0, "cached_tokens": 0})
+            totals["calls"] += 1
+            totals["input_tokens"] += input_tokens
+            totals["cached_tokens"] += cached
+        return {
+            "prompt_tokens": input_tokens or None,
+            "cached_tokens": cached,
+            "cache_ratio": round(cached / input_tokens, 3) if input_tokens else 0.0,
+        }
+
+    def summary(self) -> dict:
+        with self._lock:
+            per_agent = {agent: dict(t) for agent, t in self._totals.items()}
+        for totals in per_agent.values():
+            totals["cache_ratio"] = (
+                round(totals["cached_tokens"] / totals["input_tokens"], 3)
+                if totals["input_tokens"]
+                else 0.0
+            )
+        input_tokens = sum(t["input_tokens"] for t in per_agent.values())
+        cached = sum(t["cached_tokens"] for t in per_agent.values())
+        return {
+            "input_tokens": input_tokens,
+            "cached_tokens": cached,
+            "cache_ratio": round(cached / input_tokens, 3) if input_tokens else 0.0,
+            "agents": per_agent,
+        }
+
+
+prompt_usage = PromptUsage()
@@ -0,0 +1,96 @@
+"""Limitador de requests/tokens por minuto y reintentos con backoff para LLMs."""
+
+import asyncio
+import random
+import time
+from typing import Awaitable, Callable, Optional, TypeVar
+
+T = TypeVar("T")
+
+# Errores de proveedor que vale la pena reintentar (por nombre de clase,
+# para no depender de una versión concreta del SDK de OpenAI)
+RETRYABLE_ERROR_NAMES = {
+    "RateLimitError",
+    "APITimeoutError",
+    "APIConnectionError",
+    "InternalServerError",
+    "ServiceUnavailableError",
+}
+RETRYABLE_STATUS = {408, 409, 429}
+
+
+class AsyncRateLimiter:
+    """
+    Dos token buckets (requests/min y tokens/min) que se rellenan de forma
+    continua. acquire() espera hasta que ambos tengan capacidad; los que
+    esperan se atienden en orden de llegada.
+    """
+
+    def __init__(self, rpm: int, tpm: int):
+        self.rpm = max(1, int(rpm))
+        self.tpm = max(1, int(tpm))
+        self._requests = float(self.rpm)
+        self._tokens = float(self.tpm)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60)
+        self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60)
+
+    async def acquire(self, tokens: int = 0) -> None:
+        """Reserva 1 request y `tokens` tokens (estimados)."""
+        tokens = min(max(0, int(tokens)), self.tpm)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._requests >= 1 and self._tokens >= tokens:
+                    self._requests -= 1
+                    self._tokens -= tokens
+                    return
+                wait_requests = (1 - self._requests) * 60 / self.rpm
+                wait_tokens = (tokens - self._tokens) * 60 / self.tpm
+                await asyncio.sleep(max(wait_requests, wait_tokens, 0.01))
+
+    def record_usage(self, estimated: int, actual: int) -> None:
+        """Corrige el bucket de tokens cuando se conoce el consumo real."""
+        self._refill()
+        self._tokens = min(self.tpm, self._tokens - (actual - estimated))
+
+
+def is_retryable(error: Exception) -> bool:
+    """True para rate limits, timeouts, errores de red y 5xx."""
+    if isinstance(error, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    if type(error).__name__ in RETRYABLE_ERROR_NAMES:
+        return True
+    status = getattr(error, "status_code", None)
+    return isinstance(status, int) and (status in RETRYABLE_STATUS or status >= 500)
+
+
+async def retry_async(
+    fn: Callable[[], Awaitable[T]],
+    attempts: int = 5,
+    base_delay: float = 1.0,
+    max_delay: float = 30.0,
+    retryable: Callable[[Exception], bool] = is_retryable,
+    on_retry: Optional[Callable[[int, Exception, float], None]] = None,
+) -> T:
+    """
+    Ejecuta fn() con reintentos y backoff exponencial con jitter completo
+    (espera aleatoria entre 0 y base·2^intento, con tope max_delay).
+    """
+    for attempt in range(1, attempts + 1):
+        try:
+            return await fn()
+        except Exception as e:
+            if attempt >= attempts or not retryable(e):
+                raise
+            delay = random.uniform(0, min(max_delay, base_delay * 2 ** (attempt - 1)))
+            if on_retry:
+                on_retry(attempt, e, delay)
+            await asyncio.sleep(delay)
+    raise RuntimeError("retry_async: attempts debe ser >= 1")
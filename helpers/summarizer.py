@@ -0,0 +1,388 @@
+"""
+Resumidor jerárquico (map-reduce) para sesiones de chat.
+
+Una sesión que cabe en el presupuesto de tokens se resume con una sola
+llamada. Si no cabe (sesiones de laboratorio con logs pegados), se parte en
+fragmentos de como máximo CHUNK_TOKENS, cada fragmento se resume en paralelo
+(map) y los resúmenes parciales se combinan (reduce), en varios niveles si
+hace falta. Cada llamada reporta sus tokens para llevar la cuenta por
+sesión y el costo contra el presupuesto de la corrida.
+
+Todas las llamadas usan salida estructurada con el esquema ChatSummary
+(helpers/summary_schema.py); una respuesta que no valida se reintenta.
+"""
+
+import asyncio
+import os
+import threading
+from typing import List, Tuple
+
+from helpers.rate_limit import AsyncRateLimiter, is_retryable, retry_async
+from helpers.summary_schema import ChatSummary, summary_text_of, summary_to_text
+
+MODEL = "gpt-4o-mini"
+# Tokens máximos de conversación por llamada (muy por debajo del contexto del
+# modelo para dejar espacio al prompt, al resumen previo y a la salida)
+CHUNK_TOKENS = int(os.getenv("SUMMARY_CHUNK_TOKENS", "12000"))
+# Tokens de salida que se reservan por llamada al estimar
+SUMMARY_OUTPUT_TOKENS = 600
+LLM_MAX_ATTEMPTS = int(os.getenv("SUMMARY_LLM_MAX_ATTEMPTS", "5"))
+# Precios USD por millón de tokens (gpt-4o-mini)
+INPUT_PRICE_PER_1M = float(os.getenv("SUMMARY_INPUT_PRICE_PER_1M", "0.15"))
+OUTPUT_PRICE_PER_1M = float(os.getenv("SUMMARY_OUTPUT_PRICE_PER_1M", "0.60"))
+
+SUMMARY_PROMPT = """Genera un resumen conciso de la siguiente conversación entre un estudiante y un agente educativo.
+El resumen debe capturar:
+- Los temas principales discutidos
+- Las preguntas clave del estudiante
+- Las soluciones o respuestas proporcionadas
+- Cualquier acción o tarea acordada
+- Los robots o equipos del laboratorio mencionados
+
+Conversación:
+{conversation}"""
+
+SUMMARY_FOLD_PROMPT = """Este es el resumen actual de una conversación entre un estudiante y un agente educativo:
+{previous_summary}
+
+Después de ese resumen hubo estos mensajes nuevos:
+{conversation}
+
+Actualiza el resumen incorporando los mensajes nuevos. Conserva lo relevante del resumen anterior.
+El resumen debe capturar:
+- Los temas principales discutidos
+- Las preguntas clave del estudiante
+- Las soluciones o respuestas proporcionadas
+- Cualquier acción o tarea acordada
+- Los robots o equipos del laboratorio mencionados
+
+Devuelve el resumen completo actualizado."""
+
+CHUNK_PROMPT = """El siguiente es el fragmento {part} de {total} de una conversación larga entre un estudiante y un agente educativo.
+Resume solo este fragmento: temas, preguntas del estudiante, soluciones dadas, acciones acordadas y robots mencionados.
+Si hay logs o código pegados, conserva únicamente los errores y datos relevantes.
+
+Fragmento:
+{conversation}
+
+Resumen del fragmento:"""
+
+REDUCE_PROMPT = """Estos son resúmenes parciales, en orden, de una misma conversación entre un estudiante y un agente educativo.
+{previous}Combínalos en un único resumen sin repetir información.
+El resumen debe capturar:
+- Los temas principales discutidos
+- Las preguntas clave del estudiante
+- Las soluciones o respuestas proporcionadas
+- Cualquier acción o tarea acordada
+- Los robots o equipos del laboratorio mencionados
+
+Resúmenes parciales:
+{partials}"""
+
+
+# ====================================================
+# Conteo de tokens
+# ====================================================
+_encoder = None
+_encoder_failed = False
+_encoder_lock = threading.Lock()
+
+
+def _get_encoder():
+    """Encoder de tiktoken del modelo (None si no está disponible)."""
+    global _encoder, _encoder_failed
+    if _encoder is not None or _encoder_failed:
+        return _encoder
+    with _encoder_lock:
+        if _encoder is None and not _encoder_failed:
+            try:
+                import tiktoken
+
+                _encoder = tiktoken.encoding_for_model(MODEL)
+            except Exception as e:
+                # Sin red para bajar el vocabulario: usar la estimación
+                print(f"[summarizer] tiktoken no disponible ({type(e).__name__}); se estiman tokens")
+                _encoder_failed = True
+    return _encoder
+
+
+def count_tokens(text: str) -> int:
+    """Tokens del texto con tiktoken, o ~4 caracteres por token si no hay."""
+    enc = _get_encoder()
+    if enc is not None:
+        return len(enc.encode(text or "", disallowed_special=()))
+    return len(text or "") // 4 + 1
+
+
+def _split_text(text: str, max_tokens: int) -> List[str]:
+    """Parte un texto demasiado largo en pedazos de max_tokens."""
+    enc = _get_encoder()
+    if enc is not None:
+        tokens = enc.encode(text, disallowed_special=())
+        return [
+            enc.decode(tokens[i:i + max_tokens])
+            for i in range(0, len(tokens), max_tokens)
+        ]
+    step = max_tokens * 4
+    return [text[i:i + step] for i in range(0, len(text), step)]
+
+
+def format_message(msg: dict) -> str:
+    role = msg.get("role", "unknown")
+    content = msg.get("content", "")
+    return f"{role.upper()}: {content}"
+
+
+def conversation_text(messages: List[dict]) -> str:
+    return "\n\n".join(format_message(m) for m in messages)
+
+
+def split_conversation(messages: List[dict], max_tokens: int = CHUNK_TOKENS) -> List[str]:
+    """
+    Agrupa mensajes consecutivos en fragmentos de como máximo max_tokens.
+    Un mensaje que solo ya excede el presupuesto se parte en varios.
+    """
+    chunks: List[str] = []
+    current: List[str] = []
+    current_tokens = 0
+    for msg in messages:
+        text = format_message(msg)
+        tokens = count_tokens(text)
+        pieces = [text] if tokens <= max_tokens else _split_text(text, max_tokens)
+        for piece in pieces:
+            piece_tokens = tokens if len(pieces) == 1 else count_tokens(piece)
+            if current and current_tokens + piece_tokens > max_tokens:
+                chunks.append("\n\n".join(current))
+                current, current_tokens = [], 0
+            current.append(piece)
+            current_tokens += piece_tokens
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+def build_summary_prompt(messages: List[dict], previous_summary=None) -> str:
+    """Prompt de resumen inicial, o de plegado si ya hay resumen anterior."""
+    conversation = conversation_text(messages)
+    if not previous_summary:
+        return SUMMARY_PROMPT.format(conversation=conversation)
+    return SUMMARY_FOLD_PROMPT.format(
+        previous_summary=summary_text_of(previous_summary), conversation=conversation
+    )
+
+
+# ====================================================
+# Cuenta de tokens y presupuesto
+# ====================================================
+class TokenUsage:
+    """Tokens de entrada/salida y llamadas acumulados."""
+
+    def __init__(self):
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.calls = 0
+
+    def add(self, input_tokens: int, output_tokens: int) -> None:
+        self.input_tokens += input_tokens
+        self.output_tokens += output_tokens
+        self.calls += 1
+
+    def merge(self, other: "TokenUsage") -> None:
+        self.input_tokens += other.input_tokens
+        self.output_tokens += other.output_tokens
+        self.calls += other.calls
+
+    def cost(self) -> float:
+        return estimate_cost(self.input_tokens, self.output_tokens)
+
+    def as_dict(self) -> dict:
+        return {
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "calls": self.calls,
+            "cost_usd": round(self.cost(), 6),
+        }
+
+
+def estimate_cost(input_tokens: int, output_tokens: int) -> float:
+    """Costo en USD según los precios configurados."""
+    return (
+        input_tokens * INPUT_PRICE_PER_1M + output_tokens * OUTPUT_PRICE_PER_1M
+    ) / 1_000_000
+
+
+class CostBudget:
+    """
+    Presupuesto de costo de una corrida. Antes de resumir una sesión se
+    reserva su costo estimado; al terminar se ajusta al costo real. Si una
+    sesión ya no cabe, el presupuesto queda agotado y el job se detiene.
+    0 = sin límite.
+    """
+
+    def __init__(self, max_cost_usd: float = 0.0):
+        self.max_cost_usd = max(0.0, float(max_cost_usd or 0.0))
+        self.spent = 0.0
+        self.reserved = 0.0
+        self.exhausted = False
+
+    def try_reserve(self, estimated_cost: float) -> bool:
+        if self.max_cost_usd and self.spent + self.reserved + estimated_cost > self.max_cost_usd:
+            self.exhausted = True
+            return False
+        self.reserved += estimated_cost
+        return True
+
+    def settle(self, estimated_cost: float, actual_cost: float) -> None:
+        self.reserved = max(0.0, self.reserved - estimated_cost)
+        self.spent += actual_cost
+
+
+def estimate_session_tokens(messages: List[dict], previous_summary=None) -> Tuple[int, int]:
+    """Tokens (entrada, salida) estimados de resumir una sesión (map + reduce)."""
+    chunks = split_conversation(messages)
+    prompt_overhead = count_tokens(SUMMARY_FOLD_PROMPT) + count_tokens(
+        summary_text_of(previous_summary) if previous_summary else ""
+    )
+    input_tokens = sum(count_tokens(c) for c in chunks) + prompt_overhead * len(chunks)
+    output_tokens = SUMMARY_OUTPUT_TOKENS * len(chunks)
+    if len(chunks) > 1:
+        # La(s) llamada(s) de reduce leen las salidas del map
+        input_tokens += output_tokens + prompt_overhead
+        output_tokens += SUMMARY_OUTPUT_TOKENS
+    return input_tokens, output_tokens
+
+
+def estimate_session_cost(messages: List[dict], previous_summary=None) -> float:
+    """Costo estimado de resumir una sesión antes de hacerlo."""
+    return estimate_cost(*estimate_session_tokens(messages, previous_summary))
+
+
+# ====================================================
+# Map-reduce
+# ====================================================
+class SummaryValidationError(ValueError):
+    """La respuesta del LLM no cumple el esquema ChatSummary."""
+
+
+def _retryable(error: Exception) -> bool:
+    return is_retryable(error) or isinstance(error, SummaryValidationError)
+
+
+async def _call_llm(
+    structured_llm, limiter: AsyncRateLimiter, prompt: str, usage: TokenUsage, label: str
+) -> ChatSummary:
+    """
+    Una llamada con salida estructurada bajo el limitador, con reintentos y
+    registro de tokens (también de los intentos que no validan).
+    """
+    prompt_tokens = count_tokens(prompt)
+    reserved = prompt_tokens + SUMMARY_OUTPUT_TOKENS
+
+    async def call():
+        await limiter.acquire(reserved)
+        result = await structured_llm.ainvoke(prompt)
+        meta = getattr(result.get("raw"), "usage_metadata", None) or {}
+        input_tokens = meta.get("input_tokens") or prompt_tokens
+        output_tokens = meta.get("output_tokens") or SUMMARY_OUTPUT_TOKENS
+        usage.add(input_tokens, output_tokens)
+        limiter.record_usage(reserved, input_tokens + output_tokens)
+        parsed = result.get("parsed")
+        if not isinstance(parsed, ChatSummary):
+            raise SummaryValidationError(str(result.get("parsing_error") or "sin resultado"))
+        return parsed
+
+    def on_retry(attempt: int, error: Exception, delay: float) -> None:
+        print(
+            f"[summarizer] Retry {attempt} for {label} "
+            f"in {delay:.1f}s: {type(error).__name__}: {error}"
+        )
+
+    return await retry_async(
+        call, attempts=LLM_MAX_ATTEMPTS, retryable=_retryable, on_retry=on_retry
+    )
+
+
+async def _reduce(
+    structured_llm,
+    limiter: AsyncRateLimiter,
+    partials: List[ChatSummary],
+    previous_summary,
+    usage: TokenUsage,
+    label: str,
+    max_tokens: int,
+) -> ChatSummary:
+    """Combina resúmenes parciales; por niveles si no caben en una llamada."""
+    level = 0
+    while True:
+        texts = [summary_to_text(p) for p in partials]
+        groups: List[List[str]] = [[]]
+        group_tokens = 0
+        for text in texts:
+            t = count_tokens(text)
+            if groups[-1] and group_tokens + t > max_tokens:
+                groups.append([])
+                group_tokens = 0
+            groups[-1].append(text)
+            group_tokens += t
+        final = len(groups) == 1
+
+        def prompt_for(group: List[str]) -> str:
+            previous = ""
+            if final and previous_summary:
+                previous = (
+                    "Resumen anterior de la misma conversación (incorpóralo):\n"
+                    f"{summary_text_of(previous_summary)}\n\n"
+                )
+            body = "\n\n".join(f"[{i}] {p}" for i, p in enumerate(group, 1))
+            return REDUCE_PROMPT.format(previous=previous, partials=body)
+
+        results = await asyncio.gather(
+            *(
+                _call_llm(
+                    structured_llm, limiter, prompt_for(g), usage, f"{label} reduce L{level}"
+                )
+                for g in groups
+            )
+        )
+        if final:
+            return results[0]
+        partials = list(results)
+        level += 1
+
+
+async def summarize_conversation(
+    llm,
+    limiter: AsyncRateLimiter,
+    messages: List[dict],
+    previous_summary=None,
+    label: str = "session",
+    max_tokens: int = CHUNK_TOKENS,
+) -> Tuple[ChatSummary, TokenUsage]:
+    """
+    Resume (o pliega en previous_summary) los mensajes. Regresa el resumen
+    validado y los tokens gastados. Los fragmentos del map van en paralelo.
+    """
+    usage = TokenUsage()
+    structured_llm = llm.with_structured_output(ChatSummary, include_raw=True)
+    chunks = split_conversation(messages, max_tokens)
+    if len(chunks) <= 1:
+        prompt = build_summary_prompt(messages, previous_summary)
+        return await _call_llm(structured_llm, limiter, prompt, usage, label), usage
+
+    print(f"[summarizer] {label}: {len(chunks)} fragmentos (map-reduce)")
+    partials = await asyncio.gather(
+        *(
+            _call_llm(
+                structured_llm,
+                limiter,
+                CHUNK_PROMPT.format(part=i, total=len(chunks), conversation=chunk),
+                usage,
+                f"{label} chunk {i}",
+            )
+            for i, chunk in enumerate(chunks, 1)
+        )
+    )
+    summary = await _reduce(
+        structured_llm, limiter, list(partials), previous_summary, usage, label, max_tokens
+    )
+    return summary, usage
@@ -0,0 +1,635 @@
+"""
+Job nocturno de resúmenes de chat: chat_message → chat_summary.
+
+Lee los mensajes en streaming con paginación por keyset sobre
+(session_id, created_at, id) y arma una sesión a la vez, así que la memoria
+usada no depende del volumen total de mensajes. Las sesiones se resumen en
+paralelo con N workers async, respetando los límites de requests/tokens por
+minuto del modelo y aislando los fallos por sesión.
+
+Los resúmenes son incrementales: chat_summary guarda una marca de agua
+(summarized_until = created_at del último mensaje incorporado). Solo los
+mensajes posteriores a la marca se mandan al LLM, junto con el resumen
+anterior, para producir el resumen actualizado de toda la sesión.
+Columnas requeridas: ver sql/chat_summary_incremental.sql.
+
+Las sesiones demasiado largas se resumen por map-reduce (helpers/summarizer.py).
+Cada corrida reporta tokens por sesión y se detiene al agotar
+SUMMARY_MAX_COST_USD; las sesiones pendientes quedan para la siguiente.
+Los resúmenes se guardan como JSON compacto validado contra ChatSummary
+(helpers/summary_schema.py).
+
+El avance se guarda en un checkpoint local (SUMMARY_CHECKPOINT_PATH): si el
+proceso muere, la siguiente corrida retoma después de la última sesión
+terminada y reintenta primero las que fallaron o se difirieron por costo. Los mensajes se borran por lotes de ids, solo cuando el upsert
+de su resumen quedó confirmado. Con dry_run solo se reporta lo que haría.
+"""
+
+import asyncio
+import json
+import os
+import time
+import uuid
+from collections import Counter, deque
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from langchain_openai import ChatOpenAI
+
+from helpers.rate_limit import AsyncRateLimiter
+from helpers.summarizer import (
+    MODEL,
+    CostBudget,
+    TokenUsage,
+    estimate_cost,
+    estimate_session_cost,
+    estimate_session_tokens,
+    summarize_conversation,
+)
+from helpers.summary_schema import to_storage
+
+# Filas de chat_message por request a Supabase
+PAGE_SIZE = int(os.getenv("SUMMARY_PAGE_SIZE", "1000"))
+# Cada cuántos segundos se imprime el progreso
+PROGRESS_EVERY_S = float(os.getenv("SUMMARY_PROGRESS_EVERY_S", "10"))
+# Workers LLM concurrentes y límites del modelo (gpt-4o-mini por defecto)
+CONCURRENCY = int(os.getenv("SUMMARY_CONCURRENCY", "4"))
+LLM_RPM = int(os.getenv("SUMMARY_LLM_RPM", "500"))
+LLM_TPM = int(os.getenv("SUMMARY_LLM_TPM", "200000"))
+# Costo máximo (USD) por corrida; 0 = sin límite
+MAX_COST_USD = float(os.getenv("SUMMARY_MAX_COST_USD", "0"))
+
+MESSAGE_COLUMNS = "id, session_id, role, content, created_at"
+SUMMARY_COLUMNS = "session_id, summary_json, summarized_until, message_count"
+# Ids de chat_message acumulados antes de borrar (el DAL parte el filtro in_)
+DELETE_CHUNK = int(os.getenv("SUMMARY_DELETE_CHUNK", "200"))
+# Estado de la corrida para poder retomarla
+CHECKPOINT_PATH = os.getenv("SUMMARY_CHECKPOINT_PATH", "summary_job_state.json")
+# Sesiones por consulta al releer las que quedaron para reintento
+RETRY_CHUNK = 100
+
+# ====================================================
+# Lectura en streaming
+# ====================================================
+def _quote(value) -> str:
+    """Entrecomilla un valor para filtros or_() de PostgREST."""
+    return '"' + str(value).replace('"', '\\"') + '"'
+
+
+def _keyset_filter(cursor: Tuple[str, str, object]) -> str:
+    """Filas estrictamente después de (session_id, created_at, id)."""
+    sid, created_at, msg_id = (_quote(v) for v in cursor)
+    return (
+        f"session_id.gt.{sid},"
+        f"and(session_id.eq.{sid},created_at.gt.{created_at}),"
+        f"and(session_id.eq.{sid},created_at.eq.{created_at},id.gt.{msg_id})"
+    )
+
+
+def iter_message_pages(
+    dal,
+    page_size: int = PAGE_SIZE,
+    after_session: Optional[str] = None,
+    only_sessions: Optional[List[str]] = None,
+) -> Iterator[List[dict]]:
+    """
+    Páginas de chat_message ordenadas por (session_id, created_at, id).
+    dal: rag.db_access.DataAccess (llamadas síncronas, fuera de su loop).
+    after_session: empezar después de esa sesión (para retomar una corrida).
+    only_sessions: leer solo esas sesiones (reintentos de una corrida).
+    """
+    cursor = None
+    while True:
+        def build(t, cursor=cursor):
+            q = t.select(MESSAGE_COLUMNS).not_.is_("session_id", "null")
+            if after_session:
+                q = q.gt("session_id", after_session)
+            if only_sessions is not None:
+                q = q.in_("session_id", only_sessions)
+            if cursor:
+                q = q.or_(_keyset_filter(cursor))
+            return q.order("session_id").order("created_at").order("id").limit(page_size)
+
+        rows = dal.query("chat_message", build)
+        if not rows:
+            return
+        yield rows
+        if len(rows) < page_size:
+            return
+        last = rows[-1]
+        cursor = (last["session_id"], last["created_at"], last["id"])
+
+
+def iter_sessions(
+    pages: Iterator[List[dict]],
+    on_page: Optional[Callable[[List[dict]], None]] = None,
+) -> Iterator[Tuple[str, List[dict]]]:
+    """
+    Agrupa el stream de mensajes en sesiones consecutivas. Solo mantiene en
+    memoria la sesión en curso (más la página actual).
+    """
+    current_id, current = None, []
+    for page in pages:
+        if on_page:
+            on_page(page)
+        for msg in page:
+            sid = msg.get("session_id")
+            if not sid:
+                continue
+            if sid != current_id:
+                if current:
+                    yield current_id, current
+                current_id, current = sid, []
+            current.append(msg)
+    if current:
+        yield current_id, current
+
+
+# ====================================================
+# Marca de agua por sesión
+# ====================================================
+def _parse_ts(value) -> Optional[datetime]:
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        dt = value
+    else:
+        try:
+            dt = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    return dt if dt.tzinfo else dt.replace(tzinfo=ZoneInfo("UTC"))
+
+
+def fetch_existing_summaries(dal, session_ids: List[str]) -> Dict[str, dict]:
+    """Resumen actual y marca de agua de cada sesión (las que ya tengan)."""
+    return dal.fetch_summaries(session_ids, SUMMARY_COLUMNS)
+
+
+def new_messages_since(messages: List[dict], existing: Optional[dict]) -> List[dict]:
+    """Mensajes posteriores a la marca de agua (todos si no hay resumen)."""
+    mark = _parse_ts((existing or {}).get("summarized_until"))
+    if mark is None:
+        return messages
+    fresh = []
+    for msg in messages:
+        created = _parse_ts(msg.get("created_at"))
+        if created is None or created > mark:
+            fresh.append(msg)
+    return fresh
+
+
+# ====================================================
+# Checkpoint
+# ====================================================
+class JobCheckpoint:
+    """
+    Estado de una corrida en un JSON local (escritura atómica):
+    run_id, cursor (última sesión tal que todas las anteriores ya se
+    procesaron), las sesiones terminadas fuera de orden después del cursor y
+    `retry`: las que fallaron o se difirieron por costo. Los workers terminan
+    en desorden; el cursor solo avanza por el prefijo contiguo de sesiones
+    procesadas, y las de `retry` se releen al retomar (retry_sessions()).
+    """
+
+    def __init__(self, path: str = CHECKPOINT_PATH):
+        self.path = path
+        self.run_id = uuid.uuid4().hex[:12]
+        self.started_at = datetime.now(ZoneInfo("UTC")).isoformat()
+        self.status = "running"
+        self.cursor: Optional[str] = None
+        self.completed: set = set()
+        self.retry: set = set()
+        self.resumed = False
+        self._order: deque = deque()
+        # Reintentos de la corrida anterior (se procesan fuera del cursor)
+        self._retrying: set = set()
+
+    def load(self) -> bool:
+        """Carga una corrida interrumpida. True si hay algo que retomar."""
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return False
+        if data.get("status") != "running":
+            return False
+        self.run_id = data.get("run_id") or self.run_id
+        self.started_at = data.get("started_at") or self.started_at
+        self.cursor = data.get("cursor")
+        self.completed = set(data.get("completed") or [])
+        self.retry = set(data.get("retry") or [])
+        self._retrying = set(self.retry)
+        self.resumed = True
+        return True
+
+    def save(self) -> None:
+        data = {
+            "run_id": self.run_id,
+            "started_at": self.started_at,
+            "updated_at": datetime.now(ZoneInfo("UTC")).isoformat(),
+            "status": self.status,
+            "cursor": self.cursor,
+            "completed": sorted(self.completed),
+            "retry": sorted(self.retry),
+        }
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+    def is_done(self, session_id: str) -> bool:
+        """Ya procesada, o se relee aparte como reintento."""
+        return session_id in self.completed or session_id in self._retrying
+
+    def retry_sessions(self) -> List[str]:
+        """Sesiones fallidas/diferidas de la corrida anterior, para releerlas primero."""
+        return sorted(self._retrying)
+
+    def started(self, session_id: str) -> None:
+        """El productor entregó esta sesión (en orden de lectura)."""
+        if session_id not in self._retrying:
+            self._order.append(session_id)
+
+    def done(self, session_id: str, ok: bool = True) -> None:
+        """
+        Un worker terminó la sesión. ok=False (fallida o diferida) la deja en
+        `retry` para que una corrida retomada la vuelva a intentar.
+        """
+        if ok:
+            self.retry.discard(session_id)
+        else:
+            self.retry.add(session_id)
+        if session_id in self._retrying:
+            # Reintento: no participa en el cursor
+            self._retrying.discard(session_id)
+        else:
+            self.completed.add(session_id)
+            while self._order and self._order[0] in self.completed:
+                self.cursor = self._order.popleft()
+                self.completed.discard(self.cursor)
+        self.save()
+
+    def finish(self) -> None:
+        self.status = "completed"
+        self.save()
+
+
+# ====================================================
+# Progreso
+# ====================================================
+class JobProgress:
+    """Cuenta sesiones/mensajes y reporta tasas (por segundo) periódicamente."""
+
+    def __init__(self, every_s: float = PROGRESS_EVERY_S):
+        self.every_s = every_s
+        self.started = time.monotonic()
+        self.last_report = self.started
+        self.sessions = 0
+        self.messages = 0
+
+    def add(self, sessions: int = 0, messages: int = 0) -> None:
+        """Suma trabajo hecho y reporta si ya pasó el intervalo."""
+        self.sessions += sessions
+        self.messages += messages
+        now = time.monotonic()
+        if now - self.last_report >= self.every_s:
+            self.last_report = now
+            print(self.line())
+
+    def rates(self) -> Dict[str, float]:
+        """Tiempo transcurrido y tasas promedio."""
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        return {
+            "elapsed_s": round(elapsed, 2),
+            "sessions_per_s": round(self.sessions / elapsed, 3),
+            "messages_per_s": round(self.messages / elapsed, 3),
+        }
+
+    def line(self) -> str:
+        """Línea legible de progreso."""
+        r = self.rates()
+        return (
+            f"[summary_job] {self.sessions} sessions ({r['sessions_per_s']}/s), "
+            f"{self.messages} messages ({r['messages_per_s']}/s) "
+            f"in {r['elapsed_s']}s"
+        )
+
+
+# ====================================================
+# Job
+# ====================================================
+async def run_summary_job_async(
+    page_size: int = PAGE_SIZE,
+    concurrency: int = CONCURRENCY,
+    rpm: int = LLM_RPM,
+    tpm: int = LLM_TPM,
+    max_cost_usd: float = MAX_COST_USD,
+    dry_run: bool = False,
+    resume: bool = True,
+    checkpoint_path: str = CHECKPOINT_PATH,
+    should_stop: Optional[Callable[[], bool]] = None,
+) -> dict:
+    """
+    Pipeline: un productor lee sesiones en streaming (en un hilo, la lectura
+    paginada es síncrona) y las pone en una cola acotada; `concurrency` workers pliegan
+    los mensajes nuevos de cada una en su resumen y guardan el resultado.
+    Un fallo en una sesión no detiene a las demás.
+
+    dry_run: no llama al LLM ni escribe; reporta tokens estimados y filas
+    que se borrarían. resume: retomar la corrida interrumpida si la hay.
+    should_stop: si regresa True se deja de leer; lo ya encolado termina.
+    """
+    # Import diferido: Settings.tools importa este módulo
+    from rag.db_access import db
+    from rag.rag_logic import index_chat_summary
+
+    concurrency = max(1, int(concurrency))
+    stats = {
+        "total_sessions": 0,
+        "total_messages": 0,
+        "new_messages": 0,
+        "successful": 0,
+        "skipped": 0,
+        "deferred": 0,
+        "failed": 0,
+        "session_ids": [],
+        "deleted_messages": 0,
+        "concurrency": concurrency,
+        "dry_run": dry_run,
+    }
+    checkpoint = JobCheckpoint(checkpoint_path)
+    if not dry_run:
+        if resume and checkpoint.load():
+            print(
+                f"Resuming run {checkpoint.run_id} after session {checkpoint.cursor} "
+                f"({len(checkpoint.completed)} later sessions already done, "
+                f"{len(checkpoint.retry)} to retry)"
+            )
+        checkpoint.save()
+    stats["run_id"] = checkpoint.run_id
+    stats["resumed"] = checkpoint.resumed
+    progress = JobProgress()
+    session_emails: Dict[str, Optional[str]] = {}
+    existing_summaries: Dict[str, dict] = {}
+    # Ids de mensajes cuyo resumen ya quedó guardado, pendientes de borrar
+    pending_delete: List = []
+    delete_lock = asyncio.Lock()
+    estimated = {"input_tokens": 0, "output_tokens": 0}
+    # dry_run: se borraría todo lo leído de las sesiones resumidas u omitidas
+    rows_to_delete = 0
+    llm = ChatOpenAI(model=MODEL, temperature=0)
+    limiter = AsyncRateLimiter(rpm=rpm, tpm=tpm)
+    budget = CostBudget(max_cost_usd)
+    run_usage = TokenUsage()
+    session_usage: Dict[str, dict] = {}
+    # Analítica de la corrida a partir de los campos estructurados
+    topic_counts: Counter = Counter()
+    robot_counts: Counter = Counter()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+
+    def prefetch_page(page: List[dict]) -> None:
+        # Un request por página (emails y resúmenes) para sus sesiones nuevas
+        new_ids = list(
+            {m["session_id"] for m in page if m.get("session_id")} - session_emails.keys()
+        )
+        found = db.fetch_session_emails(new_ids)
+        for sid in new_ids:
+            session_emails[sid] = found.get(sid)
+        existing_summaries.update(fetch_existing_summaries(db, new_ids))
+
+    def message_pages() -> Iterator[List[dict]]:
+        # Primero los reintentos de la corrida anterior, luego lo que sigue al cursor
+        retry_ids = checkpoint.retry_sessions()
+        for i in range(0, len(retry_ids), RETRY_CHUNK):
+            yield from iter_message_pages(
+                db, page_size, only_sessions=retry_ids[i:i + RETRY_CHUNK]
+            )
+        yield from iter_message_pages(db, page_size, after_session=checkpoint.cursor)
+
+    sessions = iter_sessions(message_pages(), on_page=prefetch_page)
+
+    def next_session():
+        while True:
+            item = next(sessions, None)
+            if item is None:
+                return None
+            session_id, messages = item
+            if not checkpoint.is_done(session_id):
+                break
+            session_emails.pop(session_id, None)
+            existing_summaries.pop(session_id, None)
+        return (
+            session_id,
+            messages,
+            session_emails.pop(session_id, None),
+            existing_summaries.pop(session_id, None),
+        )
+
+    async def producer() -> None:
+        try:
+            while not budget.exhausted:
+                if should_stop and should_stop():
+                    stats["stopped"] = True
+                    print("Stop requested; finishing queued sessions.")
+                    break
+                item = await asyncio.to_thread(next_session)
+                if item is None:
+                    break
+                stats["total_sessions"] += 1
+                stats["total_messages"] += len(item[1])
+                checkpoint.started(item[0])
+                await queue.put(item)
+        except Exception as e:
+            print("Fatal error reading chat messages:", e)
+            stats["fatal_error"] = str(e)
+        finally:
+            for _ in range(concurrency):
+                await queue.put(None)
+
+    async def flush_deletes(force: bool = False) -> None:
+        async with delete_lock:
+            while pending_delete and (force or len(pending_delete) >= DELETE_CHUNK):
+                chunk = pending_delete[:DELETE_CHUNK]
+                del pending_delete[:DELETE_CHUNK]
+                try:
+                    await db.adelete_messages(chunk)
+                    stats["deleted_messages"] += len(chunk)
+                except Exception as e:
+                    # Quedan para la siguiente corrida (la marca de agua evita
+                    # volver a resumirlos)
+                    stats["delete_errors"] = stats.get("delete_errors", 0) + 1
+                    print(f"Error deleting {len(chunk)} messages:", e)
+
+    async def worker() -> None:
+        nonlocal rows_to_delete
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            session_id, messages, email, existing = item
+            interrupted = False
+            # Solo éxito u omisión la dan por terminada; si no, queda para reintento
+            ok = False
+            try:
+                fresh = new_messages_since(messages, existing)
+                if not fresh:
+                    # Ya incorporados en una corrida anterior (p.ej. falló el borrado)
+                    ok = True
+                    stats["skipped"] += 1
+                    if dry_run:
+                        rows_to_delete += len(messages)
+                    else:
+                        pending_delete.extend(m["id"] for m in messages)
+                        await flush_deletes()
+                    continue
+
+                previous_summary = (existing or {}).get("summary_json")
+                estimated_cost = estimate_session_cost(fresh, previous_summary)
+                if not budget.try_reserve(estimated_cost):
+                    # Sin presupuesto: sus mensajes se quedan para otra corrida
+                    stats["deferred"] += 1
+                    continue
+
+                if dry_run:
+                    in_tokens, out_tokens = estimate_session_tokens(fresh, previous_summary)
+                    estimated["input_tokens"] += in_tokens
+                    estimated["output_tokens"] += out_tokens
+                    budget.settle(estimated_cost, estimated_cost)
+                    rows_to_delete += len(messages)
+                    stats["new_messages"] += len(fresh)
+                    stats["successful"] += 1
+                    stats["session_ids"].append(session_id)
+                    continue
+                try:
+                    summary, usage = await summarize_conversation(
+                        llm, limiter, fresh, previous_summary, label=f"session {session_id}"
+                    )
+                except Exception:
+                    budget.settle(estimated_cost, 0.0)
+                    raise
+                budget.settle(estimated_cost, usage.cost())
+                run_usage.merge(usage)
+                session_usage[session_id] = usage.as_dict()
+                summary_json = to_storage(summary)
+                updated_at = datetime.now(ZoneInfo("America/Monterrey")).isoformat()
+                summarized_until = fresh[-1]["created_at"]
+                message_count = int((existing or {}).get("message_count") or 0) + len(fresh)
+
+                saved = await db.aupsert_summary(
+                    {
+                        "session_id": session_id,
+                        "summary_json": summary_json,
+                        "updated_at": updated_at,
+                        "summarized_until": summarized_until,
+                        "message_count": message_count,
+                    }
+                )
+                if not saved:
+                    raise RuntimeError("chat_summary upsert was not confirmed")
+                stats["new_messages"] += len(fresh)
+                # Todo lo leído de la sesión ya está en el resumen guardado
+                pending_delete.extend(m["id"] for m in messages)
+
+                # Embebido una sola vez, al escribirlo, en la memoria del estudiante
+                try:
+                    index_chat_summary(session_id, email, summary, updated_at)
+                except Exception as e:
+                    print(f"Error indexing summary for session {session_id}:", e)
+
+                topic_counts.update(t.lower() for t in summary.topics)
+                robot_counts.update(summary.robots_mentioned)
+                ok = True
+                stats["successful"] += 1
+                stats["session_ids"].append(session_id)
+                print(f"Summary created for session {session_id}")
+                await flush_deletes()
+
+            except Exception as e:
+                stats["failed"] += 1
+                print(f"Error summarizing session {session_id}:", e)
+            except BaseException:
+                # Cancelado / proceso terminando: la sesión NO cuenta como hecha
+                interrupted = True
+                raise
+            finally:
+                progress.add(sessions=1, messages=len(messages))
+                if not dry_run and not interrupted:
+                    checkpoint.done(session_id, ok)
+
+    await asyncio.gather(producer(), *(worker() for _ in range(concurrency)))
+    if not dry_run:
+        await flush_deletes(force=True)
+        if "fatal_error" not in stats:
+            checkpoint.finish()
+    stats.update(progress.rates())
+    stats["tokens"] = run_usage.as_dict()
+    stats["session_tokens"] = session_usage
+    stats["top_topics"] = topic_counts.most_common(10)
+    stats["robots_mentioned"] = dict(robot_counts.most_common())
+    if budget.exhausted:
+        print(
+            f"Cost budget of ${budget.max_cost_usd:.2f} reached "
+            f"(spent ${budget.spent:.4f}); remaining sessions deferred."
+        )
+
+    if stats["total_sessions"] == 0:
+        print("No messages to process")
+        return stats
+
+    if dry_run:
+        stats["estimated_tokens"] = dict(estimated)
+        stats["estimated_cost_usd"] = round(
+            estimate_cost(estimated["input_tokens"], estimated["output_tokens"]), 6
+        )
+        stats["rows_to_delete"] = rows_to_delete
+        print(
+            f"[dry-run] {stats['successful']} sessions to summarize "
+            f"({stats['new_messages']} new messages, {stats['skipped']} up to date, "
+            f"{stats['deferred']} over budget). Estimated tokens: "
+            f"{estimated['input_tokens']} in / {estimated['output_tokens']} out "
+            f"(${stats['estimated_cost_usd']:.4f})."
+        )
+        return stats
+
+    print(progress.line())
+    print(
+        f"Completed: {stats['successful']}/{stats['total_sessions']} "
+        f"({stats['skipped']} already up to date, {stats['new_messages']} new messages)."
+    )
+    print(
+        f"Tokens: {run_usage.input_tokens} in / {run_usage.output_tokens} out "
+        f"in {run_usage.calls} calls (${run_usage.cost():.4f})."
+    )
+
+    print(f"Deleted {stats['deleted_messages']} summarized messages.")
+
+    return stats
+
+
+def run_summary_job(
+    page_size: int = PAGE_SIZE,
+    concurrency: int = CONCURRENCY,
+    dry_run: bool = False,
+    resume: bool = True,
+    should_stop: Optional[Callable[[], bool]] = None,
+) -> dict:
+    """
+    Proceso batch: incorpora los mensajes nuevos de cada sesión a su resumen
+    en chat_summary y borra los mensajes ya incorporados.
+    """
+    try:
+        return asyncio.run(
+            run_summary_job_async(
+                page_size=page_size,
+                concurrency=concurrency,
+                dry_run=dry_run,
+                resume=resume,
+                should_stop=should_stop,
+            )
+        )
+    except Exception as e:
+        print("Fatal error in run_summary_job:", e)
+        return {"total_sessions": 0, "successful": 0, "failed": 0, "session_ids": [],
+                "fatal_error": str(e)}
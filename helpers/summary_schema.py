@@ -0,0 +1,116 @@
+"""
+Esquema de los resúmenes de sesión que se guardan en chat_summary.summary_json.
+
+El LLM responde con salida estructurada (with_structured_output) y el
+resultado se valida aquí antes de guardarse, así que quien lea un resumen
+recibe siempre los mismos campos sin volver a parsear ni resumir.
+"""
+
+import json
+from typing import List, Optional
+
+from pydantic import BaseModel, Field, ValidationError, field_validator
+
+SUMMARY_SCHEMA_VERSION = 1
+# Topes para que el JSON guardado se mantenga compacto
+MAX_ITEMS = 8
+MAX_ITEM_CHARS = 240
+
+
+class ChatSummary(BaseModel):
+    """Resumen estructurado de una sesión entre un estudiante y el agente."""
+
+    topics: List[str] = Field(
+        default_factory=list, description="Temas principales discutidos"
+    )
+    questions: List[str] = Field(
+        default_factory=list, description="Preguntas clave del estudiante"
+    )
+    solutions: List[str] = Field(
+        default_factory=list, description="Soluciones o respuestas proporcionadas"
+    )
+    actions: List[str] = Field(
+        default_factory=list, description="Acciones o tareas acordadas"
+    )
+    robots_mentioned: List[str] = Field(
+        default_factory=list,
+        description="Robots o equipos del laboratorio mencionados (nombre corto)",
+    )
+
+    @field_validator("*", mode="before")
+    @classmethod
+    def _clean_items(cls, value):
+        if value is None:
+            return []
+        if isinstance(value, str):
+            value = [value]
+        items, seen = [], set()
+        for item in value:
+            text = " ".join(str(item).split())
+            if not text:
+                continue
+            if len(text) > MAX_ITEM_CHARS:
+                text = text[: MAX_ITEM_CHARS - 3] + "..."
+            key = text.lower()
+            if key in seen:
+                continue
+            seen.add(key)
+            items.append(text)
+        return items[:MAX_ITEMS]
+
+    @field_validator("robots_mentioned")
+    @classmethod
+    def _normalize_robots(cls, value: List[str]) -> List[str]:
+        return [v.lower() for v in value]
+
+
+def to_storage(summary: ChatSummary) -> dict:
+    """Dict compacto para summary_json (sin listas vacías, con versión)."""
+    data = {k: v for k, v in summary.model_dump().items() if v}
+    data["v"] = SUMMARY_SCHEMA_VERSION
+    return data
+
+
+def parse_summary(value) -> Optional[ChatSummary]:
+    """
+    Lee un summary_json guardado (dict o texto JSON). Regresa None si es un
+    resumen viejo en texto libre que no cumple el esquema.
+    """
+    if value is None:
+        return None
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            return None
+    if not isinstance(value, dict):
+        return None
+    fields = {k: v for k, v in value.items() if k in ChatSummary.model_fields}
+    if not fields:
+        return None
+    try:
+        return ChatSummary(**fields)
+    except ValidationError:
+        return None
+
+
+def summary_to_text(summary: ChatSummary) -> str:
+    """Versión legible (para embeddings y para el contexto del agente)."""
+    sections = [
+        ("Temas", summary.topics),
+        ("Preguntas", summary.questions),
+        ("Soluciones", summary.solutions),
+        ("Acciones", summary.actions),
+        ("Robots", summary.robots_mentioned),
+    ]
+    return "\n".join(f"{title}: {'; '.join(items)}" for title, items in sections if items)
+
+
+def summary_text_of(value) -> str:
+    """Texto de un summary_json cualquiera (estructurado o texto libre)."""
+    parsed = parse_summary(value)
+    if parsed is not None:
+        return summary_to_text(parsed)
+    if value is None:
+        return ""
+    return value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
@@ -0,0 +1,218 @@
+"""
+Almacén lateral de resultados de tools desalojados del historial.
+
+Los ToolMessage de recuperación (RAG, web, pasos de práctica) se quedaban en
+`messages` para siempre: se reenviaban en cada llamada al LLM y engordaban el
+checkpoint. Cuando el agente ya respondió, evict_tool_outputs() guarda el
+contenido completo aquí (SQLite local) y regresa reemplazos con el MISMO id
+(add_messages los sustituye) que solo llevan una referencia compacta: tool,
+ids relevantes y una línea de resumen. La tool recall_tool_output recupera
+el contenido si vuelve a hacer falta.
+"""
+
+import json
+import os
+import re
+import sqlite3
+import time
+from typing import List, Optional
+
+from langchain_core.messages import AnyMessage, ToolMessage
+
+from helpers.summarizer import count_tokens
+
+TOOL_STORE_PATH = os.getenv("TOOL_STORE_PATH", "tool_outputs.sqlite3")
+# Días que se conserva un resultado desalojado
+TOOL_STORE_TTL_DAYS = float(os.getenv("TOOL_STORE_TTL_DAYS", "30"))
+# Resultados más chicos que esto se quedan tal cual en el historial
+EVICT_MIN_TOKENS = int(os.getenv("TOOL_EVICT_MIN_TOKENS", "300"))
+EVICTABLE_TOOLS = {
+    "retrieve_context",
+    "retrieve_robot_support",
+    "web_research",
+    "web_research_multi",
+    "get_task_steps",
+    # Lo recuperado vuelve a desalojarse al terminar el turno
+    "recall_tool_output",
+}
+
+REF_PREFIX = "TOOL_REF::"
+GIST_CHARS = 160
+MAX_REF_IDS = 8
+
+_ID_PATTERNS = [
+    re.compile(r"\b(?:step_id|task_id|doc_id)=([\w-]+)"),
+    re.compile(r'"id":\s*"([\w-]+)"'),
+]
+
+
+# ====================================================
+# Almacenamiento
+# ====================================================
+class ToolOutputStore:
+    """ref (tool_call_id) → contenido completo del ToolMessage."""
+
+    def __init__(self, db_path: str = TOOL_STORE_PATH):
+        self.db_path = db_path
+        self._schema_ready = False
+
+    def _connect(self) -> sqlite3.Connection:
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        if not self._schema_ready:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS tool_outputs ("
+                " ref TEXT PRIMARY KEY,"
+                " session_id TEXT,"
+                " tool_name TEXT NOT NULL,"
+                " content TEXT NOT NULL,"
+                " artifact TEXT,"
+                " created_at REAL NOT NULL)"
+            )
+            conn.commit()
+            self._schema_ready = True
+        return conn
+
+    def put_many(self, rows: List[dict]) -> None:
+        if not rows:
+            return
+        conn = self._connect()
+        try:
+            conn.executemany(
+                "INSERT OR REPLACE INTO tool_outputs"
+                " (ref, session_id, tool_name, content, artifact, created_at)"
+                " VALUES (:ref, :session_id, :tool_name, :content, :artifact, :created_at)",
+                rows,
+            )
+            conn.execute(
+                "DELETE FROM tool_outputs WHERE created_at < ?",
+                (time.time() - TOOL_STORE_TTL_DAYS * 86400,),
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def get(self, ref: str, session_id: Optional[str]) -> Optional[dict]:
+        """Solo regresa resultados guardados por la misma sesión."""
+        if not session_id:
+            return None
+        conn = self._connect()
+        conn.row_factory = sqlite3.Row
+        try:
+            row = conn.execute(
+                "SELECT * FROM tool_outputs WHERE ref = ? AND session_id = ?", (ref, session_id)
+            ).fetchone()
+        finally:
+            conn.close()
+        return dict(row) if row else None
+
+
+# ====================================================
+# Referencias compactas
+# ====================================================
+def _content_text(content) -> str:
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return " ".join(
+            str(item.get("text", "")) if isinstance(item, dict) else str(item) for item in content
+        )
+    return str(content)
+
+
+def _gist(text: str) -> str:
+    """Una línea que dice de qué trataba el resultado."""
+    stripped = text.strip()
+    if stripped.startswith("WEB_CONTEXT::"):
+        for line in stripped.splitlines():
+            if line.startswith("RESPUESTA_SINTESIS:"):
+                stripped = line.split(":", 1)[1]
+                break
+    elif stripped.startswith("["):
+        try:
+            items = json.loads(stripped)
+        except ValueError:
+            items = None
+        if isinstance(items, list):
+            titles = [str(i.get("title")) for i in items if isinstance(i, dict) and i.get("title")]
+            stripped = f"{len(items)} elementos" + (": " + "; ".join(titles[:3]) if titles else "")
+    line = next((l.strip() for l in stripped.splitlines() if l.strip()), "")
+    return line if len(line) <= GIST_CHARS else line[:GIST_CHARS - 3] + "..."
+
+
+def _ref_ids(text: str, artifact) -> List[str]:
+    ids = []
+    if isinstance(artifact, dict):
+        ids.extend(str(i) for i in artifact.get("doc_ids") or [])
+    for pattern in _ID_PATTERNS:
+        ids.extend(pattern.findall(text))
+    return list(dict.fromkeys(ids))[:MAX_REF_IDS]
+
+
+def compact_reference(msg: ToolMessage, text: str) -> str:
+    ids = _ref_ids(text, msg.artifact)
+    return (
+        f"{REF_PREFIX}tool={msg.name} ref={msg.tool_call_id}"
+        + (f" ids={','.join(ids)}" if ids else "")
+        + f"\nResumen: {_gist(text) or 'sin contenido'}"
+        + "\n(Resultado completo: recall_tool_output(ref))"
+    )
+
+
+def output_row(msg: ToolMessage, text: str, session_id: Optional[str]) -> dict:
+    """Fila de tool_outputs para el contenido `text` de un ToolMessage."""
+    return {
+        "ref": msg.tool_call_id,
+        "session_id": session_id,
+        "tool_name": msg.name,
+        "content": text,
+        "artifact": json.dumps(msg.artifact, ensure_ascii=False, default=str)
+        if msg.artifact is not None
+        else None,
+        "created_at": time.time(),
+    }
+
+
+def evict_tool_outputs(
+    messages: List[AnyMessage],
+    session_id: Optional[str],
+    store: ToolOutputStore,
+    min_tokens: int = EVICT_MIN_TOKENS,
+) -> List[ToolMessage]:
+    """
+    Guarda en `store` los resultados voluminosos aún presentes y regresa sus
+    reemplazos (mismo id). Los que no se pudieron guardar no se desalojan.
+    """
+    rows, replacements = [], []
+    for msg in messages:
+        if not isinstance(msg, ToolMessage) or msg.name not in EVICTABLE_TOOLS or not msg.id:
+            continue
+        text = _content_text(msg.content)
+        if text.startswith(REF_PREFIX) or count_tokens(text) < min_tokens:
+            continue
+        rows.append(output_row(msg, text, session_id))
+        replacements.append(
+            msg.model_copy(
+                update={
+                    "content": compact_reference(msg, text),
+                    # doc_ids se quedan (los usa el caché de recuperación)
+                    "artifact": {**msg.artifact, "evicted": True}
+                    if isinstance(msg.artifact, dict)
+                    else {"evicted": True},
+                }
+            )
+        )
+    if not rows:
+        return []
+    try:
+        store.put_many(rows)
+    except Exception as e:
+        print(f"[tool_store] Error guardando resultados desalojados: {e}")
+        return []
+    return replacements
+
+
+tool_outputs = ToolOutputStore()
@@ -0,0 +1,231 @@
+"""
+Caché persistente para web_research (Tavily).
+
+- La llave es la consulta normalizada (sin acentos, mayúsculas ni signos,
+  conservando el orden de las palabras) + depth, max_results y time_filter,
+  así "¿Cómo calibrar un KUKA KR 6?" y "como calibrar un kuka kr 6"
+  comparten entrada, pero "ABB vs KUKA" y "KUKA vs ABB" no.
+- Se guarda el payload WEB_CONTEXT ya compactado (no la respuesta cruda de
+  Tavily); web_research_multi guarda los resultados en JSON bajo otro
+  namespace. Los errores nunca se guardan.
+- El TTL depende de time_filter: una búsqueda del último día caduca mucho
+  antes que una sin ventana temporal.
+- Stale-while-revalidate: después de caducar se sirve la entrada vieja y se
+  refresca en segundo plano (una sola vez por llave) durante
+  min(WEB_CACHE_STALE_S, TTL), así una búsqueda del último día nunca se
+  sirve con más de dos TTL de antigüedad.
+- El almacenamiento es intercambiable: cualquier objeto con get/set como
+  SQLiteWebStore (p. ej. uno sobre Redis para compartirlo entre procesos).
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Set, Tuple
+
+from helpers.name_index import normalize_name
+
+WEB_CACHE_PATH = os.getenv("WEB_CACHE_PATH", "web_cache.sqlite3")
+WEB_CACHE_ENABLED = os.getenv("WEB_CACHE_ENABLED", "1") != "0"
+# Ventana extra en la que se sirve una entrada caducada mientras se refresca
+WEB_CACHE_STALE_S = float(os.getenv("WEB_CACHE_STALE_S", str(24 * 3600)))
+
+# time_filter → TTL en segundos (None = sin ventana temporal)
+TTL_BY_TIME_FILTER: Dict[Optional[str], float] = {
+    "d": 3600.0,
+    "w": 6 * 3600.0,
+    "m": 24 * 3600.0,
+    "y": 7 * 24 * 3600.0,
+    None: float(os.getenv("WEB_CACHE_TTL_S", str(7 * 24 * 3600))),
+}
+
+
+def normalize_query(query: str) -> str:
+    """'¿Cómo calibrar un KUKA KR 6?' -> 'como calibrar un kuka kr 6'"""
+    return normalize_name(query)
+
+
+def cache_key(
+    query: str,
+    depth: str,
+    max_results: int,
+    time_filter: Optional[str],
+    namespace: str = "context",
+) -> str:
+    raw = "|".join([namespace, normalize_query(query), depth, str(max_results), time_filter or ""])
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def ttl_for(time_filter: Optional[str]) -> float:
+    return TTL_BY_TIME_FILTER.get(time_filter, TTL_BY_TIME_FILTER[None])
+
+
+def stale_window(ttl_s: float, stale_s: float = WEB_CACHE_STALE_S) -> float:
+    """Ventana stale proporcional al TTL (nunca mayor que el TTL mismo)."""
+    return min(stale_s, ttl_s)
+
+
+def is_cacheable(payload: str) -> bool:
+    return bool(payload) and not payload.startswith("WEB_CONTEXT::ERROR::")
+
+
+# ====================================================
+# Almacenamiento
+# ====================================================
+class SQLiteWebStore:
+    """key → (payload, stored_at, ttl_s) en una tabla SQLite local."""
+
+    def __init__(self, db_path: str = WEB_CACHE_PATH):
+        self.db_path = db_path
+        self._schema_ready = False
+
+    def _connect(self) -> sqlite3.Connection:
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        if not self._schema_ready:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS web_cache ("
+                " key TEXT PRIMARY KEY,"
+                " query TEXT NOT NULL,"
+                " payload TEXT NOT NULL,"
+                " stored_at REAL NOT NULL,"
+                " ttl_s REAL NOT NULL)"
+            )
+            conn.commit()
+            self._schema_ready = True
+        return conn
+
+    def get(self, key: str) -> Optional[Tuple[str, float, float]]:
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT payload, stored_at, ttl_s FROM web_cache WHERE key = ?", (key,)
+            ).fetchone()
+        finally:
+            conn.close()
+        return tuple(row) if row else None
+
+    def set(self, key: str, query: str, payload: str, ttl_s: float) -> None:
+        conn = self._connect()
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO web_cache (key, query, payload, stored_at, ttl_s)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (key, query, payload, time.time(), ttl_s),
+            )
+            # Limpieza oportunista de lo que ya ni como "stale" sirve
+            conn.execute(
+                "DELETE FROM web_cache WHERE stored_at + ttl_s + MIN(ttl_s, ?) < ?",
+                (WEB_CACHE_STALE_S, time.time()),
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+
+# ====================================================
+# Caché
+# ====================================================
+class WebResearchCache:
+    """Consulta → payload WEB_CONTEXT, con TTL, stale-while-revalidate y métricas."""
+
+    def __init__(self, store=None, stale_s: float = WEB_CACHE_STALE_S, enabled: bool = WEB_CACHE_ENABLED):
+        self.store = store if store is not None else SQLiteWebStore()
+        self.stale_s = stale_s
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._refreshing: Set[str] = set()
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._stats = {"hits": 0, "stale_hits": 0, "misses": 0, "errors": 0}
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        served = stats["hits"] + stats["stale_hits"]
+        lookups = served + stats["misses"]
+        stats["hit_rate"] = round(served / lookups, 3) if lookups else 0.0
+        return stats
+
+    def _read(self, key: str) -> Optional[Tuple[str, float, float]]:
+        try:
+            return self.store.get(key)
+        except Exception as e:
+            print(f"[web_cache] Error leyendo caché: {e}")
+            return None
+
+    def _write(self, key: str, query: str, payload: str, ttl_s: float) -> None:
+        try:
+            self.store.set(key, query, payload, ttl_s)
+        except Exception as e:
+            print(f"[web_cache] Error guardando caché: {e}")
+
+    def _revalidate(self, key: str, query: str, ttl_s: float, fetch: Callable[[], str]) -> None:
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="web-cache")
+
+        def _run():
+            try:
+                payload = fetch()
+                if is_cacheable(payload):
+                    self._write(key, query, payload, ttl_s)
+            except Exception as e:
+                print(f"[web_cache] Error revalidando '{query}': {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        self._pool.submit(_run)
+
+    def get_or_fetch(
+        self,
+        query: str,
+        depth: str,
+        max_results: int,
+        time_filter: Optional[str],
+        fetch: Callable[[], str],
+        namespace: str = "context",
+    ) -> str:
+        """
+        Payload en caché (fresco o stale) o el resultado de fetch(). namespace
+        separa formatos de payload distintos para la misma búsqueda.
+        """
+        if not self.enabled:
+            return fetch()
+        key = cache_key(query, depth, max_results, time_filter, namespace)
+        ttl_s = ttl_for(time_filter)
+        entry = self._read(key)
+        if entry:
+            payload, stored_at, stored_ttl = entry
+            age = time.time() - stored_at
+            if age < stored_ttl:
+                self._count("hits")
+                return payload
+            if age < stored_ttl + stale_window(stored_ttl, self.stale_s):
+                self._count("stale_hits")
+                self._revalidate(key, query, ttl_s, fetch)
+                return payload
+
+        self._count("misses")
+        payload = fetch()
+        if is_cacheable(payload):
+            self._write(key, query, payload, ttl_s)
+        else:
+            self._count("errors")
+        return payload
+
+
+web_cache = WebResearchCache()
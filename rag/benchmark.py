@@ -0,0 +1,366 @@
+"""
+Benchmark de recuperación para las tools RAG.
+
+Construye una colección de Chroma a partir de robot_problems.csv más filas
+sintéticas (1k/10k/100k), corre consultas etiquetadas con la misma
+búsqueda que usan las tools (rag.search.semantic_search) y reporta
+latencia p50/p95, recall@k, MRR y memoria. Los resultados se guardan en
+JSON para comparar corridas.
+
+Por defecto corre offline con HashingEmbeddings:
+
+    python -m rag.benchmark --scale 1000 --scale 10000 --k 3 --fetch-k 8
+    python -m rag.benchmark --scale 1000 --compare bench_results/anterior.json
+"""
+
+import argparse
+import csv
+import json
+import math
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from rag.documents import robot_support_document
+from rag.embeddings import HashingEmbeddings
+from rag.search import DEFAULT_K, default_fetch_k, semantic_search
+
+CSV_PATH = "robot_problems.csv"
+RESULTS_DIR = "bench_results"
+
+# Vocabulario para filas sintéticas (combinaciones robot × componente × síntoma)
+_ROBOTS = [
+    "ABB IRB 120", "ABB IRB 1200", "KUKA KR 6", "KUKA KR 10", "Fanuc M-10iA",
+    "Fanuc LR Mate", "UR5e", "UR10e", "Yaskawa GP8", "Epson T6",
+    "Kawasaki RS007", "Denso VS-060", "Staubli TX2-60", "Doosan M1013",
+]
+_COMPONENTS = [
+    "servo motor", "encoder", "gripper", "teach pendant", "safety relay",
+    "cooling fan", "brake", "controller cabinet", "vacuum cup", "joint 3 reducer",
+    "ethernet module", "power supply", "limit switch", "tool flange",
+]
+_SYMPTOMS = [
+    ("does not respond", "no response to motion commands"),
+    ("overheating", "temperature alarm after long operation"),
+    ("position deviation", "drift larger than tolerance during calibration"),
+    ("communication loss", "intermittent link drop with the PLC"),
+    ("unexpected stop", "emergency stop triggered without operator action"),
+    ("abnormal noise", "grinding sound while moving at high speed"),
+    ("collision alarm", "false collision detection on light payloads"),
+    ("battery low", "backup battery warning on startup"),
+]
+_FIXES = [
+    "Check the wiring and connectors",
+    "Replace the damaged part",
+    "Run the mastering routine again",
+    "Update the controller firmware",
+    "Clean and re-seat the module",
+    "Adjust the payload configuration",
+]
+
+
+# ====================================================
+# Datos
+# ====================================================
+def load_csv_rows(path: str = CSV_PATH) -> List[dict]:
+    """Lee robot_problems.csv como lista de dicts."""
+    if not os.path.exists(path):
+        return []
+    with open(path, newline="", encoding="utf-8") as f:
+        return list(csv.DictReader(f))
+
+
+def synthetic_rows(n: int, seed: int = 42) -> List[dict]:
+    """Genera n filas sintéticas con el mismo esquema que robot_problems.csv."""
+    rng = random.Random(seed)
+    rows = []
+    for i in range(n):
+        robot = rng.choice(_ROBOTS)
+        component = rng.choice(_COMPONENTS)
+        symptom, detail = rng.choice(_SYMPTOMS)
+        fix = rng.choice(_FIXES)
+        rows.append(
+            {
+                "created_at": f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+                "robot_type": robot,
+                "problem_title": f"{component} {symptom} (case {i})",
+                "problem_description": (
+                    f"The {component} of the {robot} shows {detail}. Ticket {i}."
+                ),
+                "solution_description": f"{fix} of the {component}.",
+                "author": f"Engineer {chr(65 + i % 26)}",
+            }
+        )
+    return rows
+
+
+def build_documents(rows: List[dict]) -> Tuple[List[Document], List[str]]:
+    """Convierte filas a Document con ids estables (row-<n>)."""
+    docs = [robot_support_document(r) for r in rows]
+    ids = [f"row-{i}" for i in range(len(rows))]
+    for doc, doc_id in zip(docs, ids):
+        # El wrapper de Chroma no siempre devuelve Document.id en las búsquedas
+        doc.metadata["bench_id"] = doc_id
+    return docs, ids
+
+
+def labelled_queries(
+    rows: List[dict], n_csv: int, n_queries: int, seed: int = 7
+) -> List[Tuple[str, str]]:
+    """
+    Consultas etiquetadas (query, id relevante). Cada fila del CSV aporta una
+    consulta; el resto se muestrea de las sintéticas parafraseando
+    robot + componente + síntoma, como lo escribiría un estudiante.
+    """
+    queries: List[Tuple[str, str]] = []
+    for i, r in enumerate(rows[:n_csv]):
+        queries.append(
+            (
+                f"{r.get('robot_type')} {r.get('problem_title')}: "
+                f"{r.get('problem_description')}",
+                f"row-{i}",
+            )
+        )
+
+    rng = random.Random(seed)
+    synthetic_idx = list(range(n_csv, len(rows)))
+    rng.shuffle(synthetic_idx)
+    for i in synthetic_idx[: max(0, n_queries - len(queries))]:
+        r = rows[i]
+        queries.append(
+            (
+                f"my {r['robot_type']} has a problem: {r['problem_description']}",
+                f"row-{i}",
+            )
+        )
+    return queries
+
+
+# ====================================================
+# Métricas
+# ====================================================
+def percentile(values: List[float], p: float) -> float:
+    """Percentil con interpolación lineal (p en 0..100)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    pos = (len(ordered) - 1) * p / 100.0
+    lo, hi = math.floor(pos), math.ceil(pos)
+    if lo == hi:
+        return ordered[lo]
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (pos - lo)
+
+
+def recall_at_k(ranked_ids: List[str], relevant_id: str, k: int) -> float:
+    """1.0 si el documento relevante está en los primeros k."""
+    return 1.0 if relevant_id in ranked_ids[:k] else 0.0
+
+
+def reciprocal_rank(ranked_ids: List[str], relevant_id: str) -> float:
+    """1/posición del documento relevante (0 si no aparece)."""
+    for pos, doc_id in enumerate(ranked_ids, 1):
+        if doc_id == relevant_id:
+            return 1.0 / pos
+    return 0.0
+
+
+def _max_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reporta KB, macOS bytes
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+# ====================================================
+# Corrida
+# ====================================================
+def _make_embeddings(kind: str):
+    if kind == "hashing":
+        return HashingEmbeddings()
+    if kind == "openai":
+        from langchain_openai import OpenAIEmbeddings
+
+        return OpenAIEmbeddings()
+    raise ValueError(f"Embeddings desconocidos: {kind}")
+
+
+def run_scale(
+    scale: int,
+    k: int = DEFAULT_K,
+    fetch_k: Optional[int] = None,
+    search_type: str = "mmr",
+    n_queries: int = 200,
+    embeddings: str = "hashing",
+    seed: int = 42,
+) -> Dict:
+    """Construye la colección a la escala pedida, corre las consultas y mide."""
+    from langchain_community.vectorstores import Chroma
+
+    csv_rows = load_csv_rows()
+    rows = csv_rows + synthetic_rows(max(0, scale - len(csv_rows)), seed=seed)
+    docs, ids = build_documents(rows)
+    queries = labelled_queries(rows, len(csv_rows), n_queries)
+    fetch_k = fetch_k or default_fetch_k(k)
+
+    tmp_dir = tempfile.mkdtemp(prefix="rag_bench_")
+    tracemalloc.start()
+    try:
+        t0 = time.perf_counter()
+        vs = Chroma(
+            collection_name=f"bench_{scale}",
+            embedding_function=_make_embeddings(embeddings),
+            persist_directory=tmp_dir,
+        )
+        batch = 1000
+        for start in range(0, len(docs), batch):
+            vs.add_documents(docs[start:start + batch], ids=ids[start:start + batch])
+        build_s = time.perf_counter() - t0
+        _, build_peak = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+
+        latencies_ms: List[float] = []
+        recalls: List[float] = []
+        rrs: List[float] = []
+        for query, relevant in queries:
+            q0 = time.perf_counter()
+            hits = semantic_search(
+                vs, query, k=k, fetch_k=fetch_k, search_type=search_type
+            )
+            latencies_ms.append((time.perf_counter() - q0) * 1000)
+            ranked = [d.id or d.metadata.get("bench_id") for d in hits]
+            recalls.append(recall_at_k(ranked, relevant, k))
+            rrs.append(reciprocal_rank(ranked, relevant))
+        _, query_peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    n = len(queries) or 1
+    return {
+        "scale": len(rows),
+        "queries": len(queries),
+        "build_s": round(build_s, 3),
+        "latency_ms": {
+            "p50": round(percentile(latencies_ms, 50), 3),
+            "p95": round(percentile(latencies_ms, 95), 3),
+            "mean": round(sum(latencies_ms) / n, 3),
+        },
+        f"recall@{k}": round(sum(recalls) / n, 4),
+        "mrr": round(sum(rrs) / n, 4),
+        "memory_mb": {
+            "build_peak_py": round(build_peak / (1024 * 1024), 2),
+            "query_peak_py": round(query_peak / (1024 * 1024), 2),
+            "max_rss": round(_max_rss_mb(), 2),
+        },
+    }
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return (
+            subprocess.check_output(
+                ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL
+            )
+            .decode()
+            .strip()
+        )
+    except Exception:
+        return None
+
+
+def compare(current: Dict, previous: Dict) -> List[str]:
+    """Líneas legibles con la diferencia por escala entre dos corridas."""
+    prev_by_scale = {r["scale"]: r for r in previous.get("results", [])}
+    k = current["config"]["k"]
+    lines = []
+    for r in current.get("results", []):
+        p = prev_by_scale.get(r["scale"])
+        if not p:
+            continue
+        lines.append(
+            f"scale={r['scale']}: "
+            f"p95 {p['latency_ms']['p95']} → {r['latency_ms']['p95']} ms, "
+            f"recall@{k} {p.get(f'recall@{k}')} → {r[f'recall@{k}']}, "
+            f"mrr {p['mrr']} → {r['mrr']}"
+        )
+    return lines
+
+
+def main(argv: Optional[List[str]] = None) -> Dict:
+    """Punto de entrada CLI."""
+    parser = argparse.ArgumentParser(description="Benchmark de recuperación RAG")
+    parser.add_argument("--scale", type=int, action="append",
+                        help="Número de filas (repetible). Default: 1000")
+    parser.add_argument("--k", type=int, default=DEFAULT_K)
+    parser.add_argument("--fetch-k", type=int, default=None)
+    parser.add_argument("--search-type", choices=["mmr", "similarity"], default="mmr")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--embeddings", choices=["hashing", "openai"], default="hashing")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", default=None, help="Ruta del JSON de resultados")
+    parser.add_argument("--compare", default=None, help="JSON de una corrida previa")
+    args = parser.parse_args(argv)
+
+    scales = args.scale or [1000]
+    config = {
+        "k": args.k,
+        "fetch_k": args.fetch_k or default_fetch_k(args.k),
+        "search_type": args.search_type,
+        "queries": args.queries,
+        "embeddings": args.embeddings,
+        "seed": args.seed,
+    }
+    results = []
+    for scale in scales:
+        print(f"[rag.benchmark] scale={scale} ...")
+        r = run_scale(
+            scale,
+            k=args.k,
+            fetch_k=args.fetch_k,
+            search_type=args.search_type,
+            n_queries=args.queries,
+            embeddings=args.embeddings,
+            seed=args.seed,
+        )
+        print(
+            f"  p50={r['latency_ms']['p50']}ms p95={r['latency_ms']['p95']}ms "
+            f"recall@{args.k}={r[f'recall@{args.k}']} mrr={r['mrr']} "
+            f"rss={r['memory_mb']['max_rss']}MB"
+        )
+        results.append(r)
+
+    report = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "git_revision": _git_revision(),
+        "config": config,
+        "results": results,
+    }
+
+    out = args.out or os.path.join(
+        RESULTS_DIR, f"rag_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"[rag.benchmark] Resultados guardados en {out}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            previous = json.load(f)
+        for line in compare(report, previous):
+            print("  " + line)
+
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,46 @@
-from supabase import create_client, Client
-from langchain_core.documents import Document
-import pandas as pd
+"""
+Capa única de acceso a Supabase.
+
+- Un solo cliente async de Supabase por proceso, sobre un httpx.AsyncClient
+  compartido (pool con keep-alive y HTTP/2 si está instalado `h2`).
+- El cliente vive en un loop propio en un hilo ("supabase-io"): así lo
+  comparten el loop de FastAPI, los nodos síncronos del grafo y los hilos de
+  helpers/jobs.py sin que httpx quede amarrado a un loop ajeno.
+- Cada helper existe en versión async (prefijo `a`) y síncrona; la síncrona
+  espera el resultado desde el hilo que la llama.
+- Todas las consultas pasan por DataAccess._execute (reintentos) y por los
+  event hooks del pool HTTP (conteo de round-trips, bytes y latencia por
+  tabla; log de consultas lentas arriba de SUPABASE_SLOW_QUERY_MS).
+
+Uso:
+    from rag.db_access import db
+    row = db.fetch_student("ana@tec.mx")            # código síncrono
+    row = await db.afetch_student("ana@tec.mx")     # código async
+    rows = db.query("students", lambda t: t.select("id").eq("career", "IRS"))
+
+    with track_queries() as stats:       # p.ej. alrededor de un turno de /chat
+        ...
+    stats.summary()  # {"queries": 7, "bytes_received": ..., "tables": {...}}
+"""
+
+import asyncio
+import contextvars
+import functools
 import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, TypedDict
+
+import httpx
+import pandas as pd
 from dotenv import load_dotenv
+from langchain_core.documents import Document
+from postgrest.exceptions import APIError
+from supabase import AsyncClient, AsyncClientOptions, acreate_client
+
+from helpers.name_index import NameIndex
+from helpers.rate_limit import retry_async
 
 load_dotenv()
 
@@ -15,29 +53,876 @@ if not SUPABASE_URL or not SUPABASE_KEY:
         "Verifica tu .env o variables de entorno del contenedor."
     )
 
-SB: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# Pool HTTP compartido
+MAX_CONNECTIONS = int(os.getenv("SUPABASE_MAX_CONNECTIONS", "20"))
+MAX_KEEPALIVE = int(os.getenv("SUPABASE_MAX_KEEPALIVE", "10"))
+KEEPALIVE_EXPIRY_S = float(os.getenv("SUPABASE_KEEPALIVE_S", "30"))
+TIMEOUT_S = float(os.getenv("SUPABASE_TIMEOUT_S", "15"))
+# Reintentos de errores transitorios (red, 502/503/504)
+MAX_ATTEMPTS = int(os.getenv("SUPABASE_MAX_ATTEMPTS", "3"))
+RETRY_BASE_DELAY_S = 0.25
+RETRY_STATUS = {"502", "503", "504"}
+# Tamaño de lote para filtros .in_()
+IN_CHUNK = 100
+# Consultas más lentas que esto se registran en el log (0 = nunca)
+SLOW_QUERY_MS = float(os.getenv("SUPABASE_SLOW_QUERY_MS", "500"))
+# Índice local de nombres: cambios recientes (por last_seen) y recarga completa
+NAME_INDEX_REFRESH_S = float(os.getenv("NAME_INDEX_REFRESH_S", "60"))
+NAME_INDEX_FULL_REFRESH_S = float(os.getenv("NAME_INDEX_FULL_REFRESH_S", "1800"))
+NAME_COLUMNS = "id, full_name, email, last_seen"
+NAME_PAGE_SIZE = 1000
+# Árbol de prácticas: task → pasos → imágenes
+PROJECT_TREE_COLUMNS = (
+    "id, project_id, title, description, created_at, "
+    "task_steps(id, task_id, step_number, title, description, is_completed), "
+    "manual_images(*)"
+)
 
+try:
+    import h2  # noqa: F401
 
-def _fetch_student(name_or_email: str):
-    q = name_or_email.strip()
-    if "@" in q:
-        res = SB.table("students").select("*").eq("email", q).limit(1).execute()
-    else:
-        res = SB.table("students").select("*").ilike("full_name", f"%{q}%").limit(1).execute()
-    rows = res.data or []
-    return rows[0] if rows else None
+    HTTP2 = True
+except ImportError:
+    HTTP2 = False
 
-def retrieve_robot_support() -> pd.DataFrame:
-    res = SB.table("RoboSupportSB").select(
-        "created_at, robot_type, problem_title, problem_description, solution_steps, author"
-    ).execute()
 
-    rows = res.data
-    df = pd.DataFrame(rows)
-    return df
+# ====================================================
+# Tipos de filas
+# ====================================================
+class StudentRow(TypedDict, total=False):
+    id: str
+    full_name: str
+    email: str
+    career: str
+    semester: int
+    skills: List[str]
+    goals: List[str]
+    interests: List[str]
+    learning_style: dict
+    last_seen: str
+
+
+class SessionRow(TypedDict, total=False):
+    id: str
+    started_at: str
+    user_email: str
+    user_id: str
+    metadata: dict
+
+
+class MessageRow(TypedDict, total=False):
+    id: int
+    session_id: str
+    role: str
+    content: str
+    created_at: str
+
+
+class SummaryRow(TypedDict, total=False):
+    id: int
+    session_id: str
+    summary_json: Any
+    updated_at: str
+    summarized_until: str
+    message_count: int
+
+
+class TaskRow(TypedDict, total=False):
+    id: str
+    project_id: str
+    title: str
+    description: str
+    created_at: str
+
+
+class StepRow(TypedDict, total=False):
+    id: str
+    task_id: str
+    step_number: int
+    title: str
+    description: str
+    is_completed: bool
+    completed_at: str
+
+
+class ManualImageRow(TypedDict, total=False):
+    id: str
+    project_id: str
+    project_task_id: str
+    step_number: int
+    title: str
+    description: str
+    tags: str
+    image_url: str
+
+
+class RobotSupportRow(TypedDict, total=False):
+    created_at: str
+    robot_type: str
+    problem_title: str
+    problem_description: str
+    solution_steps: str
+    author: str
+
+
+# ====================================================
+# Contabilidad de consultas
+# ====================================================
+class QueryStats:
+    """Round-trips, bytes y latencia acumulados (en total y por tabla)."""
+
+    def __init__(self):
+        self.queries = 0
+        self.errors = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.total_ms = 0.0
+        self.tables: Dict[str, dict] = {}
+
+    def record(self, table: str, ms: float, sent: int, received: int, error: bool) -> None:
+        self.queries += 1
+        self.errors += int(error)
+        self.bytes_sent += sent
+        self.bytes_received += received
+        self.total_ms += ms
+        entry = self.tables.setdefault(
+            table, {"queries": 0, "bytes_received": 0, "total_ms": 0.0, "max_ms": 0.0}
+        )
+        entry["queries"] += 1
+        entry["bytes_received"] += received
+        entry["total_ms"] += ms
+        entry["max_ms"] = max(entry["max_ms"], ms)
+
+    def summary(self) -> dict:
+        return {
+            "queries": self.queries,
+            "errors": self.errors,
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+            "total_ms": round(self.total_ms, 1),
+            "tables": {
+                name: {
+                    **entry,
+                    "total_ms": round(entry["total_ms"], 1),
+                    "max_ms": round(entry["max_ms"], 1),
+                }
+                for name, entry in sorted(
+                    self.tables.items(), key=lambda kv: kv[1]["total_ms"], reverse=True
+                )
+            },
+        }
+
+
+# Contador activo del turno en curso (None = no se contabiliza)
+_current_stats: contextvars.ContextVar[Optional[QueryStats]] = contextvars.ContextVar(
+    "supabase_query_stats", default=None
+)
+
+
+@contextmanager
+def track_queries() -> Iterator[QueryStats]:
+    """
+    Contabiliza las consultas hechas dentro del bloque, incluidas las de
+    hilos o tareas que hereden el contexto (nodos síncronos del grafo, tools).
+    """
+    stats = QueryStats()
+    token = _current_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _current_stats.reset(token)
+
+
+def _table_of(url: httpx.URL) -> str:
+    """students, chat_session, rpc/append_student_goal, ..."""
+    path = url.path
+    marker = "/rest/v1/"
+    if marker in path:
+        return path.split(marker, 1)[1].strip("/") or "?"
+    return path.strip("/") or "?"
+
+
+async def _on_request(request: httpx.Request) -> None:
+    request.extensions["t0"] = time.perf_counter()
+
+
+async def _on_response(response: httpx.Response) -> None:
+    # Leer el cuerpo aquí para medir bytes y latencia completa; postgrest lo
+    # reutiliza después sin volver a pedirlo
+    await response.aread()
+    request = response.request
+    ms = (time.perf_counter() - request.extensions.get("t0", time.perf_counter())) * 1000
+    table = _table_of(request.url)
+    sent = len(request.content or b"")
+    received = len(response.content)
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.record(table, ms, sent, received, response.status_code >= 400)
+    if SLOW_QUERY_MS and ms >= SLOW_QUERY_MS:
+        print(
+            f"[db_access] consulta lenta {ms:.0f}ms {request.method} {table} "
+            f"status={response.status_code} {received}B"
+        )
+
+
+async def _in_context(stats: Optional[QueryStats], coro: Awaitable):
+    # El loop de Supabase corre en otro hilo: el contador del que llama se
+    # pasa explícitamente a la tarea que ejecuta la consulta
+    _current_stats.set(stats)
+    return await coro
+
+
+def _pg_quote(value) -> str:
+    """Entrecomilla un valor para filtros or_() de PostgREST."""
+    return '"' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+# ====================================================
+# Reintentos
+# ====================================================
+def _not_sent(error: Exception) -> bool:
+    """El request nunca salió (no hay riesgo de aplicarlo dos veces)."""
+    return isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout))
+
+
+def _transient(error: Exception) -> bool:
+    """Errores de red o del gateway que vale la pena reintentar."""
+    if isinstance(error, httpx.TransportError):
+        return True
+    return isinstance(error, APIError) and str(error.code) in RETRY_STATUS
+
+
+def _io(fn):
+    """Ejecuta el helper async completo en el loop de Supabase (estado compartido)."""
+
+    @functools.wraps(fn)
+    async def wrapper(self, *args, **kwargs):
+        return await self._async(fn(self, *args, **kwargs))
+
+    return wrapper
+
+
+# ====================================================
+# Cliente
+# ====================================================
+class DataAccess:
+    """Cliente async compartido + helpers tipados (versión async y síncrona)."""
+
+    def __init__(
+        self,
+        url: str = SUPABASE_URL,
+        key: str = SUPABASE_KEY,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.url = url
+        self.key = key
+        self._transport = transport
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._http: Optional[httpx.AsyncClient] = None
+        self._client: Optional[AsyncClient] = None
+        self._client_lock: Optional[asyncio.Lock] = None
+        # Índice de nombres (solo se toca desde el loop de Supabase)
+        self.names = NameIndex()
+        self._names_lock: Optional[asyncio.Lock] = None
+        self._names_full_at = 0.0
+        self._names_checked_at = 0.0
+        self._names_watermark: Optional[str] = None
+
+    # ------------------- loop y cliente -------------------
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        if self._thread and self._thread.is_alive():
+            return self._loop
+        with self._start_lock:
+            if self._thread and self._thread.is_alive():
+                return self._loop
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            def run():
+                asyncio.set_event_loop(loop)
+                loop.call_soon(ready.set)
+                loop.run_forever()
+
+            self._loop = loop
+            self._client_lock = None
+            self._names_lock = None
+            self._thread = threading.Thread(target=run, name="supabase-io", daemon=True)
+            self._thread.start()
+            ready.wait()
+        return self._loop
+
+    async def _get_client(self) -> AsyncClient:
+        if self._client is not None:
+            return self._client
+        if self._client_lock is None:
+            self._client_lock = asyncio.Lock()
+        async with self._client_lock:
+            if self._client is None:
+                self._http = httpx.AsyncClient(
+                    http2=HTTP2 and self._transport is None,
+                    transport=self._transport,
+                    timeout=TIMEOUT_S,
+                    event_hooks={"request": [_on_request], "response": [_on_response]},
+                    limits=httpx.Limits(
+                        max_connections=MAX_CONNECTIONS,
+                        max_keepalive_connections=MAX_KEEPALIVE,
+                        keepalive_expiry=KEEPALIVE_EXPIRY_S,
+                    ),
+                )
+                self._client = await acreate_client(
+                    self.url, self.key, options=AsyncClientOptions(httpx_client=self._http)
+                )
+        return self._client
+
+    def _on_loop(self) -> bool:
+        try:
+            return asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
+
+    def _submit(self, coro: Awaitable):
+        return asyncio.run_coroutine_threadsafe(
+            _in_context(_current_stats.get(), coro), self._ensure_loop()
+        )
+
+    def _sync(self, coro: Awaitable):
+        """Ejecuta una corrutina en el loop del cliente y espera el resultado."""
+        if self._on_loop():
+            coro.close()
+            raise RuntimeError(
+                "db_access: la versión síncrona no puede llamarse desde el loop "
+                "de Supabase; usa la versión async (prefijo a)."
+            )
+        return self._submit(coro).result()
+
+    async def _async(self, coro: Awaitable):
+        if self._on_loop():
+            return await coro
+        return await asyncio.wrap_future(self._submit(coro))
+
+    def close(self) -> None:
+        """Cierra el pool HTTP y detiene el hilo del loop (al apagar la app)."""
+        loop, thread = self._loop, self._thread
+        if not (loop and thread and thread.is_alive()):
+            return
+
+        async def shutdown():
+            if self._http is not None:
+                await self._http.aclose()
+            self._http = None
+            self._client = None
+
+        try:
+            self._submit(shutdown()).result(timeout=5)
+        except Exception as e:
+            print(f"[db_access] Error cerrando el cliente: {e}")
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout=5)
+        loop.close()
+        self._loop = None
+        self._thread = None
+
+    # ------------------- ejecución -------------------
+    async def _execute(self, build: Callable[[AsyncClient], Any], idempotent: bool) -> List[dict]:
+        client = await self._get_client()
+        res = await retry_async(
+            lambda: build(client).execute(),
+            attempts=MAX_ATTEMPTS,
+            base_delay=RETRY_BASE_DELAY_S,
+            max_delay=2.0,
+            retryable=_transient if idempotent else _not_sent,
+        )
+        data = res.data
+        if data is None:
+            return []
+        return data if isinstance(data, list) else [data]
+
+    async def aquery(
+        self, table: str, build: Callable[[Any], Any], idempotent: bool = True
+    ) -> List[dict]:
+        """
+        Consulta genérica: build recibe client.table(table) y regresa el builder
+        listo (select/eq/order/...). Regresa las filas. idempotent=False para
+        inserts: solo se reintenta si el request no llegó a salir.
+        """
+        return await self._async(
+            self._execute(lambda c: build(c.table(table)), idempotent)
+        )
+
+    def query(self, table: str, build: Callable[[Any], Any], idempotent: bool = True) -> List[dict]:
+        return self._sync(self._execute(lambda c: build(c.table(table)), idempotent))
+
+    async def arpc(
+        self, fn: str, params: Optional[dict] = None, idempotent: bool = False
+    ) -> List[dict]:
+        """Llama una función de Postgres (RPC)."""
+        return await self._async(self._execute(lambda c: c.rpc(fn, params or {}), idempotent))
+
+    def rpc(self, fn: str, params: Optional[dict] = None, idempotent: bool = False) -> List[dict]:
+        return self._sync(self._execute(lambda c: c.rpc(fn, params or {}), idempotent))
+
+    async def _gather_chunks(self, ids: List, fetch: Callable[[List], Awaitable[List[dict]]]) -> List[dict]:
+        chunks = [ids[i:i + IN_CHUNK] for i in range(0, len(ids), IN_CHUNK)]
+        results = await asyncio.gather(*(fetch(c) for c in chunks))
+        return [row for rows in results for row in rows]
+
+    # ------------------- índice de nombres -------------------
+    async def _aload_all_names(self) -> NameIndex:
+        index, last = NameIndex(), None
+        while True:
+            def build(t, after=last):
+                q = t.select(NAME_COLUMNS)
+                if after is not None:
+                    q = q.gt("id", after)
+                return q.order("id").limit(NAME_PAGE_SIZE)
+
+            rows = await self.aquery("students", build)
+            for row in rows:
+                index.add(row)
+                self._advance_watermark(row)
+            if len(rows) < NAME_PAGE_SIZE:
+                return index
+            last = rows[-1]["id"]
+
+    def _advance_watermark(self, row: dict) -> None:
+        seen = row.get("last_seen")
+        if seen and (self._names_watermark is None or seen > self._names_watermark):
+            self._names_watermark = seen
+
+    async def _arefresh_names(self) -> bool:
+        """
+        Carga el índice la primera vez, trae los estudiantes tocados desde la
+        última revisión cada NAME_INDEX_REFRESH_S y lo recarga completo cada
+        NAME_INDEX_FULL_REFRESH_S (bajas y renombres). False si no hay índice.
+        """
+        if self._names_lock is None:
+            self._names_lock = asyncio.Lock()
+        async with self._names_lock:
+            now = time.monotonic()
+            if self._names_checked_at and now - self._names_checked_at < NAME_INDEX_REFRESH_S:
+                return bool(self._names_full_at)
+            full = not self._names_full_at or now - self._names_full_at >= NAME_INDEX_FULL_REFRESH_S
+            try:
+                if full:
+                    self.names = await self._aload_all_names()
+                    self._names_full_at = now
+                elif self._names_watermark:
+                    since = self._names_watermark
+                    rows = await self.aquery(
+                        "students", lambda t: t.select(NAME_COLUMNS).gte("last_seen", since)
+                    )
+                    for row in rows:
+                        self.names.add(row)
+                        self._advance_watermark(row)
+                self._names_checked_at = now
+            except Exception as e:
+                print(f"[db_access] No se pudo refrescar el índice de nombres: {e}")
+                # Se reintenta en la siguiente búsqueda; mientras, el índice viejo
+                self._names_checked_at = now
+            return bool(self._names_full_at)
+
+    @_io
+    async def asearch_student_names(self, query: str, limit: int = 5) -> List[dict]:
+        """Candidatos [{id, full_name, email, score}] ordenados por score."""
+        if not await self._arefresh_names():
+            return []
+        return self.names.search(query, limit=limit)
+
+    def search_student_names(self, query: str, limit: int = 5) -> List[dict]:
+        return self._sync(self.asearch_student_names(query, limit))
+
+    # ------------------- estudiantes -------------------
+    @_io
+    async def afetch_student(self, name_or_email: str) -> Optional[StudentRow]:
+        """
+        Busca un estudiante por email exacto o por nombre (índice de trigramas:
+        sin acentos; solo nombres que contienen la consulta, ver
+        NameIndex.resolve). Regresa dict o None.
+        """
+        q = (name_or_email or "").strip()
+        if not q:
+            return None
+        if "@" in q:
+            rows = await self.aquery("students", lambda t: t.select("*").eq("email", q).limit(1))
+        elif await self._arefresh_names():
+            match = self.names.resolve(q)
+            if match is None:
+                return None
+            rows = await self.aquery(
+                "students", lambda t: t.select("*").eq("id", match["id"]).limit(1)
+            )
+        else:
+            # Sin índice (error al cargarlo): búsqueda parcial en la tabla
+            rows = await self.aquery(
+                "students", lambda t: t.select("*").ilike("full_name", f"%{q}%").limit(1)
+            )
+        return rows[0] if rows else None
+
+    def fetch_student(self, name_or_email: str) -> Optional[StudentRow]:
+        return self._sync(self.afetch_student(name_or_email))
+
+    @_io
+    async def afind_students(
+        self, emails: List[str], names: List[str], per_name: int = 5
+    ) -> List[StudentRow]:
+        """
+        Candidatos por email exacto (una consulta email.in.(...)) y por nombre
+        (índice local; cada fila lleva "query" con el nombre que la encontró).
+        Sin índice, los nombres van en la misma consulta como ilike.
+        """
+        found: List[StudentRow] = []
+        filters = []
+        if emails:
+            filters.append("email.in.(" + ",".join(_pg_quote(e) for e in emails) + ")")
+        if names and await self._arefresh_names():
+            for name in names:
+                found.extend(
+                    {**row, "query": name} for row in self.names.search(name, limit=per_name)
+                )
+        else:
+            for name in names:
+                pattern = name.replace("%", "").replace("_", " ").replace("*", "")
+                filters.append(f"full_name.ilike.{_pg_quote(f'*{pattern}*')}")
+        if filters:
+            limit = len(emails) + per_name * (len(filters) - bool(emails))
+            found = await self.aquery(
+                "students",
+                lambda t: t.select("id, email, full_name").or_(",".join(filters)).limit(limit),
+            ) + found
+        return found
+
+    def find_students(
+        self, emails: List[str], names: List[str], per_name: int = 5
+    ) -> List[StudentRow]:
+        return self._sync(self.afind_students(emails, names, per_name))
+
+    @_io
+    async def aupsert_student(self, row: StudentRow) -> List[StudentRow]:
+        rows = await self.aquery("students", lambda t: t.upsert(row, on_conflict="email"))
+        # Alta o cambio de nombre visible de inmediato en el índice
+        if self._names_full_at:
+            for saved in rows:
+                self.names.add(saved)
+        return rows
+
+    def upsert_student(self, row: StudentRow) -> List[StudentRow]:
+        return self._sync(self.aupsert_student(row))
+
+    async def aupdate_student(
+        self, fields: dict, student_id: Optional[str] = None, email: Optional[str] = None
+    ) -> List[StudentRow]:
+        """Actualiza campos de un estudiante por id o por email."""
+        if student_id is None and email is None:
+            raise ValueError("update_student requiere student_id o email")
+        column, value = ("id", student_id) if student_id is not None else ("email", email)
+        return await self.aquery("students", lambda t: t.update(fields).eq(column, value))
+
+    def update_student(
+        self, fields: dict, student_id: Optional[str] = None, email: Optional[str] = None
+    ) -> List[StudentRow]:
+        return self._sync(self.aupdate_student(fields, student_id, email))
+
+    @_io
+    async def _astudent_key(self, name_or_email: str) -> Optional[dict]:
+        """
+        Parámetros de RPC que identifican al estudiante (sin leer su fila).
+        Antes de escribir, un nombre debe ser exacto o estar contenido en un
+        solo estudiante; si es ambiguo o solo se parece, regresa None.
+        """
+        q = (name_or_email or "").strip()
+        if not q:
+            return None
+        if "@" in q:
+            return {"p_email": q}
+        if await self._arefresh_names():
+            match = self.names.resolve(q, unique=True)
+        else:
+            # Sin índice: el ilike solo cuenta si encuentra exactamente una fila
+            rows = await self.aquery(
+                "students", lambda t: t.select("id").ilike("full_name", f"%{q}%").limit(2)
+            )
+            match = rows[0] if len(rows) == 1 else None
+        return {"p_student_id": match["id"]} if match else None
+
+    async def aappend_student_goal(self, name_or_email: str, goal: str) -> Optional[dict]:
+        """
+        Agrega una meta (si no estaba) en un solo UPDATE del servidor.
+        Regresa {full_name, goals} o None si el estudiante no existe.
+        """
+        key = await self._astudent_key(name_or_email)
+        if key is None:
+            return None
+        rows = await self.arpc("append_student_goal", {"p_goal": goal, **key}, idempotent=True)
+        return rows[0] if rows else None
+
+    def append_student_goal(self, name_or_email: str, goal: str) -> Optional[dict]:
+        return self._sync(self.aappend_student_goal(name_or_email, goal))
+
+    async def amerge_learning_style(self, name_or_email: str, patch: dict) -> Optional[dict]:
+        """
+        Mezcla `patch` sobre learning_style (jsonb ||) en el servidor.
+        Regresa {full_name, learning_style} o None si el estudiante no existe.
+        """
+        key = await self._astudent_key(name_or_email)
+        if key is None:
+            return None
+        rows = await self.arpc("merge_learning_style", {"p_patch": patch, **key}, idempotent=True)
+        return rows[0] if rows else None
+
+    def merge_learning_style(self, name_or_email: str, patch: dict) -> Optional[dict]:
+        return self._sync(self.amerge_learning_style(name_or_email, patch))
+
+    # ------------------- sesiones y mensajes -------------------
+    async def aget_session_metadata(self, session_id: str) -> dict:
+        rows = await self.aquery(
+            "chat_session", lambda t: t.select("metadata").eq("id", session_id).limit(1)
+        )
+        meta = (rows[0].get("metadata") if rows else None) or {}
+        return meta if isinstance(meta, dict) else {}
+
+    def get_session_metadata(self, session_id: str) -> dict:
+        return self._sync(self.aget_session_metadata(session_id))
+
+    async def aupsert_session(self, row: SessionRow) -> List[SessionRow]:
+        return await self.aquery("chat_session", lambda t: t.upsert(row, on_conflict="id"))
+
+    def upsert_session(self, row: SessionRow) -> List[SessionRow]:
+        return self._sync(self.aupsert_session(row))
+
+    async def afetch_session_emails(self, session_ids: List[str]) -> Dict[str, str]:
+        """Mapa session_id → user_email (lotes de IN_CHUNK en paralelo)."""
+        rows = await self._gather_chunks(
+            [sid for sid in session_ids if sid],
+            lambda chunk: self.aquery(
+                "chat_session", lambda t: t.select("id, user_email").in_("id", chunk)
+            ),
+        )
+        return {r["id"]: r["user_email"] for r in rows if r.get("user_email")}
+
+    def fetch_session_emails(self, session_ids: List[str]) -> Dict[str, str]:
+        return self._sync(self.afetch_session_emails(session_ids))
+
+    async def ainsert_message(self, row: MessageRow) -> List[MessageRow]:
+        return await self.aquery("chat_message", lambda t: t.insert(row), idempotent=False)
+
+    def insert_message(self, row: MessageRow) -> List[MessageRow]:
+        return self._sync(self.ainsert_message(row))
+
+    async def adelete_messages(self, ids: List) -> int:
+        """Borra mensajes por id; regresa cuántos ids se pidieron borrar."""
+        for i in range(0, len(ids), IN_CHUNK):
+            chunk = ids[i:i + IN_CHUNK]
+            await self.aquery("chat_message", lambda t, c=chunk: t.delete().in_("id", c))
+        return len(ids)
+
+    def delete_messages(self, ids: List) -> int:
+        return self._sync(self.adelete_messages(ids))
+
+    # ------------------- resúmenes -------------------
+    async def afetch_summaries(
+        self, session_ids: List[str], columns: str = "session_id, summary_json, updated_at"
+    ) -> Dict[str, SummaryRow]:
+        """Resumen de cada sesión (solo las que tengan)."""
+        rows = await self._gather_chunks(
+            [sid for sid in session_ids if sid],
+            lambda chunk: self.aquery(
+                "chat_summary", lambda t: t.select(columns).in_("session_id", chunk)
+            ),
+        )
+        return {r["session_id"]: r for r in rows}
+
+    def fetch_summaries(
+        self, session_ids: List[str], columns: str = "session_id, summary_json, updated_at"
+    ) -> Dict[str, SummaryRow]:
+        return self._sync(self.afetch_summaries(session_ids, columns))
+
+    async def aupsert_summary(self, row: SummaryRow) -> List[SummaryRow]:
+        return await self.aquery(
+            "chat_summary", lambda t: t.upsert(row, on_conflict="session_id")
+        )
+
+    def upsert_summary(self, row: SummaryRow) -> List[SummaryRow]:
+        return self._sync(self.aupsert_summary(row))
+
+    def iter_summary_pages(
+        self, page_size: int = 500, columns: str = "session_id, summary_json, updated_at"
+    ):
+        """Páginas de chat_summary ordenadas por session_id (keyset)."""
+        last = None
+        while True:
+            def build(t, after=last):
+                q = t.select(columns)
+                if after is not None:
+                    q = q.gt("session_id", after)
+                return q.order("session_id").limit(page_size)
+
+            rows = self.query("chat_summary", build)
+            if not rows:
+                return
+            yield rows
+            if len(rows) < page_size:
+                return
+            last = rows[-1]["session_id"]
+
+    # ------------------- prácticas -------------------
+    async def afetch_project_tree(self, project_id: str) -> List[TaskRow]:
+        """
+        Tasks del proyecto con sus pasos e imágenes anidados en UNA consulta
+        (embedding de PostgREST: task_steps y manual_images por FK a la task).
+        """
+        return await self.aquery(
+            "project_tasks",
+            lambda t: t.select(PROJECT_TREE_COLUMNS).eq("project_id", project_id),
+        )
+
+    def fetch_project_tree(self, project_id: str) -> List[TaskRow]:
+        return self._sync(self.afetch_project_tree(project_id))
+
+    async def aproject_progress(self, project_id: str) -> List[dict]:
+        """
+        Pasos totales y completados por task (RPC project_progress, agregado
+        en el servidor). Sin la función desplegada, agrega el árbol anidado.
+        """
+        try:
+            return await self.arpc(
+                "project_progress", {"p_project_id": project_id}, idempotent=True
+            )
+        except APIError as e:
+            print("[db_access.project_progress] RPC no disponible:", e)
+        tasks = await self.aquery(
+            "project_tasks",
+            lambda t: t.select("id, title, created_at, task_steps(is_completed)").eq(
+                "project_id", project_id
+            ),
+        )
+        return [
+            {
+                "task_id": task.get("id"),
+                "title": task.get("title"),
+                "created_at": task.get("created_at"),
+                "total_steps": len(task.get("task_steps") or []),
+                "completed_steps": sum(
+                    1 for s in task.get("task_steps") or [] if s.get("is_completed")
+                ),
+            }
+            for task in tasks
+        ]
+
+    def project_progress(self, project_id: str) -> List[dict]:
+        return self._sync(self.aproject_progress(project_id))
+
+    async def alist_project_tasks(self, project_id: str) -> List[TaskRow]:
+        try:
+            return await self.aquery(
+                "project_tasks",
+                lambda t: t.select("id, project_id, title, description, created_at")
+                .eq("project_id", project_id)
+                .order("created_at", desc=False),
+            )
+        except APIError as e:
+            # Sin columna created_at: sin orden explícito
+            print("[db_access.list_project_tasks] error:", e)
+            return await self.aquery(
+                "project_tasks",
+                lambda t: t.select("id, project_id, title, description").eq("project_id", project_id),
+            )
+
+    def list_project_tasks(self, project_id: str) -> List[TaskRow]:
+        return self._sync(self.alist_project_tasks(project_id))
+
+    async def alist_task_steps(self, task_id: str) -> List[StepRow]:
+        return await self.aquery(
+            "task_steps",
+            lambda t: t.select("id, task_id, step_number, title, description, is_completed")
+            .eq("task_id", task_id)
+            .order("step_number", desc=False),
+        )
+
+    def list_task_steps(self, task_id: str) -> List[StepRow]:
+        return self._sync(self.alist_task_steps(task_id))
+
+    async def acomplete_step(self, step_id: str, completed_at: str) -> List[StepRow]:
+        return await self.aquery(
+            "task_steps",
+            lambda t: t.update({"is_completed": True, "completed_at": completed_at}).eq("id", step_id),
+        )
+
+    def complete_step(self, step_id: str, completed_at: str) -> List[StepRow]:
+        return self._sync(self.acomplete_step(step_id, completed_at))
+
+    async def alist_step_images(
+        self, task_id: str, step_number: Optional[int] = None, limit: int = 5
+    ) -> List[ManualImageRow]:
+        def build(t):
+            q = t.select("*").eq("project_task_id", task_id)
+            if step_number is not None:
+                q = q.eq("step_number", step_number)
+            return q.limit(limit)
+
+        return await self.aquery("manual_images", build)
+
+    def list_step_images(
+        self, task_id: str, step_number: Optional[int] = None, limit: int = 5
+    ) -> List[ManualImageRow]:
+        return self._sync(self.alist_step_images(task_id, step_number, limit))
+
+    async def asearch_manual_images(
+        self,
+        query: str,
+        robot_type: Optional[str] = None,
+        project_id: Optional[str] = None,
+        limit: int = 5,
+    ) -> List[ManualImageRow]:
+        """Texto en título/descripción/tags con filtros opcionales."""
+
+        def build(t):
+            q = t.select("*")
+            if project_id:
+                q = q.eq("project_id", project_id)
+            if robot_type:
+                q = q.ilike("robot_type", f"%{robot_type}%")
+            q = q.or_(
+                "title.ilike.%{q}%,description.ilike.%{q}%,tags.ilike.%{q}%".format(q=query)
+            )
+            return q.limit(limit)
+
+        return await self.aquery("manual_images", build)
+
+    def search_manual_images(
+        self,
+        query: str,
+        robot_type: Optional[str] = None,
+        project_id: Optional[str] = None,
+        limit: int = 5,
+    ) -> List[ManualImageRow]:
+        return self._sync(self.asearch_manual_images(query, robot_type, project_id, limit))
+
+    async def alist_robot_support(self) -> List[RobotSupportRow]:
+        return await self.aquery(
+            "RoboSupportDB",
+            lambda t: t.select(
+                "created_at, robot_type, problem_title, problem_description, solution_steps, author"
+            ),
+        )
+
+    def list_robot_support(self) -> List[RobotSupportRow]:
+        return self._sync(self.alist_robot_support())
+
+
+# Cliente compartido por el proceso
+db = DataAccess()
+
+
+# ====================================================
+# Lecturas para RAG
+# ====================================================
+def retrieve_robot_support() -> pd.DataFrame:
+    return pd.DataFrame(db.list_robot_support())
 
 def retrieve_student_info(name_or_email):
-    row = _fetch_student(name_or_email)
+    row = db.fetch_student(name_or_email)
     docs = []
 
     if not row:
@@ -56,27 +941,3 @@ def retrieve_student_info(name_or_email):
 
     docs.append(Document(page_content=content, metadata=metadata))
     return docs, len(docs)
-
-def retrieve_chat_summary(chat_id):
-    res = SB.table("chat_summary").select(
-        "id, session_id, summary_md, updated_at"
-    ).eq("id", chat_id).execute()
-
-    rows = res.data or []
-    docs = []
-
-    if not rows:
-        return docs, 0
-
-    row = rows[0]
-    metadata = {
-        "id": row.get("id"),
-        "session_id": row.get("session_id"),
-        "updated_at": row.get("updated_at"),
-    }
-    content = f"""
-                summary_md: {row.get('summary_md')}\n 
-                """
-    docs.append(Document(page_content=content, metadata=metadata))
-
-    return docs, len(docs)
@@ -0,0 +1,33 @@
+"""Conversión de filas de Supabase/CSV a Document para los vectorstores."""
+
+from langchain_core.documents import Document
+
+
+def robot_support_document(r: dict) -> Document:
+    """
+    Construye el Document de un caso de RoboSupport con un estilo
+    narrativo/humano (mismo formato que se indexa en 'robot_support').
+    """
+    robot = r.get("robot_type") or "el robot"
+    title = r.get("problem_title") or "problema sin título"
+    desc = r.get("problem_description") or "Sin descripción detallada."
+    steps = (
+        r.get("solution_steps")
+        or r.get("solution_description")
+        or "Sin pasos registrados."
+    )
+    author = r.get("author") or "otro integrante del laboratorio"
+
+    content = (
+        f"Problema registrado para el robot {robot}: {title}.\n"
+        f"Descripción del problema: {desc}\n\n"
+        f"Según {author}, los pasos recomendados para resolverlo fueron:\n"
+        f"{steps}"
+    )
+    metadata = {
+        "created_at": r.get("created_at"),
+        "robot_type": robot,
+        "problem_title": title,
+        "author": author,
+    }
+    return Document(page_content=content, metadata=metadata)
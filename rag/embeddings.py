@@ -0,0 +1,56 @@
+"""Embeddings locales y determinísticos (sin red) para pruebas y benchmarks."""
+
+import hashlib
+import math
+import re
+import unicodedata
+from typing import List
+
+from langchain_core.embeddings import Embeddings
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def _normalize(text: str) -> str:
+    """Minúsculas y sin acentos, para que 'calibración' == 'calibracion'."""
+    text = unicodedata.normalize("NFKD", text or "")
+    return "".join(c for c in text if not unicodedata.combining(c)).lower()
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    Embedding por feature hashing de unigramas y bigramas.
+
+    No es semántico (solo captura solapamiento léxico), pero es estable entre
+    corridas y máquinas, así que sirve para medir latencia y comparar
+    cambios de parámetros de búsqueda sin depender de OpenAI.
+    """
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+
+    def _features(self, text: str) -> List[str]:
+        tokens = _TOKEN_RE.findall(_normalize(text))
+        bigrams = [f"{a}_{b}" for a, b in zip(tokens, tokens[1:])]
+        return tokens + bigrams
+
+    def _embed(self, text: str) -> List[float]:
+        vec = [0.0] * self.dim
+        for feat in self._features(text):
+            digest = hashlib.blake2b(feat.encode("utf-8"), digest_size=8).digest()
+            h = int.from_bytes(digest, "little")
+            sign = 1.0 if (h >> 63) & 1 else -1.0
+            vec[h % self.dim] += sign
+        norm = math.sqrt(sum(v * v for v in vec))
+        if norm == 0:
+            # Texto vacío: vector constante para no romper la métrica coseno
+            return [1.0 / math.sqrt(self.dim)] * self.dim
+        return [v / norm for v in vec]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embebe una lista de documentos."""
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embebe una consulta."""
+        return self._embed(text)
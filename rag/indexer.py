@@ -0,0 +1,310 @@
+"""
+Servicio de indexación de un solo escritor para robot_vector_db.
+
+Todas las colecciones comparten el mismo SQLite de Chroma. Para que varios
+procesos (workers de uvicorn, `langgraph dev`) no compitan por el lock de
+escritura:
+
+- Cualquier proceso encola escrituras en una cola SQLite pequeña
+  (index_queue.sqlite3) y regresa de inmediato.
+- Un solo proceso, el que obtiene el flock de writer.lock, drena la cola
+  con un hilo en segundo plano y hace upsert en Chroma con ids estables.
+- Tras cada lote, el escritor incrementa INDEX_VERSION. Los lectores nunca
+  toman locks: cuando ven una versión nueva refrescan su snapshot.
+- El resultado de cada trabajo (aplicado en la versión N o descartado) queda
+  en index_results un rato, así quien encoló puede esperar SU escritura con
+  wait_for_job() en lugar de cualquier cambio de versión.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from langchain_core.documents import Document
+
+try:
+    import fcntl
+except ImportError:  # Windows: un solo proceso, siempre escritor
+    fcntl = None
+
+QUEUE_FILENAME = "index_queue.sqlite3"
+LOCK_FILENAME = "writer.lock"
+VERSION_FILENAME = "INDEX_VERSION"
+
+# Cada cuánto reintenta un proceso seguidor tomar el rol de escritor
+LEADER_RETRY_S = float(os.getenv("INDEX_LEADER_RETRY_S", "5"))
+# Máximo de trabajos que el escritor aplica por lote
+DRAIN_BATCH = int(os.getenv("INDEX_DRAIN_BATCH", "64"))
+# Intentos antes de descartar un trabajo que siempre falla
+MAX_ATTEMPTS = int(os.getenv("INDEX_MAX_ATTEMPTS", "5"))
+# Segundos que se conserva el resultado de un trabajo terminado
+RESULT_TTL_S = 3600.0
+
+
+class IndexingService:
+    """Cola de escrituras + hilo escritor único (por flock) para Chroma."""
+
+    def __init__(self, persist_dir: str, store_factory: Callable[[str], object]):
+        self.persist_dir = persist_dir
+        self.store_factory = store_factory
+        self.queue_path = os.path.join(persist_dir, QUEUE_FILENAME)
+        self.lock_path = os.path.join(persist_dir, LOCK_FILENAME)
+        self.version_path = os.path.join(persist_dir, VERSION_FILENAME)
+
+        self.is_leader = False
+        self._lock_fd = None
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._schema_ready = False
+
+    # ------------------- cola -------------------
+    def _connect(self) -> sqlite3.Connection:
+        os.makedirs(self.persist_dir, exist_ok=True)
+        conn = sqlite3.connect(self.queue_path, timeout=30)
+        if not self._schema_ready:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS index_jobs ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " collection TEXT NOT NULL,"
+                " payload TEXT NOT NULL,"
+                " attempts INTEGER NOT NULL DEFAULT 0,"
+                " enqueued_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS index_results ("
+                " job_id INTEGER PRIMARY KEY,"
+                " status TEXT NOT NULL,"
+                " version INTEGER NOT NULL,"
+                " done_at REAL NOT NULL)"
+            )
+            conn.commit()
+            self._schema_ready = True
+        return conn
+
+    def enqueue(self, collection_name: str, docs: List[Document], ids: List[str]) -> int:
+        """Encola un upsert de documentos. Regresa el id del trabajo (ver wait_for_job)."""
+        payload = json.dumps(
+            {
+                "ids": ids,
+                "docs": [
+                    {"page_content": d.page_content, "metadata": d.metadata or {}}
+                    for d in docs
+                ],
+            },
+            ensure_ascii=False,
+            default=str,
+        )
+        conn = self._connect()
+        try:
+            job_id = conn.execute(
+                "INSERT INTO index_jobs (collection, payload, enqueued_at) VALUES (?, ?, ?)",
+                (collection_name, payload, time.time()),
+            ).lastrowid
+            conn.commit()
+        finally:
+            conn.close()
+        self.ensure_started()
+        self._wake.set()
+        return job_id
+
+    def pending(self) -> int:
+        """Trabajos en cola (todas las colecciones)."""
+        conn = self._connect()
+        try:
+            return conn.execute("SELECT COUNT(*) FROM index_jobs").fetchone()[0]
+        finally:
+            conn.close()
+
+    # ------------------- versión -------------------
+    def version(self) -> int:
+        """Versión del índice publicada por el escritor (0 si nunca escribió)."""
+        try:
+            with open(self.version_path, encoding="utf-8") as f:
+                return int(f.read().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def _bump_version(self) -> int:
+        new_version = self.version() + 1
+        tmp = f"{self.version_path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(str(new_version))
+        os.replace(tmp, self.version_path)
+        return new_version
+
+    def job_result(self, job_id: int) -> Optional[bool]:
+        """
+        True si el trabajo ya está aplicado y su versión publicada, False si
+        se descartó, None si sigue pendiente.
+        """
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT status, version FROM index_results WHERE job_id = ?", (job_id,)
+            ).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        status, version = row
+        if status != "applied":
+            return False
+        return True if self.version() >= version else None
+
+    def wait_for_job(self, job_id: int, timeout: float) -> bool:
+        """Espera a que ESTE trabajo sea visible para los lectores (True si ocurrió a tiempo)."""
+        deadline = time.monotonic() + timeout
+        while True:
+            result = self.job_result(job_id)
+            if result is not None:
+                return result
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+
+    # ------------------- escritor -------------------
+    def ensure_started(self) -> None:
+        """Arranca (una vez por proceso) el hilo candidato a escritor."""
+        if self._thread and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="index-writer", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self) -> None:
+        """Detiene el hilo y libera el rol de escritor."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        self._release_leadership()
+
+    def _try_acquire_leadership(self) -> bool:
+        if self.is_leader:
+            return True
+        if fcntl is None:
+            self.is_leader = True
+            return True
+        os.makedirs(self.persist_dir, exist_ok=True)
+        fd = open(self.lock_path, "a+")
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            fd.close()
+            return False
+        self._lock_fd = fd
+        self.is_leader = True
+        print(f"[indexer] pid={os.getpid()} es el escritor de {self.persist_dir}")
+        return True
+
+    def _release_leadership(self) -> None:
+        if self._lock_fd is not None:
+            try:
+                fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+            finally:
+                self._lock_fd.close()
+                self._lock_fd = None
+        self.is_leader = False
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            if not self._try_acquire_leadership():
+                # Otro proceso escribe; reintentar por si se cae
+                self._stop.wait(LEADER_RETRY_S)
+                continue
+            try:
+                drained = self.drain_once()
+            except Exception as e:
+                print(f"[indexer] Error drenando la cola: {e}")
+                drained = 0
+            if drained == 0:
+                self._wake.wait(1.0)
+                self._wake.clear()
+
+    def drain_once(self) -> int:
+        """Aplica un lote de la cola. Solo debe llamarlo el escritor."""
+        conn = self._connect()
+        applied = 0
+        # Solo el escritor publica versiones: este lote sale en la siguiente
+        next_version = self.version() + 1
+        try:
+            rows = conn.execute(
+                "SELECT id, collection, payload FROM index_jobs ORDER BY id LIMIT ?",
+                (DRAIN_BATCH,),
+            ).fetchall()
+            if not rows:
+                return 0
+
+            jobs_by_collection: Dict[str, List[int]] = {}
+            docs_by_collection: Dict[str, Dict[str, Document]] = {}
+            for job_id, collection, payload in rows:
+                data = json.loads(payload)
+                jobs_by_collection.setdefault(collection, []).append(job_id)
+                bucket = docs_by_collection.setdefault(collection, {})
+                for doc_id, d in zip(data["ids"], data["docs"]):
+                    # Si el mismo id viene varias veces, gana la última versión
+                    bucket[doc_id] = Document(
+                        page_content=d["page_content"], metadata=d["metadata"]
+                    )
+
+            for collection, docs_by_id in docs_by_collection.items():
+                job_ids = jobs_by_collection[collection]
+                marks = ",".join("?" * len(job_ids))
+                try:
+                    store = self.store_factory(collection)
+                    store.add_documents(
+                        list(docs_by_id.values()), ids=list(docs_by_id.keys())
+                    )
+                except Exception as e:
+                    print(f"[indexer] Error escribiendo en '{collection}': {e}")
+                    conn.execute(
+                        f"UPDATE index_jobs SET attempts = attempts + 1 WHERE id IN ({marks})",
+                        job_ids,
+                    )
+                    dropped = [
+                        r[0]
+                        for r in conn.execute(
+                            f"SELECT id FROM index_jobs WHERE id IN ({marks}) AND attempts >= ?",
+                            (*job_ids, MAX_ATTEMPTS),
+                        )
+                    ]
+                    if dropped:
+                        self._finish_jobs(conn, dropped, "failed", next_version - 1)
+                        print(f"[indexer] {len(dropped)} trabajo(s) descartados tras {MAX_ATTEMPTS} intentos")
+                    conn.commit()
+                    continue
+                self._finish_jobs(conn, job_ids, "applied", next_version)
+                conn.commit()
+                applied += len(job_ids)
+            conn.execute("DELETE FROM index_results WHERE done_at < ?", (time.time() - RESULT_TTL_S,))
+            conn.commit()
+        finally:
+            conn.close()
+
+        if applied:
+            version = self._bump_version()
+            print(f"[indexer] {applied} trabajo(s) aplicados → versión {version}")
+        return applied
+
+    @staticmethod
+    def _finish_jobs(conn: sqlite3.Connection, job_ids: List[int], status: str, version: int) -> None:
+        """Saca los trabajos de la cola y deja su resultado (misma transacción)."""
+        marks = ",".join("?" * len(job_ids))
+        conn.execute(f"DELETE FROM index_jobs WHERE id IN ({marks})", job_ids)
+        now = time.time()
+        conn.executemany(
+            "INSERT OR REPLACE INTO index_results (job_id, status, version, done_at)"
+            " VALUES (?, ?, ?, ?)",
+            [(job_id, status, version, now) for job_id in job_ids],
+        )
@@ -1,59 +1,277 @@
+import hashlib
 import os
+import threading
+import time
+from uuid import NAMESPACE_URL, uuid5
 from langchain_community.vectorstores import Chroma
 from langchain_openai import OpenAIEmbeddings
 from langchain_core.documents import Document
 from langchain_core.tools import tool
-from rag.db_access import retrieve_chat_summary, retrieve_student_info #see if you should set it kind of like a @tool
+from datetime import datetime, timedelta, timezone
+from rag.db_access import retrieve_student_info #see if you should set it kind of like a @tool
+from rag.indexer import IndexingService
+from helpers.summary_schema import ChatSummary, parse_summary, summary_text_of, summary_to_text
 
 PERSIST_DIR = "robot_vector_db"
 COLLECTION_NAME = "robot_problems"
 
-def general_chat_db_use(chat_id : int):
-    """create or update vectorStore for chat summary"""
-    chat_docs, chat_docs_len = retrieve_chat_summary(chat_id)
-    return create_or_update_vectorstore("chat_summary", chat_docs, chat_docs_len)
- 
+# Colecciones que se precargan al arrancar el servidor (ver warm_up_vectorstores)
+WARMUP_COLLECTIONS = [
+    c.strip()
+    for c in os.getenv(
+        "WARMUP_COLLECTIONS", "student_info,chat_summary,robot_support"
+    ).split(",")
+    if c.strip()
+]
+
+# Cuánto espera una petición a que el escritor aplique documentos que
+# ella misma encoló (read-your-writes); 0 = no esperar.
+INDEX_WRITE_WAIT_S = float(os.getenv("INDEX_WRITE_WAIT_S", "5"))
+# Cada cuánto revisan los lectores si hay una versión nueva del índice
+INDEX_REFRESH_INTERVAL_S = float(os.getenv("INDEX_REFRESH_INTERVAL_S", "2"))
+
+# Cliente de embeddings y vectorstores compartidos por el proceso.
+# Abrir Chroma (SQLite + segmentos HNSW) es caro; se hace una sola vez.
+_embedding = None
+_vectorstores: dict = {}
+_vs_lock = threading.Lock()
+_snapshot_version = 0
+_snapshot_checked_at = 0.0
+
+
+def get_embeddings():
+    """Regresa el cliente de embeddings compartido (se crea en el primer uso)."""
+    global _embedding
+    if _embedding is None:
+        with _vs_lock:
+            if _embedding is None:
+                _embedding = OpenAIEmbeddings()
+    return _embedding
+
+
+def _open_vectorstore(collection_name: str) -> Chroma:
+    return Chroma(
+        collection_name=collection_name,
+        embedding_function=get_embeddings(),
+        persist_directory=PERSIST_DIR,
+    )
+
+
+# Todas las escrituras pasan por un único escritor (ver rag/indexer.py)
+indexer = IndexingService(PERSIST_DIR, _open_vectorstore)
+
+
+def index_version() -> int:
+    """Versión actual del índice (cambia cada vez que el escritor aplica un lote)."""
+    return indexer.version()
+
+
+def _refresh_snapshot_if_stale() -> None:
+    """
+    Si otro proceso publicó una versión nueva del índice, descarta los
+    vectorstores cacheados para que la siguiente lectura abra un snapshot
+    fresco. El proceso escritor ya ve sus propias escrituras.
+    """
+    global _snapshot_version, _snapshot_checked_at
+    now = time.monotonic()
+    if now - _snapshot_checked_at < INDEX_REFRESH_INTERVAL_S:
+        return
+    _snapshot_checked_at = now
+    version = indexer.version()
+    if version == _snapshot_version:
+        return
+    if not indexer.is_leader and _vectorstores:
+        from chromadb.api.shared_system_client import SharedSystemClient
+
+        with _vs_lock:
+            _vectorstores.clear()
+            # Las búsquedas en curso conservan su referencia al sistema viejo
+            SharedSystemClient.clear_system_cache()
+        print(f"[rag_logic] Snapshot del índice refrescado (versión {version})")
+    _snapshot_version = version
+
+
+def document_id(collection_name: str, doc: Document) -> str:
+    """
+    Id estable de un documento: usa metadata['id'] si existe y, si no, un
+    hash del contenido. Hace que las escrituras sean upserts idempotentes.
+    """
+    key = (doc.metadata or {}).get("id")
+    if key is None:
+        key = hashlib.sha1(doc.page_content.encode("utf-8")).hexdigest()
+    return str(uuid5(NAMESPACE_URL, f"{collection_name}:{key}"))
+
+
+def get_vectorstore(collection_name: str) -> Chroma:
+    """Regresa (y cachea) el vectorstore persistido de una colección."""
+    _refresh_snapshot_if_stale()
+    vs = _vectorstores.get(collection_name)
+    if vs is not None:
+        return vs
+    get_embeddings()
+    with _vs_lock:
+        vs = _vectorstores.get(collection_name)
+        if vs is None:
+            vs = _open_vectorstore(collection_name)
+            _vectorstores[collection_name] = vs
+    return vs
+
+
+def warm_up_vectorstores(collection_names: list[str] | None = None) -> dict:
+    """
+    Precarga las colecciones configuradas: abre la base, cuenta documentos y
+    hace una búsqueda mínima para que los segmentos HNSW queden en memoria.
+    Devuelve, por colección, docs, tiempo de carga (ms) y error si lo hubo.
+    """
+    names = collection_names if collection_names is not None else WARMUP_COLLECTIONS
+    report: dict = {}
+    probe_vector = None
+
+    for name in names:
+        t0 = time.perf_counter()
+        try:
+            vs = get_vectorstore(name)
+            count = vs._collection.count()
+            if count > 0:
+                if probe_vector is None:
+                    # Un solo embedding sirve para todas las colecciones
+                    # y de paso abre la conexión HTTP del cliente.
+                    probe_vector = get_embeddings().embed_query("warmup")
+                vs.similarity_search_by_vector(probe_vector, k=1)
+            report[name] = {
+                "docs": count,
+                "load_ms": round((time.perf_counter() - t0) * 1000, 1),
+            }
+        except Exception as e:
+            print(f"[warm_up_vectorstores] Error precargando '{name}': {e}")
+            report[name] = {
+                "docs": None,
+                "load_ms": round((time.perf_counter() - t0) * 1000, 1),
+                "error": str(e),
+            }
+    return report
+
+
+# ====================================================
+# Memoria de largo plazo por estudiante (resúmenes de chat)
+# ====================================================
+MEMORY_COLLECTION = "chat_summary"
+
+
+def _to_timestamp(value) -> float:
+    """ISO string / datetime → epoch (Chroma solo filtra rangos numéricos)."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, datetime):
+        dt = value
+    else:
+        try:
+            dt = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+        except ValueError:
+            dt = datetime.now(timezone.utc)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def index_chat_summary(
+    session_id: str,
+    student_email: str | None,
+    summary,
+    updated_at=None,
+) -> None:
+    """
+    Encola el embedding de un resumen de sesión en la memoria del estudiante.
+    `summary` puede ser un ChatSummary, un summary_json guardado o texto libre
+    (resúmenes viejos). Los campos estructurados van también en la metadata.
+    El id del documento es la sesión: re-resumir la misma sesión lo reemplaza.
+    """
+    parsed = summary if isinstance(summary, ChatSummary) else parse_summary(summary)
+    summary_text = summary_to_text(parsed) if parsed else summary_text_of(summary)
+    if not summary_text:
+        return
+    updated_at = updated_at or datetime.now(timezone.utc).isoformat()
+    metadata = {
+        "id": session_id,
+        "session_id": session_id,
+        "student_email": (student_email or "").strip().lower(),
+        "updated_at": str(updated_at),
+        "updated_ts": _to_timestamp(updated_at),
+    }
+    if parsed:
+        # Chroma solo acepta escalares en metadata
+        metadata["topics"] = "; ".join(parsed.topics)
+        metadata["robots"] = ",".join(parsed.robots_mentioned)
+        metadata["summary_json"] = parsed.model_dump_json(exclude_defaults=True)
+    doc = Document(page_content=summary_text, metadata=metadata)
+    indexer.enqueue(
+        MEMORY_COLLECTION, [doc], [document_id(MEMORY_COLLECTION, doc)]
+    )
+
+
+def search_student_memory(
+    student_email: str,
+    query: str,
+    k: int = 3,
+    since_days: int | None = None,
+) -> list[Document]:
+    """
+    Busca en los resúmenes de sesiones pasadas de UN estudiante, filtrando
+    por email y (opcional) antigüedad, en una sola consulta vectorial.
+    """
+    email = (student_email or "").strip().lower()
+    if not email:
+        return []
+    conditions = [{"student_email": email}]
+    if since_days:
+        since = datetime.now(timezone.utc) - timedelta(days=since_days)
+        conditions.append({"updated_ts": {"$gte": since.timestamp()}})
+    where = conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+    vs = get_vectorstore(MEMORY_COLLECTION)
+    return vs.similarity_search(query, k=k, filter=where)
+
+
 def general_student_db_use(name_or_email : str):
     """create or update vectorStore for student"""
     student_docs, student_docs_len = retrieve_student_info(name_or_email)
     return create_or_update_vectorstore("student_info", student_docs, student_docs_len)
-    
+
 def create_or_update_vectorstore(
-    collection_name : str, 
-    docs : list[Document], 
-    docs_len: int 
+    collection_name : str,
+    docs : list[Document],
+    docs_len: int
 ):
-    """Crea o actualiza el vector store basado en la DB."""  
-    #add docs from certain table
-    embedding = OpenAIEmbeddings()
-
-    # Caso 1: si la base ya existe, cargarla y revisar tamaño
-    if os.path.exists(PERSIST_DIR):
-        print(" Vector database found, checking for updates...")
-        vectorstore = Chroma(
-            collection_name=collection_name,
-            embedding_function=embedding,
-            persist_directory=PERSIST_DIR
-        )
-        
-        # Verificar si hay más filas en CSV que documentos existentes
-        current_count = len(vectorstore.get()["ids"])
-        if current_count < docs_len:
-            print(f" Updating database with {docs_len - current_count} new entries...")
-            new_docs = docs[current_count:]  # solo los nuevos
-            vectorstore.add_documents(new_docs)
-            vectorstore.persist()
-        else:
-            print(" No updates needed.")
-    else:
-        print("Creating new vector database...")
-        vectorstore = Chroma.from_documents(
-            documents=docs,
-            embedding=embedding,
-            collection_name=collection_name,
-            persist_directory=PERSIST_DIR
-        )
-        vectorstore.persist()
-        print("Vector database created successfully.")
-    
+    """
+    Regresa el vector store de la colección y encola los documentos que aún
+    no estén indexados. La escritura la hace el escritor único del índice;
+    aquí solo se lee (sin locks) y, si hubo algo nuevo, se espera un poco a
+    que el escritor publique la versión con ESE trabajo.
+    """
+    global _snapshot_checked_at
+    vectorstore = get_vectorstore(collection_name)
+    docs = docs[:docs_len]
+    if not docs:
+        return vectorstore
+
+    ids = [document_id(collection_name, d) for d in docs]
+    stored = vectorstore.get(ids=ids, include=["documents"])
+    existing = dict(zip(stored["ids"], stored["documents"]))
+    # Nuevos o con contenido distinto (p.ej. perfil actualizado)
+    new_docs = [
+        (i, d) for i, d in zip(ids, docs) if existing.get(i) != d.page_content
+    ]
+    if not new_docs:
+        print(" No updates needed.")
+        return vectorstore
+
+    print(f" Queueing {len(new_docs)} new entries for '{collection_name}'...")
+    job_id = indexer.enqueue(
+        collection_name,
+        [d for _, d in new_docs],
+        [i for i, _ in new_docs],
+    )
+    if INDEX_WRITE_WAIT_S > 0 and indexer.wait_for_job(job_id, INDEX_WRITE_WAIT_S):
+        _snapshot_checked_at = 0.0  # forzar revisión de snapshot
+        vectorstore = get_vectorstore(collection_name)
     return vectorstore
@@ -0,0 +1,158 @@
+"""
+Caché de recuperación entre turnos (vive en State["retrieval_cache"]).
+
+Cuando el estudiante hace varias preguntas de seguimiento sobre el mismo
+problema, el agente vuelve a llamar retrieve_robot_support/retrieve_context.
+Si la consulta es (casi) la misma, reutilizamos el resultado anterior en
+lugar de repetir reescritura de query + embedding + búsqueda.
+
+Cada entrada guarda: tool, argumentos (sin la query), query normalizada,
+embedding de la query, ids de documentos, versión del índice y `ref`: el
+tool_call_id con el que el resultado quedó en helpers/tool_store.py (el
+texto no viaja en el checkpoint). Las entradas de otra versión del índice se
+descartan, y las de retrieve_context (llevan texto del perfil, p. ej.
+[ESTILO_APRENDIZAJE]) también cuando una tool modifica el perfil.
+"""
+
+import json
+import math
+import os
+import re
+import time
+import unicodedata
+from typing import Callable, List, Optional, Tuple
+
+# Tools cacheables → nombre del argumento que contiene la consulta
+CACHEABLE_TOOLS = {
+    "retrieve_robot_support": "query",
+    "retrieve_context": "query",
+}
+
+# Tools cuyo resultado incluye el perfil vivo del estudiante
+PROFILE_DEPENDENT_TOOLS = {"retrieve_context"}
+# Tools que modifican el perfil (invalidan las anteriores)
+PROFILE_TOOLS = {
+    "update_student_goals",
+    "update_learning_style",
+    "update_student_info",
+    "register_new_student",
+}
+
+MAX_ENTRIES = int(os.getenv("RETRIEVAL_CACHE_SIZE", "8"))
+SIMILARITY_THRESHOLD = float(os.getenv("RETRIEVAL_CACHE_SIMILARITY", "0.95"))
+
+
+def normalize_query(query: str) -> str:
+    """Minúsculas, sin acentos ni puntuación, espacios colapsados."""
+    text = unicodedata.normalize("NFKD", query or "")
+    text = "".join(c for c in text if not unicodedata.combining(c)).lower()
+    text = re.sub(r"[^\w\s]", " ", text)
+    return " ".join(text.split())
+
+
+def args_key(tool_name: str, args: dict) -> str:
+    """Clave de los argumentos que NO son la consulta (p.ej. el estudiante)."""
+    query_arg = CACHEABLE_TOOLS.get(tool_name)
+    rest = {
+        k: (v.strip().lower() if isinstance(v, str) else v)
+        for k, v in (args or {}).items()
+        if k != query_arg
+    }
+    return json.dumps(rest, sort_keys=True, ensure_ascii=False, default=str)
+
+
+def cosine(a: List[float], b: List[float]) -> float:
+    """Similitud coseno (0 si algún vector es vacío)."""
+    if not a or not b or len(a) != len(b):
+        return 0.0
+    dot = sum(x * y for x, y in zip(a, b))
+    na = math.sqrt(sum(x * x for x in a))
+    nb = math.sqrt(sum(y * y for y in b))
+    return dot / (na * nb) if na and nb else 0.0
+
+
+def prune(cache: Optional[List[dict]], index_version: int) -> List[dict]:
+    """Quita entradas de otra versión del índice y aplica el tope de tamaño."""
+    valid = [e for e in (cache or []) if e.get("index_version") == index_version]
+    return valid[-MAX_ENTRIES:]
+
+
+def drop_profile_entries(cache: Optional[List[dict]]) -> List[dict]:
+    """Quita las entradas que incluyen texto del perfil (tras modificarlo)."""
+    return [e for e in (cache or []) if e.get("tool") not in PROFILE_DEPENDENT_TOOLS]
+
+
+def lookup(
+    cache: List[dict],
+    tool_name: str,
+    args: dict,
+    embed_query: Callable[[str], List[float]],
+) -> Tuple[Optional[dict], Optional[List[float]]]:
+    """
+    Busca una entrada reutilizable para esta llamada.
+    Primero compara la query normalizada (sin costo); solo si no hay match
+    exacto embebe la query y busca la más parecida sobre el umbral.
+    Regresa (entrada o None, embedding calculado o None).
+    """
+    query = (args or {}).get(CACHEABLE_TOOLS[tool_name]) or ""
+    norm = normalize_query(query)
+    key = args_key(tool_name, args)
+    candidates = [
+        e for e in cache if e.get("tool") == tool_name and e.get("args_key") == key
+    ]
+    for e in candidates:
+        if e.get("query_norm") == norm:
+            return e, None
+    if not candidates:
+        return None, None
+
+    embedding = embed_query(query)
+    best, best_sim = None, SIMILARITY_THRESHOLD
+    for e in candidates:
+        sim = cosine(embedding, e.get("embedding") or [])
+        if sim >= best_sim:
+            best, best_sim = e, sim
+    return best, embedding
+
+
+def remember(
+    cache: List[dict],
+    tool_name: str,
+    args: dict,
+    embedding: List[float],
+    ref: str,
+    doc_ids: List[str],
+    index_version: int,
+) -> List[dict]:
+    """
+    Agrega (o reemplaza) la entrada de esta consulta y aplica el tope. `ref`
+    apunta al resultado guardado en el almacén de tool outputs.
+    """
+    query = (args or {}).get(CACHEABLE_TOOLS[tool_name]) or ""
+    entry = {
+        "tool": tool_name,
+        "args_key": args_key(tool_name, args),
+        "query": query,
+        "query_norm": normalize_query(query),
+        # Redondeado: el caché viaja en el checkpoint del hilo
+        "embedding": [round(x, 5) for x in embedding],
+        "doc_ids": list(doc_ids or []),
+        "ref": ref,
+        "index_version": index_version,
+        "created_at": time.time(),
+    }
+    rest = [
+        e
+        for e in cache
+        if not (
+            e.get("tool") == tool_name
+            and e.get("args_key") == entry["args_key"]
+            and e.get("query_norm") == entry["query_norm"]
+        )
+    ]
+    return (rest + [entry])[-MAX_ENTRIES:]
+
+
+def touch(cache: List[dict], entry: dict) -> List[dict]:
+    """Mueve una entrada al final (LRU) tras un acierto."""
+    return [e for e in cache if e is not entry] + [entry]
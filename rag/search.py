@@ -0,0 +1,31 @@
+"""Búsqueda semántica sobre los vectorstores de Chroma."""
+
+# Parámetros MMR por defecto (los usan las tools y el benchmark)
+DEFAULT_K = 3
+MIN_FETCH_K = 8
+
+
+def default_fetch_k(k: int) -> int:
+    """Número de candidatos que MMR trae antes de diversificar."""
+    return max(MIN_FETCH_K, 2 * k)
+
+
+def semantic_search(
+    vs,
+    query: str,
+    k: int = DEFAULT_K,
+    fetch_k: int | None = None,
+    search_type: str = "mmr",
+):
+    """
+    Búsqueda semántica explícita con MMR (diversidad).
+    Internamente Chroma embebe el query y compara contra el índice.
+    """
+    search_kwargs = {"k": k}                 # docs finales
+    if search_type == "mmr":
+        search_kwargs["fetch_k"] = fetch_k or default_fetch_k(k)  # docs candidatos
+    retriever = vs.as_retriever(
+        search_type=search_type,             # "mmr" en lugar de similarity simple
+        search_kwargs=search_kwargs,
+    )
+    return retriever.invoke(query)
@@ -0,0 +1,13 @@
+-- Resúmenes incrementales de chat (helpers/summary_job.py)
+--
+-- summarized_until: created_at del último mensaje incorporado al resumen
+--                   (marca de agua; solo se resumen mensajes posteriores).
+-- message_count:    mensajes acumulados que cubre el resumen.
+
+alter table public.chat_summary
+  add column if not exists summarized_until timestamptz,
+  add column if not exists message_count integer not null default 0;
+
+-- El job hace upsert on_conflict=session_id
+create unique index if not exists chat_summary_session_id_key
+  on public.chat_summary (session_id);
@@ -0,0 +1,23 @@
+-- Resúmenes estructurados (helpers/summary_schema.py)
+--
+-- summary_json guarda un objeto compacto validado:
+--   {"topics": [...], "questions": [...], "solutions": [...],
+--    "actions": [...], "robots_mentioned": [...], "v": 1}
+-- (las listas vacías se omiten). Los resúmenes viejos en texto libre se
+-- conservan como string JSON.
+
+create or replace function public.try_jsonb(value text) returns jsonb
+language plpgsql immutable as $$
+begin
+  return value::jsonb;
+exception when others then
+  return to_jsonb(value);
+end;
+$$;
+
+alter table public.chat_summary
+  alter column summary_json type jsonb using public.try_jsonb(summary_json::text);
+
+-- Analítica: sesiones por robot mencionado
+create index if not exists chat_summary_robots_idx
+  on public.chat_summary using gin ((summary_json -> 'robots_mentioned'));
@@ -0,0 +1,27 @@
+-- Avance agregado de un proyecto (helpers/practice.py: project_progress,
+-- endpoints /projects/{id}/progress y /sessions/{id}/progress)
+--
+-- Una fila por task con total de pasos y pasos completados, calculada en
+-- el servidor: el dashboard no baja los pasos ni pasa por el agente.
+
+create or replace function public.project_progress(
+  p_project_id public.project_tasks.project_id%type
+) returns table (
+  task_id public.project_tasks.id%type,
+  title text,
+  created_at timestamptz,
+  total_steps integer,
+  completed_steps integer
+)
+language sql stable as $$
+  select t.id,
+         t.title,
+         t.created_at,
+         count(s.id)::integer,
+         (count(s.id) filter (where s.is_completed))::integer
+    from public.project_tasks t
+    left join public.task_steps s on s.task_id = t.id
+   where t.project_id = p_project_id
+   group by t.id, t.title, t.created_at
+   order by t.created_at nulls last, t.id;
+$$;
@@ -0,0 +1,36 @@
+-- Mutaciones atómicas del perfil (rag/db_access.py: append_student_goal,
+-- merge_learning_style)
+--
+-- Cada función modifica el JSONB en el servidor con un solo UPDATE (el
+-- candado de fila serializa las llamadas concurrentes), sin leer el perfil
+-- antes. El estudiante se identifica por id o, si no viene, por email.
+-- Regresan el nombre y el valor resultante; ninguna fila = no existe.
+
+create or replace function public.append_student_goal(
+  p_goal text,
+  p_student_id uuid default null,
+  p_email text default null
+) returns table (full_name text, goals jsonb)
+language sql as $$
+  update public.students s
+     set goals = case
+       when coalesce(s.goals, '[]'::jsonb) ? p_goal then coalesce(s.goals, '[]'::jsonb)
+       else coalesce(s.goals, '[]'::jsonb) || to_jsonb(p_goal)
+     end
+   where (p_student_id is not null and s.id = p_student_id)
+      or (p_student_id is null and s.email = p_email)
+  returning s.full_name, s.goals;
+$$;
+
+create or replace function public.merge_learning_style(
+  p_patch jsonb,
+  p_student_id uuid default null,
+  p_email text default null
+) returns table (full_name text, learning_style jsonb)
+language sql as $$
+  update public.students s
+     set learning_style = coalesce(s.learning_style, '{}'::jsonb) || p_patch
+   where (p_student_id is not null and s.id = p_student_id)
+      or (p_student_id is null and s.email = p_email)
+  returning s.full_name, s.learning_style;
+$$;
@@ -0,0 +1,20 @@
+import httpx
+import pytest
+
+
+@pytest.fixture
+def make_dal():
+    """Fábrica de DataAccess sobre un MockTransport; cierra cada instancia al terminar."""
+    # Import diferido: rag.db_access exige SUPABASE_URL/SUPABASE_KEY al importarse
+    from rag.db_access import DataAccess
+
+    created = []
+
+    def _make(handler):
+        dal = DataAccess("https://x.supabase.co", "k", transport=httpx.MockTransport(handler))
+        created.append(dal)
+        return dal
+
+    yield _make
+    for dal in created:
+        dal.close()
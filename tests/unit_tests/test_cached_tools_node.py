@@ -0,0 +1,72 @@
+import importlib
+
+from langchain_core.messages import AIMessage, ToolMessage
+
+from helpers.tool_store import ToolOutputStore
+
+graph_module = importlib.import_module("agent.graph")
+
+
+class FakeToolsNode:
+    def __init__(self):
+        self.calls = []
+
+    def invoke(self, state, config=None):
+        calls = state["messages"][-1].tool_calls
+        self.calls.extend(c["name"] for c in calls)
+        return {
+            "messages": [
+                ToolMessage(
+                    content=f"[ESTILO_APRENDIZAJE] visual {len(self.calls)}",
+                    name=c["name"],
+                    tool_call_id=c["id"],
+                    artifact={"doc_ids": ["d1"]},
+                )
+                for c in calls
+            ]
+        }
+
+
+class FakeEmbeddings:
+    def embed_query(self, text):
+        return [1.0, 0.0]
+
+
+def _call(call_id, name="retrieve_context", **args):
+    return {"name": name, "args": {"name_or_email": "ana@tec.mx", "query": "pid", **args},
+            "id": call_id}
+
+
+def _run(state, *calls):
+    state["messages"] = [AIMessage(content="", tool_calls=list(calls))]
+    out = graph_module.cached_tools_node(state, {"configurable": {"thread_id": "s1"}})
+    state["retrieval_cache"] = out["retrieval_cache"]
+    return out
+
+
+def test_cache_keeps_refs_and_drops_profile_results_on_updates(monkeypatch, tmp_path) -> None:
+    fake = FakeToolsNode()
+    monkeypatch.setattr(graph_module, "tools_node", fake)
+    monkeypatch.setattr(graph_module, "get_embeddings", lambda: FakeEmbeddings())
+    monkeypatch.setattr(graph_module, "index_version", lambda: 1)
+    monkeypatch.setattr(graph_module, "tool_outputs", ToolOutputStore(str(tmp_path / "t.sqlite3")))
+    state = {"session_id": "s1"}
+
+    _run(state, _call("c1"))
+    # El checkpoint solo lleva la referencia, no el texto
+    assert [e["ref"] for e in state["retrieval_cache"]] == ["c1"]
+    assert "result" not in state["retrieval_cache"][0]
+
+    out = _run(state, _call("c2"))
+    assert fake.calls == ["retrieve_context"]
+    assert out["messages"][0].content == "[ESTILO_APRENDIZAJE] visual 1"
+    assert out["messages"][0].artifact["cache_hit"] is True
+
+    # Cambia el perfil: lo cacheado y lo recuperado en la misma ronda no sirven
+    style = {"name": "update_learning_style", "args": {"name_or_email": "ana@tec.mx",
+                                                       "style": "ejemplos"}, "id": "c3"}
+    _run(state, style, _call("c4"))
+    assert state["retrieval_cache"] == []
+    _run(state, _call("c5"))
+    assert fake.calls == ["retrieve_context", "update_learning_style", "retrieve_context",
+                          "retrieve_context"]
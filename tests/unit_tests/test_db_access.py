@@ -0,0 +1,140 @@
+import asyncio
+import contextvars
+import json
+import threading
+
+import httpx
+import pytest
+
+import rag.db_access as db_access
+
+
+def test_sync_and_async_helpers_share_one_client(make_dal) -> None:
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(
+            200, json=[{"id": "1", "email": "ana@tec.mx", "full_name": "Ana Pérez"}]
+        )
+
+    dal = make_dal(handler)
+    assert dal.fetch_student("ana@tec.mx")["id"] == "1"
+
+    async def from_other_loop():
+        return await dal.afetch_student("ana perez")
+
+    assert asyncio.run(from_other_loop())["email"] == "ana@tec.mx"
+    assert requests[0].url.path == "/rest/v1/students"
+    assert requests[0].url.params["email"] == "eq.ana@tec.mx"
+    # Nombre: carga del índice y luego la fila por id
+    assert requests[1].url.params["select"] == "id,full_name,email,last_seen"
+    assert requests[2].url.params["id"] == "eq.1"
+    assert requests[0].headers["apikey"] == "k"
+    first_http = dal._http
+    dal.list_task_steps("t1")
+    assert dal._http is first_http
+
+
+def test_retries_gateway_errors_only_when_idempotent(make_dal) -> None:
+    calls = {"GET": 0, "POST": 0}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls[request.method] += 1
+        if calls[request.method] == 1:
+            return httpx.Response(502, text="bad gateway")
+        return httpx.Response(200, json=[json.loads(request.content or b"{}")])
+
+    dal = make_dal(handler)
+    assert dal.list_project_tasks("p1") == [{}]
+    assert calls["GET"] == 2
+    with pytest.raises(Exception):
+        dal.insert_message({"session_id": "s", "role": "student", "content": "hola"})
+    assert calls["POST"] == 1
+
+
+def test_sync_call_from_dal_loop_is_rejected(make_dal) -> None:
+    dal = make_dal(lambda request: httpx.Response(200, json=[]))
+
+    async def nested():
+        return dal.fetch_student("x@y.z")
+
+    with pytest.raises(RuntimeError):
+        dal._submit(nested()).result(timeout=5)
+
+
+def test_track_queries_counts_round_trips_per_table(capsys, monkeypatch, make_dal) -> None:
+    monkeypatch.setattr(db_access, "SLOW_QUERY_MS", 0.001)
+    dal = make_dal(lambda request: httpx.Response(200, json=[{"id": "1"}]))
+    dal.list_task_steps("outside")
+    with db_access.track_queries() as stats:
+        dal.fetch_student("ana@tec.mx")
+        # Hilo que hereda el contexto (como un nodo síncrono del grafo)
+        ctx = contextvars.copy_context()
+        t = threading.Thread(target=ctx.run, args=(dal.list_task_steps, "t1"))
+        t.start()
+        t.join()
+    summary = stats.summary()
+    assert summary["queries"] == 2
+    assert set(summary["tables"]) == {"students", "task_steps"}
+    assert summary["bytes_received"] == 2 * len(b'[{"id":"1"}]')
+    assert "consulta lenta" in capsys.readouterr().out
+
+
+def test_find_students_resolves_names_locally(make_dal) -> None:
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        if "or" in request.url.params:
+            return httpx.Response(200, json=[])
+        return httpx.Response(
+            200,
+            json=[
+                {"id": "1", "full_name": "Ana Pérez López", "email": "ana@tec.mx"},
+                {"id": "2", "full_name": "Luis Gómez", "email": "luis@tec.mx"},
+            ],
+        )
+
+    dal = make_dal(handler)
+    rows = dal.find_students(["ana@tec.mx"], ["Luis Gomez", 'Mario "Ma" Ruiz'])
+    assert [r["id"] for r in rows] == ["2"]
+    assert rows[0]["query"] == "Luis Gomez"
+    email_query = [r for r in requests if "or" in r.url.params]
+    assert len(email_query) == 1
+    assert email_query[0].url.params["or"] == '(email.in.("ana@tec.mx"))'
+    # Segunda búsqueda: el índice ya está cargado, sin round-trips
+    before = len(requests)
+    assert dal.search_student_names("ana lopez")[0]["id"] == "1"
+    assert len(requests) == before
+
+
+def test_fetch_student_ignores_fuzzy_only_names(make_dal) -> None:
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(
+            200, json=[{"id": "1", "full_name": "Juana Pérez", "email": "j@tec.mx"}]
+        )
+
+    dal = make_dal(handler)
+    assert dal.fetch_student("Pedro Pérez") is None
+    assert dal.fetch_student("Juan Perez") is None
+    # Solo se cargó el índice: ninguna fila de otro estudiante
+    assert len(requests) == 1
+
+
+def test_name_lookup_falls_back_to_ilike_without_index(make_dal) -> None:
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        if request.url.params.get("select") == "id,full_name,email,last_seen":
+            return httpx.Response(400, json={"message": "denied", "code": "42501"})
+        return httpx.Response(200, json=[])
+
+    dal = make_dal(handler)
+    dal.find_students([], ['Luis "Lu" Gómez'])
+    assert requests[-1].url.params["or"] == '(full_name.ilike."*Luis \\"Lu\\" Gómez*")'
+    assert requests[-1].url.params["limit"] == "5"
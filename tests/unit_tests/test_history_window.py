@@ -0,0 +1,74 @@
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+
+from helpers.history_window import HistoryFolder, build_window, fold_history, split_turns
+
+
+def _session(turns: int):
+    messages = []
+    for i in range(turns):
+        messages.append(HumanMessage(content=f"pregunta {i}", id=f"h{i}"))
+        messages.append(
+            AIMessage(content="", id=f"a{i}", tool_calls=[{"name": "retrieve_context", "args": {"query": "q"}, "id": f"c{i}"}])
+        )
+        messages.append(ToolMessage(content="documento " * 200, tool_call_id=f"c{i}", id=f"t{i}"))
+        messages.append(AIMessage(content=f"respuesta {i}", id=f"r{i}"))
+    return messages
+
+
+class FakeLLM:
+    def __init__(self):
+        self.prompts = []
+
+    def invoke(self, prompt):
+        self.prompts.append(prompt)
+        return AIMessage(content="El estudiante preguntó por sensores.")
+
+
+def test_window_cuts_only_at_human_boundaries() -> None:
+    messages = _session(6)
+    window, stats = build_window(messages, None, None, budget=500)
+    assert isinstance(window[0], HumanMessage)
+    assert stats["turns_dropped"] > 0
+    assert stats["history_tokens"] <= 500 or stats["turns_sent"] == 1
+    # Cada ToolMessage va con su AIMessage con tool_calls
+    ids = {m.id for m in window}
+    assert all(f"a{m.id[1:]}" in ids for m in window if isinstance(m, ToolMessage))
+
+
+def test_current_turn_is_sent_even_over_budget() -> None:
+    window, stats = build_window(_session(2), None, None, budget=10)
+    assert [m.id for m in window] == ["h1", "a1", "t1", "r1"]
+    assert stats["turns_sent"] == 1
+
+
+def test_fold_advances_cursor_and_window_uses_summary() -> None:
+    messages = _session(7)
+    llm = FakeLLM()
+    update = fold_history(messages, None, None, llm, keep_turns=4, batch=2)
+    assert update["history_summary_upto"] == "r2"
+    assert "pregunta 0" in llm.prompts[0]
+
+    window, _ = build_window(messages, update["history_summary"], update["history_summary_upto"], 100000)
+    assert isinstance(window[0], SystemMessage)
+    assert window[1].id == "h3"
+    assert len(split_turns(window[1:])) == 4
+    # Sin turnos viejos suficientes no se llama al LLM
+    assert fold_history(messages, update["history_summary"], "r2", llm, keep_turns=4, batch=2) == {}
+    assert len(llm.prompts) == 1
+
+
+def test_folder_runs_after_the_turn_and_applies_once() -> None:
+    messages = _session(7)
+    llm = FakeLLM()
+    folder = HistoryFolder()
+    # Pocos turnos: ni siquiera se encarga
+    assert folder.submit("s1", _session(3), None, None, llm, keep_turns=4, batch=2) is None
+    folder.submit("s1", messages, None, None, llm, keep_turns=4, batch=2).result(timeout=5)
+    assert len(llm.prompts) == 1
+    # Otro cursor (el State ya avanzó por otro lado): el resultado se descarta
+    assert folder.take("s1", "r0") == {}
+    folder.submit("s1", messages, None, None, llm, keep_turns=4, batch=2).result(timeout=5)
+    update = folder.take("s1", None)
+    assert update == {"history_summary": "El estudiante preguntó por sensores.", "history_summary_upto": "r2"}
+    assert folder.take("s1", None) == {}
+    assert folder.take("otra", None) == {}
@@ -0,0 +1,50 @@
+import Settings.tools as tools
+from helpers.name_index import NameIndex
+from Settings.tools import _identity_candidates, identify_user_from_message
+
+
+def test_identity_candidates_extracts_emails_and_name_pairs() -> None:
+    emails, names = _identity_candidates(
+        "Hola, soy Ana Pérez (ana.perez@tec.mx). Mi correo viejo: ana.perez@tec.mx!"
+    )
+    assert emails == ["ana.perez@tec.mx"]
+    assert names == ["Ana Pérez"]
+    assert _identity_candidates("sin nombres ni correos") == ([], [])
+
+
+def test_identify_user_uses_one_lookup_and_keeps_priority(monkeypatch) -> None:
+    calls = []
+
+    def find_students(emails, names):
+        calls.append((emails, names))
+        return [
+            {"email": "luis@tec.mx", "full_name": "Luis Gómez"},
+            {"email": "ana@tec.mx", "full_name": "Ana Pérez"},
+        ]
+
+    monkeypatch.setattr(tools.db, "find_students", find_students)
+    message = "Mi amigo Luis Gómez y yo (ana@tec.mx) queremos ayuda"
+    assert identify_user_from_message.invoke({"message": message}) == "FOUND:ana@tec.mx:Ana Pérez"
+    assert len(calls) == 1
+
+    monkeypatch.setattr(tools.db, "find_students", lambda emails, names: [])
+    assert identify_user_from_message.invoke({"message": "Hola Mundo"}) == "NOT_FOUND"
+
+
+def test_greetings_do_not_resolve_to_fuzzy_matches(monkeypatch) -> None:
+    index = NameIndex()
+    index.add({"id": "1", "full_name": "Ana Holguín", "email": "ana.h@tec.mx"})
+    index.add({"id": "2", "full_name": "Mario Buenrostro", "email": "mario@tec.mx"})
+
+    def find_students(emails, names):
+        # Igual que DataAccess.afind_students: candidatos del índice por nombre
+        return [{**row, "query": name} for name in names for row in index.search(name)]
+
+    monkeypatch.setattr(tools.db, "find_students", find_students)
+    assert index.best("Hola Ana") is not None
+    assert identify_user_from_message.invoke({"message": "Hola Ana, tengo una duda"}) == "NOT_FOUND"
+    assert identify_user_from_message.invoke({"message": "Buenos Días Mario"}) == "NOT_FOUND"
+    assert (
+        identify_user_from_message.invoke({"message": "Soy Mario Buenrostro"})
+        == "FOUND:mario@tec.mx:Mario Buenrostro"
+    )
@@ -0,0 +1,71 @@
+from langchain_core.documents import Document
+
+from rag.indexer import IndexingService
+
+
+class _FakeStore:
+    def __init__(self):
+        self.docs = {}
+
+    def add_documents(self, docs, ids):
+        self.docs.update(zip(ids, (d.page_content for d in docs)))
+
+
+def test_drain_applies_queued_upserts_and_bumps_version(tmp_path) -> None:
+    store = _FakeStore()
+    svc = IndexingService(str(tmp_path), lambda name: store)
+    svc.ensure_started = lambda: None  # drenamos a mano, sin hilo
+
+    svc.enqueue("robot_support", [Document(page_content="v1")], ["a"])
+    svc.enqueue("robot_support", [Document(page_content="v2")], ["a"])
+    svc.enqueue("robot_support", [Document(page_content="b")], ["b"])
+    assert svc.pending() == 3 and svc.version() == 0
+
+    assert svc.drain_once() == 3
+    assert store.docs == {"a": "v2", "b": "b"}
+    assert svc.pending() == 0 and svc.version() == 1
+    assert svc.drain_once() == 0 and svc.version() == 1
+
+
+def test_failing_jobs_are_dropped_after_max_attempts(tmp_path, monkeypatch) -> None:
+    import rag.indexer as indexer_mod
+
+    monkeypatch.setattr(indexer_mod, "MAX_ATTEMPTS", 2)
+
+    def broken(name):
+        raise RuntimeError("boom")
+
+    svc = IndexingService(str(tmp_path), broken)
+    svc.ensure_started = lambda: None
+    svc.enqueue("student_info", [Document(page_content="x")], ["x"])
+    assert svc.drain_once() == 0 and svc.pending() == 1
+    assert svc.drain_once() == 0 and svc.pending() == 0
+    assert svc.version() == 0
+
+
+def test_wait_for_job_tracks_the_callers_own_write(tmp_path, monkeypatch) -> None:
+    import rag.indexer as indexer_mod
+
+    monkeypatch.setattr(indexer_mod, "DRAIN_BATCH", 1)
+    monkeypatch.setattr(indexer_mod, "MAX_ATTEMPTS", 1)
+    store = _FakeStore()
+    svc = IndexingService(str(tmp_path), lambda name: store)
+    svc.ensure_started = lambda: None
+
+    other = svc.enqueue("robot_support", [Document(page_content="otro")], ["o"])
+    mine = svc.enqueue("robot_support", [Document(page_content="mío")], ["m"])
+    assert svc.drain_once() == 1
+    # Otro trabajo subió la versión, pero el mío sigue en cola
+    assert svc.version() == 1 and svc.job_result(other) is True
+    assert svc.wait_for_job(mine, timeout=0.1) is False
+    assert svc.drain_once() == 1
+    assert svc.wait_for_job(mine, timeout=0.1) is True and store.docs["m"] == "mío"
+
+    def failing(name):
+        raise RuntimeError("boom")
+
+    broken = IndexingService(str(tmp_path / "b"), failing)
+    broken.ensure_started = lambda: None
+    lost = broken.enqueue("robot_support", [Document(page_content="x")], ["x"])
+    assert broken.drain_once() == 0
+    assert broken.job_result(lost) is False
@@ -0,0 +1,98 @@
+import threading
+import time
+
+from helpers.jobs import JobRunner, register_job
+
+
+def _wait_for(runner: JobRunner, job_id: str, statuses, timeout: float = 5.0) -> dict:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = runner.get(job_id)
+        if job["status"] in statuses:
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"job {job_id} stuck in {runner.get(job_id)['status']}")
+
+
+def test_jobs_run_with_concurrency_limit_and_cancel(tmp_path) -> None:
+    active, peak = [0], [0]
+    lock = threading.Lock()
+    release = threading.Event()
+
+    @register_job("test_slow")
+    def slow(params, ctx):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        while not release.is_set() and not ctx.cancelled():
+            time.sleep(0.01)
+        with lock:
+            active[0] -= 1
+        return {"n": params["n"]}
+
+    runner = JobRunner(str(tmp_path / "jobs.sqlite3"), max_concurrency=1)
+    try:
+        first = runner.enqueue("test_slow", {"n": 1})
+        second = runner.enqueue("test_slow", {"n": 2})
+        third = runner.enqueue("test_slow", {"n": 3})
+        _wait_for(runner, first, {"running"})
+        assert runner.get(second)["status"] == "queued"
+
+        # En cola: se cancela al momento y nunca corre
+        assert runner.cancel(third)["status"] == "cancelled"
+
+        release.set()
+        assert _wait_for(runner, first, {"succeeded"})["result"] == {"n": 1}
+        assert _wait_for(runner, second, {"succeeded"})["result"] == {"n": 2}
+        assert peak[0] == 1
+        assert runner.get(third)["started_at"] is None
+
+        # En ejecución: cancelación cooperativa
+        release.clear()
+        fourth = runner.enqueue("test_slow", {"n": 4})
+        _wait_for(runner, fourth, {"running"})
+        runner.cancel(fourth)
+        assert _wait_for(runner, fourth, {"cancelled"})["cancel_requested"]
+    finally:
+        release.set()
+        runner.stop()
+
+
+def test_failed_job_records_error(tmp_path) -> None:
+    @register_job("test_broken")
+    def broken(params, ctx):
+        raise RuntimeError("boom")
+
+    runner = JobRunner(str(tmp_path / "jobs.sqlite3"))
+    try:
+        job_id = runner.enqueue("test_broken")
+        job = _wait_for(runner, job_id, {"failed"})
+        assert job["error"] == "boom"
+    finally:
+        runner.stop()
+
+
+def test_singleton_kind_reuses_queued_or_running_job(tmp_path) -> None:
+    release = threading.Event()
+
+    @register_job("test_singleton", singleton=True)
+    def single(params, ctx):
+        while not release.is_set() and not ctx.cancelled():
+            time.sleep(0.01)
+        return {}
+
+    runner = JobRunner(str(tmp_path / "jobs.sqlite3"))
+    other = JobRunner(str(tmp_path / "jobs.sqlite3"))  # otro proceso, misma tabla
+    try:
+        first = runner.enqueue("test_singleton")
+        assert other.enqueue("test_singleton") == first
+        _wait_for(runner, first, {"running"})
+        assert runner.enqueue("test_singleton") == first
+
+        release.set()
+        _wait_for(runner, first, {"succeeded"})
+        assert runner.enqueue("test_singleton") != first
+    finally:
+        release.set()
+        runner.stop()
+        other.stop()
@@ -0,0 +1,57 @@
+from helpers.name_index import NameIndex, name_contains, normalize_name
+
+
+def _index() -> NameIndex:
+    index = NameIndex()
+    index.add({"id": 1, "full_name": "José Ángel Pérez", "email": "jose@tec.mx"})
+    index.add({"id": 2, "full_name": "Ana Pérez López", "email": "ana@tec.mx"})
+    index.add({"id": 3, "full_name": "Ana Paula Ruiz", "email": "paula@tec.mx"})
+    return index
+
+
+def test_normalize_name_strips_accents_and_punctuation() -> None:
+    assert normalize_name("  José-Ángel  PÉREZ ") == "jose angel perez"
+
+
+def test_search_is_accent_insensitive_and_ranked() -> None:
+    index = _index()
+    found = index.search("jose angel perez")
+    assert found[0]["id"] == 1 and found[0]["score"] == 1.0
+    ranked = index.search("Ana Perez")
+    assert ranked[0]["id"] == 2
+    assert ranked[0]["score"] > ranked[1]["score"] >= ranked[-1]["score"]
+    assert index.best("Zacarías") is None
+
+
+def test_add_replaces_and_remove_unindexes() -> None:
+    index = _index()
+    index.add({"id": 2, "full_name": "Ana Torres", "email": "ana@tec.mx"})
+    assert index.best("Ana Torres")["id"] == 2
+    assert all(r["id"] != 2 for r in index.search("Pérez López"))
+    index.remove("2")
+    assert index.best("Ana Torres") is None
+    assert len(index) == 2
+
+
+def test_resolve_requires_the_name_to_contain_the_query() -> None:
+    index = _index()
+    index.add({"id": 4, "full_name": "Juana Pérez", "email": "juana@tec.mx"})
+    index.add({"id": 5, "full_name": "Ana Holguín", "email": "holguin@tec.mx"})
+    # Parecidos por trigramas, pero no son la misma persona
+    assert index.best("Pedro Pérez") is not None
+    assert index.resolve("Pedro Pérez") is None
+    assert index.resolve("Juan Perez") is None
+    assert index.resolve("Hola Ana") is None
+    assert index.resolve("ana perez")["id"] == 2
+    assert index.resolve("juana perez", unique=True)["id"] == 4
+    assert not name_contains("Juana Pérez", "Ana")
+
+
+def test_resolve_unique_refuses_ambiguous_names() -> None:
+    index = _index()
+    # "Ana" está contenido en dos nombres: para leer gana el de mayor score,
+    # para escribir no hay identidad
+    assert index.resolve("Ana")["id"] in (2, 3)
+    assert index.resolve("Ana", unique=True) is None
+    index.add({"id": 6, "full_name": "Ana", "email": "ana2@tec.mx"})
+    assert index.resolve("Ana", unique=True)["id"] == 6
@@ -0,0 +1,154 @@
+from helpers.practice import (
+    NO_PRACTICE,
+    ProgressCache,
+    ProjectTreeCache,
+    advance_after_completion,
+    current_position,
+    normalize_tree,
+    practice_context_for,
+    render_practice_context,
+)
+
+RAW_TREE = [
+    {
+        "id": "t2",
+        "title": "Sensores",
+        "created_at": "2025-02-01T00:00:00+00:00",
+        "task_steps": [
+            {"id": "s22", "step_number": 2, "title": "Leer", "is_completed": False},
+            {"id": "s21", "step_number": 1, "title": "Conectar", "is_completed": False,
+             "description": "Conecta el sensor al puerto A1."},
+        ],
+        "manual_images": [{"id": "i1", "step_number": 1, "image_url": "https://x/1.png"}],
+    },
+    {
+        "id": "t1",
+        "title": "Intro",
+        "created_at": "2025-01-01T00:00:00+00:00",
+        "task_steps": [{"id": "s11", "step_number": 1, "title": "Encender", "is_completed": True}],
+        "manual_images": [],
+    },
+]
+
+
+def test_normalize_tree_orders_and_groups_images() -> None:
+    tree = normalize_tree(RAW_TREE)
+    assert [t["id"] for t in tree] == ["t1", "t2"]
+    assert [s["step_number"] for s in tree[1]["steps"]] == [1, 2]
+    assert tree[1]["steps"][0]["images"][0]["id"] == "i1"
+    assert tree[1]["steps"][1]["images"] == []
+
+
+def test_render_points_at_first_pending_step() -> None:
+    tree = normalize_tree(RAW_TREE)
+    task, step = current_position(tree)
+    assert (task["id"], step["id"]) == ("t2", "s21")
+    text = render_practice_context(tree)
+    assert "Avance: 1/3 pasos (1 de 2 prácticas completas)" in text
+    assert "paso 1 de 2: Conectar [step_id=s21]" in text
+    assert "Pasos: 1▶ 2·" in text
+    assert "Imágenes del paso: 1" in text
+    assert "Intro (1/1) [task_id=t1]" in text
+    # Posición explícita (la mantiene el tracker de prácticas)
+    assert "paso 2 de 2: Leer" in render_practice_context(tree, "t2", 2)
+
+
+def test_cache_reloads_only_after_invalidation() -> None:
+    loads = []
+
+    def loader(project_id):
+        loads.append(project_id)
+        return RAW_TREE
+
+    cache = ProjectTreeCache(loader, ttl_s=60)
+    cache.get("p1")
+    cache.get("p1")
+    assert loads == ["p1"]
+    assert cache.find_task("t2")["steps"][0]["id"] == "s21"
+
+    cache.invalidate(step_id="s21")
+    assert cache.find_task("t2") is None
+    cache.get("p1")
+    assert loads == ["p1", "p1"]
+    assert cache.version("p1") == 1
+
+
+def test_context_only_for_practice_chats() -> None:
+    assert practice_context_for("default", "p1") == NO_PRACTICE
+    assert practice_context_for("practice", None) == NO_PRACTICE
+
+
+def test_advance_moves_to_next_pending_step_then_next_task() -> None:
+    tree = normalize_tree(RAW_TREE)
+    patched, updates = advance_after_completion(tree, ["s21"])
+    assert updates == {
+        "current_task_id": "t2",
+        "current_step_number": 2,
+        "practice_completed": False,
+    }
+    # El árbol original (en caché) no se modifica
+    assert tree[1]["steps"][0]["is_completed"] is False
+
+    _, updates = advance_after_completion(patched, ["s22"])
+    assert updates["practice_completed"] is True
+    assert updates["current_step_number"] is None
+
+
+def test_advance_matches_int_ids_and_refuses_unknown_steps() -> None:
+    raw = [
+        {"id": 7, "created_at": "1", "task_steps": [
+            {"id": 70, "step_number": 1, "is_completed": False},
+            {"id": 71, "step_number": 2, "is_completed": False},
+        ]},
+    ]
+    _, updates = advance_after_completion(normalize_tree(raw), ["70"])
+    assert updates == {"current_task_id": 7, "current_step_number": 2, "practice_completed": False}
+    # Paso que el árbol en caché aún no conoce: no se adivina la posición
+    assert advance_after_completion(normalize_tree(raw), ["99"]) is None
+
+
+def test_render_mentions_next_step() -> None:
+    text = render_practice_context(normalize_tree(RAW_TREE), "t2", 1)
+    assert "Siguiente: paso 2: Leer [step_id=s22]" in text
+
+
+def test_progress_cache_ttl_and_invalidation() -> None:
+    loads = []
+
+    def loader(project_id):
+        loads.append(project_id)
+        return [
+            {"task_id": "t1", "title": "Intro", "total_steps": 1, "completed_steps": 1},
+            {"task_id": "t2", "title": "Sensores", "total_steps": 2, "completed_steps": 0},
+        ]
+
+    cache = ProgressCache(loader, ttl_s=60)
+    summary, cached = cache.get("p1")
+    assert cached is False
+    assert (summary["completed_steps"], summary["total_steps"]) == (1, 3)
+    assert summary["percent"] == 33.3
+    assert summary["completed_tasks"] == 1
+    assert cache.get("p1")[1] is True
+
+    cache.invalidate(["p1"])
+    assert cache.get("p1")[1] is False
+    assert loads == ["p1", "p1"]
+
+
+def test_progress_cache_drops_loads_invalidated_midway() -> None:
+    for targets in (["p1"], None):  # por proyecto y global
+        completed = []
+
+        def loader(project_id):
+            rows = [{"task_id": "t1", "title": "Intro", "total_steps": 2,
+                     "completed_steps": len(completed)}]
+            if not completed:
+                # complete_task_step corre mientras esta lectura sigue en vuelo
+                completed.append("s1")
+                cache.invalidate(targets)
+            return rows
+
+        cache = ProgressCache(loader, ttl_s=60)
+        assert cache.get("p1")[0]["completed_steps"] == 0
+        summary, cached = cache.get("p1")
+        assert cached is False and summary["completed_steps"] == 1
@@ -0,0 +1,90 @@
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+
+class FakeProfileBackend:
+    """
+    PostgREST mínimo con la semántica de sql/student_profile_rpc.sql: cada RPC
+    lee y escribe la fila sin ceder el control (como el UPDATE con candado de
+    fila); la respuesta sí se demora para que las llamadas se intercalen.
+    """
+
+    def __init__(self):
+        self.students = {
+            "s1": {"id": "s1", "full_name": "Ana Pérez", "email": "ana@tec.mx", "goals": [],
+                   "learning_style": {"prefers_visual": True}},
+        }
+        self.reads = 0
+
+    def _find(self, params):
+        for row in self.students.values():
+            if params.get("p_student_id") == row["id"] or (
+                params.get("p_student_id") is None and params.get("p_email") == row["email"]
+            ):
+                return row
+        return None
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        if path == "/rest/v1/students" and request.method == "GET":
+            self.reads += 1
+            rows = [{k: r[k] for k in ("id", "full_name", "email")} for r in self.students.values()]
+            return httpx.Response(200, json=rows)
+        params = json.loads(request.content or b"{}")
+        row = self._find(params)
+        result = []
+        if path == "/rest/v1/rpc/append_student_goal" and row:
+            if params["p_goal"] not in row["goals"]:
+                row["goals"] = row["goals"] + [params["p_goal"]]
+            result = [{"full_name": row["full_name"], "goals": list(row["goals"])}]
+        elif path == "/rest/v1/rpc/merge_learning_style" and row:
+            row["learning_style"] = {**row["learning_style"], **params["p_patch"]}
+            result = [{"full_name": row["full_name"], "learning_style": dict(row["learning_style"])}]
+        await asyncio.sleep(0.005)
+        return httpx.Response(200, json=result)
+
+
+def test_concurrent_goal_appends_are_not_lost(make_dal) -> None:
+    backend = FakeProfileBackend()
+    dal = make_dal(backend)
+    goals = [f"meta {i}" for i in range(20)]
+    with ThreadPoolExecutor(max_workers=10) as pool:
+        list(pool.map(lambda g: dal.append_student_goal("ana@tec.mx", g), goals + goals))
+    assert sorted(backend.students["s1"]["goals"]) == sorted(goals)
+    # Por email no hace falta leer el perfil
+    assert backend.reads == 0
+
+
+def test_concurrent_style_merges_keep_every_key(make_dal) -> None:
+    backend = FakeProfileBackend()
+    dal = make_dal(backend)
+    patches = [{f"flag_{i}": True} for i in range(10)]
+    with ThreadPoolExecutor(max_workers=10) as pool:
+        list(pool.map(lambda p: dal.merge_learning_style("Ana Perez", p), patches))
+    style = backend.students["s1"]["learning_style"]
+    assert style["prefers_visual"] is True
+    assert all(style[f"flag_{i}"] for i in range(10))
+    # El nombre se resuelve con el índice local (una sola carga)
+    assert backend.reads == 1
+    assert dal.append_student_goal("nadie@tec.mx", "x") is None
+
+
+def test_writes_refuse_names_that_only_look_alike(make_dal) -> None:
+    backend = FakeProfileBackend()
+    for row_id, name, email in (("s2", "Juana Pérez", "juana@tec.mx"),
+                                ("s3", "Ana Pérez Ruiz", "ana.r@tec.mx")):
+        backend.students[row_id] = {"id": row_id, "full_name": name, "email": email,
+                                    "goals": [], "learning_style": {}}
+    dal = make_dal(backend)
+    assert dal.append_student_goal("Pedro Pérez", "meta ajena") is None
+    assert dal.merge_learning_style("Juan Perez", {"prefers_visual": False}) is None
+    assert backend.students["s2"]["goals"] == []
+    assert backend.students["s2"]["learning_style"] == {}
+    # "Pérez" está en tres nombres: ambiguo, no se escribe
+    assert dal.append_student_goal("Pérez", "meta") is None
+    # La coincidencia exacta gana aunque otro nombre la contenga
+    assert dal.append_student_goal("Ana Perez", "meta")["goals"] == ["meta"]
+    assert backend.students["s3"]["goals"] == []
@@ -0,0 +1,64 @@
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+from helpers.history_window import build_window
+
+from helpers.prompt_usage import PromptUsage
+from Settings.prompts import general_prompt, render_static_prefix
+
+
+def _state(now: str, profile: str) -> dict:
+    return {
+        "avatar_style": "Modo Robot Industrial",
+        "now_human": now,
+        "now_local": now,
+        "tz": "America/Monterrey",
+        "profile_summary": profile,
+        "messages": [HumanMessage(content="hola")],
+    }
+
+
+def test_static_prefix_does_not_change_with_dynamic_values() -> None:
+    first = general_prompt.invoke(_state("lunes 10:00", "Ana")).to_messages()
+    second = general_prompt.invoke(_state("martes 18:30", "Luis")).to_messages()
+    assert first[0].content == second[0].content
+    assert "Modo Robot Industrial" in first[0].content
+    assert "{" not in first[0].content and "lunes" not in first[0].content
+    assert "lunes 10:00" in first[-1].content and "Luis" in second[-1].content
+
+    hits = render_static_prefix.cache_info().hits
+    general_prompt.invoke(_state("miércoles", "Ana"))
+    assert render_static_prefix.cache_info().hits == hits + 1
+
+
+def test_prompt_usage_reports_cached_ratio() -> None:
+    usage = PromptUsage()
+    call = usage.record("general_agent_node", {"input_tokens": 2000, "input_token_details": {"cache_read": 1536}})
+    assert call == {"prompt_tokens": 2000, "cached_tokens": 1536, "cache_ratio": 0.768}
+    usage.record("general_agent_node", {"input_tokens": 2000})
+    summary = usage.summary()
+    assert summary["cache_ratio"] == 0.384
+    assert summary["agents"]["general_agent_node"]["calls"] == 2
+
+
+def test_dynamic_context_goes_after_the_history() -> None:
+    messages = general_prompt.invoke(_state("lunes 10:00", "Ana")).to_messages()
+    assert [type(m) for m in messages] == [SystemMessage, HumanMessage, SystemMessage]
+    assert messages[1].content == "hola"
+    assert messages[-1].content.startswith("=== CONTEXTO ===")
+
+
+def test_only_the_static_prefix_is_stable_across_turns() -> None:
+    history = [
+        HumanMessage(content="hola", id="h1"),
+        AIMessage(content="¿en qué te ayudo?", id="a1"),
+        HumanMessage(content="explícame PID", id="h2"),
+    ]
+    before, _ = build_window(history, None, None, budget=10_000)
+    # Al plegar h1/a1 la ventana empieza con un resumen: el historial enviado
+    # ya no comparte prefijo con el del turno anterior
+    after, _ = build_window(history, "El estudiante saludó.", "a1", budget=10_000)
+    first = general_prompt.invoke({**_state("lunes", "Ana"), "messages": before}).to_messages()
+    second = general_prompt.invoke({**_state("lunes", "Ana"), "messages": after}).to_messages()
+    assert first[0].content == second[0].content
+    assert first[1].content == "hola"
+    assert second[1].content.startswith("Resumen de la conversación anterior")
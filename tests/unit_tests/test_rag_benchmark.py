@@ -0,0 +1,36 @@
+import math
+
+from rag.benchmark import (
+    labelled_queries,
+    percentile,
+    reciprocal_rank,
+    recall_at_k,
+    synthetic_rows,
+)
+from rag.embeddings import HashingEmbeddings
+
+
+def test_hashing_embeddings_are_deterministic_and_normalized() -> None:
+    emb = HashingEmbeddings(dim=64)
+    a = emb.embed_query("Calibración del KUKA KR 6")
+    b = HashingEmbeddings(dim=64).embed_query("calibracion del kuka kr 6")
+    assert a == b
+    assert math.isclose(sum(v * v for v in a), 1.0, rel_tol=1e-9)
+
+
+def test_retrieval_metrics() -> None:
+    ranked = ["row-3", "row-1", "row-7"]
+    assert recall_at_k(ranked, "row-1", 2) == 1.0
+    assert recall_at_k(ranked, "row-7", 2) == 0.0
+    assert reciprocal_rank(ranked, "row-7") == 1 / 3
+    assert reciprocal_rank(ranked, "row-9") == 0.0
+    assert percentile([1, 2, 3, 4], 50) == 2.5
+    assert percentile([5.0], 95) == 5.0
+
+
+def test_synthetic_rows_and_queries_are_reproducible() -> None:
+    rows = synthetic_rows(50, seed=1)
+    assert rows == synthetic_rows(50, seed=1)
+    queries = labelled_queries(rows, n_csv=0, n_queries=10)
+    assert len(queries) == 10
+    assert all(label.startswith("row-") for _, label in queries)
@@ -0,0 +1,50 @@
+import asyncio
+import time
+
+import pytest
+
+from helpers.rate_limit import AsyncRateLimiter, is_retryable, retry_async
+
+
+class FakeRateLimitError(Exception):
+    status_code = 429
+
+
+def test_limiter_waits_when_requests_exhausted() -> None:
+    async def run() -> float:
+        limiter = AsyncRateLimiter(rpm=600, tpm=1_000_000)  # 10 req/s
+        limiter._requests = 0.0
+        t0 = time.monotonic()
+        await limiter.acquire()
+        return time.monotonic() - t0
+
+    waited = asyncio.run(run())
+    assert 0.05 <= waited < 1.0
+
+
+def test_retry_async_retries_then_succeeds() -> None:
+    calls = []
+
+    async def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise FakeRateLimitError("slow down")
+        return "ok"
+
+    result = asyncio.run(retry_async(flaky, attempts=5, base_delay=0.001))
+    assert result == "ok"
+    assert len(calls) == 3
+
+
+def test_retry_async_does_not_retry_non_retryable() -> None:
+    calls = []
+
+    async def broken():
+        calls.append(1)
+        raise ValueError("bad prompt")
+
+    with pytest.raises(ValueError):
+        asyncio.run(retry_async(broken, attempts=5, base_delay=0.001))
+    assert len(calls) == 1
+    assert is_retryable(FakeRateLimitError())
+    assert not is_retryable(ValueError())
@@ -0,0 +1,51 @@
+from rag import retrieval_cache as rc
+
+
+def _embed(text):
+    # Embedding de juguete: solo distingue si menciona "kuka"
+    return [1.0, 0.0] if "kuka" in text.lower() else [0.0, 1.0]
+
+
+def test_exact_match_skips_embedding() -> None:
+    cache = rc.remember([], "retrieve_robot_support", {"query": "KUKA se calienta"},
+                        [1.0, 0.0], "ref-1", ["d1"], index_version=3)
+
+    def no_embed(text):
+        raise AssertionError("no debería embeber")
+
+    entry, emb = rc.lookup(cache, "retrieve_robot_support",
+                           {"query": "  kuka se calienta! "}, no_embed)
+    assert entry is not None and entry["doc_ids"] == ["d1"] and emb is None
+
+
+def test_near_duplicate_and_args_must_match() -> None:
+    args = {"name_or_email": "ana@x.com", "query": "kuka overheating"}
+    cache = rc.remember([], "retrieve_context", args, _embed(args["query"]),
+                        "ref-1", [], index_version=1)
+
+    entry, _ = rc.lookup(cache, "retrieve_context",
+                         {**args, "query": "the kuka keeps overheating"}, _embed)
+    assert entry is not None
+
+    entry, _ = rc.lookup(cache, "retrieve_context",
+                         {"name_or_email": "bob@x.com", "query": args["query"]}, _embed)
+    assert entry is None
+
+
+def test_prune_drops_other_index_versions_and_caps_size(monkeypatch) -> None:
+    monkeypatch.setattr(rc, "MAX_ENTRIES", 2)
+    cache = []
+    for i in range(3):
+        cache = rc.remember(cache, "retrieve_robot_support", {"query": f"q{i}"},
+                            [1.0], f"ref-{i}", [], index_version=1)
+    assert [e["query"] for e in cache] == ["q1", "q2"]
+    assert rc.prune(cache, index_version=2) == []
+
+
+def test_profile_changes_drop_only_profile_dependent_entries() -> None:
+    cache = rc.remember([], "retrieve_context", {"name_or_email": "ana@x.com", "query": "pid"},
+                        [1.0], "ref-ctx", [], index_version=1)
+    cache = rc.remember(cache, "retrieve_robot_support", {"query": "kuka"},
+                        [1.0], "ref-rs", [], index_version=1)
+    assert "result" not in cache[0] and cache[0]["ref"] == "ref-ctx"
+    assert [e["ref"] for e in rc.drop_profile_entries(cache)] == ["ref-rs"]
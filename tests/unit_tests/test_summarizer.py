@@ -0,0 +1,113 @@
+import asyncio
+import types
+
+from helpers.rate_limit import AsyncRateLimiter
+from helpers.summarizer import (
+    CostBudget,
+    build_summary_prompt,
+    count_tokens,
+    split_conversation,
+    summarize_conversation,
+)
+from helpers.summary_schema import ChatSummary, parse_summary, to_storage
+
+
+class FakeLLM:
+    """Imita llm.with_structured_output(..., include_raw=True)."""
+
+    def __init__(self, invalid_first: int = 0):
+        self.prompts = []
+        self.invalid_first = invalid_first
+
+    def with_structured_output(self, schema, include_raw=False):
+        assert schema is ChatSummary and include_raw
+        return self
+
+    async def ainvoke(self, prompt):
+        self.prompts.append(prompt)
+        raw = types.SimpleNamespace(
+            usage_metadata={"input_tokens": 100, "output_tokens": 10}
+        )
+        if len(self.prompts) <= self.invalid_first:
+            return {"raw": raw, "parsed": None, "parsing_error": ValueError("bad json")}
+        parsed = ChatSummary(topics=[f"tema {len(self.prompts)}"], robots_mentioned=["UR5"])
+        return {"raw": raw, "parsed": parsed, "parsing_error": None}
+
+
+def test_split_conversation_respects_token_budget() -> None:
+    messages = [{"role": "user", "content": "palabra " * 50} for _ in range(10)]
+    messages.append({"role": "assistant", "content": "log " * 2000})
+    chunks = split_conversation(messages, max_tokens=200)
+    assert len(chunks) > 1
+    assert all(count_tokens(c) <= 200 + 10 for c in chunks)
+    assert "ASSISTANT: log" in "".join(chunks)
+
+
+def test_build_summary_prompt_folds_previous_summary() -> None:
+    messages = [{"role": "user", "content": "el motor no gira"}]
+    first = build_summary_prompt(messages)
+    assert "USER: el motor no gira" in first
+    assert "resumen actual" not in first
+
+    folded = build_summary_prompt(messages, {"topics": ["sensores"], "v": 1})
+    assert "Temas: sensores" in folded
+    assert "USER: el motor no gira" in folded
+
+    legacy = build_summary_prompt(messages, "Resumen viejo en texto libre")
+    assert "Resumen viejo en texto libre" in legacy
+
+
+def test_summarize_conversation_map_reduce_accounts_tokens() -> None:
+    llm = FakeLLM()
+    limiter = AsyncRateLimiter(rpm=10_000, tpm=10_000_000)
+    short = [{"role": "user", "content": "hola"}]
+    summary, usage = asyncio.run(summarize_conversation(llm, limiter, short))
+    assert summary.topics == ["tema 1"] and usage.calls == 1
+
+    llm = FakeLLM()
+    long = [{"role": "user", "content": "x " * 400} for _ in range(6)]
+    summary, usage = asyncio.run(
+        summarize_conversation(llm, limiter, long, previous_summary="previo", max_tokens=300)
+    )
+    map_calls = len(split_conversation(long, 300))
+    assert map_calls > 1
+    assert usage.calls == map_calls + 1
+    assert usage.input_tokens == 100 * usage.calls
+    assert "previo" in llm.prompts[-1]
+
+
+def test_invalid_structured_output_is_retried() -> None:
+    llm = FakeLLM(invalid_first=1)
+    limiter = AsyncRateLimiter(rpm=10_000, tpm=10_000_000)
+    messages = [{"role": "user", "content": "hola"}]
+    summary, usage = asyncio.run(summarize_conversation(llm, limiter, messages))
+    assert summary.robots_mentioned == ["ur5"]
+    assert usage.calls == 2  # el intento inválido también cuenta tokens
+
+
+def test_summary_schema_storage_roundtrip() -> None:
+    summary = ChatSummary(
+        topics=["  Sensores ", "sensores", ""],
+        questions="¿Por qué no gira?",
+        robots_mentioned=["UR5"],
+    )
+    stored = to_storage(summary)
+    assert stored == {
+        "topics": ["Sensores"],
+        "questions": ["¿Por qué no gira?"],
+        "robots_mentioned": ["ur5"],
+        "v": 1,
+    }
+    assert parse_summary(stored) == summary
+    assert parse_summary('{"topics": ["x"]}').topics == ["x"]
+    assert parse_summary("texto libre") is None
+
+
+def test_cost_budget_reserves_and_exhausts() -> None:
+    budget = CostBudget(max_cost_usd=1.0)
+    assert budget.try_reserve(0.6)
+    assert not budget.try_reserve(0.6)
+    assert budget.exhausted
+    budget.settle(0.6, 0.2)
+    assert budget.spent == 0.2 and budget.reserved == 0.0
+    assert CostBudget(0).try_reserve(1e9)
@@ -0,0 +1,92 @@
+from helpers.summary_job import (
+    JobCheckpoint,
+    _keyset_filter,
+    iter_sessions,
+    new_messages_since,
+)
+
+
+def test_iter_sessions_groups_across_page_boundaries() -> None:
+    pages = [
+        [{"session_id": "a", "id": 1}, {"session_id": "a", "id": 2}],
+        [{"session_id": "a", "id": 3}, {"session_id": "b", "id": 4}],
+        [{"session_id": None, "id": 5}, {"session_id": "c", "id": 6}],
+    ]
+    seen_pages = []
+    sessions = list(iter_sessions(iter(pages), on_page=seen_pages.append))
+    assert [(sid, [m["id"] for m in msgs]) for sid, msgs in sessions] == [
+        ("a", [1, 2, 3]),
+        ("b", [4]),
+        ("c", [6]),
+    ]
+    assert len(seen_pages) == 3
+
+
+def test_keyset_filter_quotes_values() -> None:
+    f = _keyset_filter(("s-1", "2025-01-01T10:00:00+00:00", 42))
+    assert f.startswith('session_id.gt."s-1",')
+    assert 'and(session_id.eq."s-1",created_at.gt."2025-01-01T10:00:00+00:00")' in f
+    assert 'id.gt."42"' in f
+
+
+def test_new_messages_since_uses_high_water_mark() -> None:
+    messages = [
+        {"id": 1, "created_at": "2025-01-01T10:00:00+00:00"},
+        {"id": 2, "created_at": "2025-01-01T10:05:00.5+00:00"},
+        {"id": 3, "created_at": "2025-01-01T11:00:00Z"},
+    ]
+    assert new_messages_since(messages, None) == messages
+    existing = {"summarized_until": "2025-01-01T10:05:00.500000+00:00"}
+    assert [m["id"] for m in new_messages_since(messages, existing)] == [3]
+    existing = {"summarized_until": "2025-01-01T12:00:00+00:00"}
+    assert new_messages_since(messages, existing) == []
+
+
+
+def test_checkpoint_cursor_advances_over_contiguous_done(tmp_path) -> None:
+    path = str(tmp_path / "state.json")
+    cp = JobCheckpoint(path)
+    for sid in ["a", "b", "c", "d"]:
+        cp.started(sid)
+    cp.done("b")
+    cp.done("d")
+    assert cp.cursor is None
+    cp.done("a")
+    assert cp.cursor == "b"
+    assert cp.completed == {"d"}
+
+    resumed = JobCheckpoint(path)
+    assert resumed.load()
+    assert resumed.run_id == cp.run_id
+    assert resumed.cursor == "b"
+    assert resumed.is_done("d") and not resumed.is_done("c")
+
+    cp.finish()
+    assert not JobCheckpoint(path).load()
+
+
+def test_failed_and_deferred_sessions_are_retried_on_resume(tmp_path) -> None:
+    path = str(tmp_path / "state.json")
+    cp = JobCheckpoint(path)
+    for sid in ["a", "b", "c"]:
+        cp.started(sid)
+    cp.done("a", ok=False)  # falló
+    cp.done("b")
+    cp.done("c", ok=False)  # diferida por costo
+    # El cursor avanza (no se relee todo), pero a y c quedan para reintento
+    assert cp.cursor == "c" and cp.retry == {"a", "c"}
+
+    resumed = JobCheckpoint(path)
+    assert resumed.load()
+    assert resumed.retry_sessions() == ["a", "c"]
+    assert resumed.is_done("a") and not resumed.is_done("d")
+    resumed.started("a")
+    resumed.done("a")
+    resumed.started("c")
+    resumed.done("c", ok=False)
+    resumed.started("d")
+    resumed.done("d")
+    # Los reintentos no mueven el cursor; c sigue pendiente
+    assert resumed.cursor == "d" and resumed.retry == {"c"}
+    again = JobCheckpoint(path)
+    assert again.load() and again.retry_sessions() == ["c"]
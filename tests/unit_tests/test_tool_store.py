@@ -0,0 +1,53 @@
+import json
+
+from langchain_core.messages import AIMessage, ToolMessage
+
+import Settings.tools as tools
+from helpers.tool_store import REF_PREFIX, ToolOutputStore, evict_tool_outputs
+
+
+def _messages():
+    steps = [{"id": f"s{i}", "title": f"Paso {i}", "description": "texto " * 40} for i in range(5)]
+    return [
+        AIMessage(content="", id="a1", tool_calls=[{"name": "get_task_steps", "args": {}, "id": "c1"}]),
+        ToolMessage(content=json.dumps(steps), name="get_task_steps", tool_call_id="c1", id="t1"),
+        ToolMessage(content="OK", name="complete_task_step", tool_call_id="c2", id="t2"),
+        ToolMessage(
+            content="WEB_CONTEXT::\nRESPUESTA_SINTESIS: Calibración KR 6\nDETALLES:\n" + "- dato\n" * 300,
+            name="web_research", tool_call_id="c3", id="t3",
+        ),
+    ]
+
+
+def test_evicts_bulky_outputs_and_keeps_them_recallable(tmp_path) -> None:
+    store = ToolOutputStore(str(tmp_path / "tools.sqlite3"))
+    messages = _messages()
+    replaced = evict_tool_outputs(messages, "sess", store, min_tokens=100)
+
+    assert [m.id for m in replaced] == ["t1", "t3"]
+    steps_ref = replaced[0].content
+    assert steps_ref.startswith(REF_PREFIX + "tool=get_task_steps ref=c1 ids=s0,s1")
+    assert "5 elementos: Paso 0; Paso 1; Paso 2" in steps_ref
+    assert "Resumen: Calibración KR 6" in replaced[1].content
+    assert len(replaced[1].content) < 300
+    assert store.get("c3", "sess")["content"] == messages[3].content
+    # Otra sesión no puede leerlo
+    assert store.get("c3", "otra") is None
+    assert store.get("c3", None) is None
+
+    # Ya desalojados: no se vuelven a guardar
+    assert evict_tool_outputs(messages[:1] + replaced, "sess", store, min_tokens=100) == []
+
+
+def test_recall_is_scoped_to_the_session_and_evictable(tmp_path, monkeypatch) -> None:
+    store = ToolOutputStore(str(tmp_path / "tools.sqlite3"))
+    monkeypatch.setattr(tools, "tool_outputs", store)
+    evict_tool_outputs(_messages(), "sess", store, min_tokens=100)
+
+    own = tools.recall_tool_output.invoke({"ref": "c3"}, {"configurable": {"thread_id": "sess"}})
+    assert own.startswith("web_research (ref=c3):")
+    other = tools.recall_tool_output.invoke({"ref": "c3"}, {"configurable": {"thread_id": "otra"}})
+    assert other == "NOT_FOUND"
+
+    recalled = ToolMessage(content=own, name="recall_tool_output", tool_call_id="c9", id="t9")
+    assert [m.id for m in evict_tool_outputs([recalled], "sess", store, min_tokens=100)] == ["t9"]
@@ -0,0 +1,76 @@
+import time
+
+from helpers.web_cache import SQLiteWebStore, WebResearchCache, normalize_query
+
+
+class MemoryStore:
+    def __init__(self):
+        self.rows = {}
+
+    def get(self, key):
+        return self.rows.get(key)
+
+    def set(self, key, query, payload, ttl_s):
+        self.rows[key] = (payload, time.time(), ttl_s)
+
+
+def test_near_identical_queries_share_an_entry() -> None:
+    assert normalize_query("¿Cómo calibrar un KUKA KR 6?") == normalize_query("como calibrar un kuka kr 6")
+    cache = WebResearchCache(MemoryStore(), enabled=True)
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        return "WEB_CONTEXT::\nDETALLES:\n- x"
+
+    cache.get_or_fetch("¿Cómo calibrar un KUKA KR 6?", "advanced", 5, None, fetch)
+    cache.get_or_fetch("como calibrar un kuka kr 6", "advanced", 5, None, fetch)
+    cache.get_or_fetch("como calibrar un kuka kr 6", "advanced", 5, "d", fetch)
+    assert len(calls) == 2
+    assert cache.stats()["hit_rate"] == round(1 / 3, 3)
+
+
+def test_errors_are_not_cached() -> None:
+    cache = WebResearchCache(MemoryStore(), enabled=True)
+    for _ in range(2):
+        cache.get_or_fetch("q", "basic", 3, None, lambda: "WEB_CONTEXT::ERROR::Timeout::x")
+    assert cache.stats()["misses"] == 2
+
+
+def test_stale_entry_is_served_and_revalidated(tmp_path) -> None:
+    store = SQLiteWebStore(str(tmp_path / "web.sqlite3"))
+    cache = WebResearchCache(store, stale_s=3600, enabled=True)
+    cache.get_or_fetch("kuka", "basic", 3, "d", lambda: "WEB_CONTEXT::v1")
+    # Caducada hace un minuto, dentro de la ventana stale
+    conn = store._connect()
+    key = conn.execute("SELECT key FROM web_cache").fetchone()[0]
+    conn.execute("UPDATE web_cache SET stored_at = stored_at - ttl_s - 60")
+    conn.commit()
+    conn.close()
+
+    assert cache.get_or_fetch("kuka", "basic", 3, "d", lambda: "WEB_CONTEXT::v2") == "WEB_CONTEXT::v1"
+    cache._pool.shutdown(wait=True)
+    assert store.get(key)[0] == "WEB_CONTEXT::v2"
+    assert cache.stats()["stale_hits"] == 1
+
+
+def test_word_order_is_part_of_the_key() -> None:
+    assert normalize_query("ABB vs KUKA") != normalize_query("KUKA vs ABB")
+    assert normalize_query("convertir celsius a fahrenheit") != normalize_query(
+        "convertir fahrenheit a celsius"
+    )
+    cache = WebResearchCache(MemoryStore(), enabled=True)
+    first = cache.get_or_fetch("ABB vs KUKA", "basic", 3, None, lambda: "WEB_CONTEXT::abb")
+    second = cache.get_or_fetch("KUKA vs ABB", "basic", 3, None, lambda: "WEB_CONTEXT::kuka")
+    assert (first, second) == ("WEB_CONTEXT::abb", "WEB_CONTEXT::kuka")
+
+
+def test_stale_window_is_bounded_by_ttl() -> None:
+    store = MemoryStore()
+    cache = WebResearchCache(store, stale_s=24 * 3600, enabled=True)
+    cache.get_or_fetch("kuka", "basic", 3, "d", lambda: "WEB_CONTEXT::v1")
+    # Resultado de "último día" (TTL 1h) guardado hace 3h: ya no se sirve stale
+    key, (payload, stored_at, ttl_s) = next(iter(store.rows.items()))
+    store.rows[key] = (payload, stored_at - 3 * 3600, ttl_s)
+    assert cache.get_or_fetch("kuka", "basic", 3, "d", lambda: "WEB_CONTEXT::v2") == "WEB_CONTEXT::v2"
+    assert cache.stats()["stale_hits"] == 0
@@ -0,0 +1,54 @@
+import asyncio
+
+import Settings.tools as tools
+from Settings.tools import _dedupe_results, _pack_results
+from helpers.web_cache import WebResearchCache
+
+
+class FakeTavily:
+    def __init__(self):
+        self.queries = []
+
+    def search(self, query, **kwargs):
+        self.queries.append(query)
+        shared = {"url": "https://www.kuka.com/kr6/?utm_source=x", "content": "Manual KR 6", "score": 0.9}
+        return {
+            "answer": f"respuesta {query}",
+            "results": [
+                shared,
+                {"url": f"https://blog.example/{len(self.queries)}", "content": "Calibración de ejes",
+                 "score": 0.5},
+            ],
+        }
+
+
+def test_dedupe_by_url_and_content() -> None:
+    results = [
+        {"url": "https://www.kuka.com/kr6/", "content": "A", "score": 0.4},
+        {"url": "https://kuka.com/kr6?utm_medium=y#top", "content": "B", "score": 0.8},
+        {"url": "https://mirror.example/a", "content": "  b ", "score": 0.1},
+        {"url": "https://other.example/", "content": "C", "score": 0.3},
+    ]
+    unique = _dedupe_results(results)
+    assert [r["content"] for r in unique] == ["B", "C"]
+
+
+def test_pack_respects_token_budget() -> None:
+    results = [{"url": f"https://x/{i}", "title": f"T{i}", "content": "palabra " * 40} for i in range(5)]
+    packed, used = _pack_results(results, token_budget=150)
+    assert 0 < used < 5
+    assert tools.count_tokens(packed) <= 150
+
+
+def test_multi_query_runs_each_query_once(monkeypatch) -> None:
+    fake = FakeTavily()
+    monkeypatch.setattr(tools, "_tavily", fake)
+    monkeypatch.setattr(tools, "web_cache", WebResearchCache(enabled=False))
+    out = asyncio.run(
+        tools.web_research_multi.ainvoke({"queries": ["calibrar KR 6", "calibrar KR 6", "KR 6 manual"]})
+    )
+    assert sorted(fake.queries) == ["KR 6 manual", "calibrar KR 6"]
+    assert out.count("Fuente: https://www.kuka.com") == 1
+    assert "DETALLES (2 de 2 fuentes únicas)" in out
+    # Ruta síncrona (cached_tools_node)
+    assert tools.web_research_multi.invoke({"queries": ["otra"]}).startswith("WEB_CONTEXT::\n")